@@ -55,6 +55,7 @@ from django.contrib.auth.models import User
 from django.contrib.auth.models import Group
 
 from .models import Profile
+from .roles import get_roles
 
 # Define an inline admin descriptor for User model
 # which acts a bit like a singleton
@@ -84,7 +85,7 @@ class UserAdmin(BaseUserAdmin):
 	# get only the manager accounts if user is administrator
 	def get_queryset(self, request):
 		qs = super(UserAdmin, self).get_queryset(request)
-		if request.user.groups.filter(name='Administrator').exists():
+		if get_roles(request).is_administrator:		# looked up once per request, or kept in the session (catalog/roles.py)
 			qs = qs.filter(profile__role='manager')
 		return qs
 	
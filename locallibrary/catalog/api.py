@@ -0,0 +1,216 @@
+"""Read-only JSON API over the catalog, for partner systems (under /catalog/api/, see urls.py).
+
+	books/						?q= (search) and the facets of the book list (?year=, ?publisher=, ...) filter it
+	books/<id>
+	books/<id>/copies			the copies of a book and whether they are available
+	books/<id>/reviews
+	authors/
+	authors/<id>
+
+Lists are ordered by id and paginated with an opaque cursor: every page has a "next" link (null on the last page) that
+continues after the last row of the page, so deep pages cost the same as the first and no row is skipped or repeated
+when rows are added meanwhile. ?limit= sets the page size (default 50, at most 200).
+
+?fields=id,title,... selects the fields returned; the query loads only the columns and relations those fields need.
+
+Responses have an ETag, and the single objects a Last-Modified, from the last_modified of the rows they show (as the
+pages, see catalog/conditional.py): the book with its authors for a book and its copies and reviews, the author with
+their books for an author, the newest row and the number of rows for a list. A client polling with If-None-Match (or
+If-Modified-Since) gets a 304 after one aggregate query, and every server process gives the same validators.
+"""
+import base64
+import binascii
+from collections import namedtuple
+from functools import wraps
+from operator import attrgetter
+
+from django.core.exceptions import ValidationError
+from django.db.models import Prefetch
+from django.http import Http404, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.views.decorators.http import condition, require_safe
+
+from . import covers, facets, search
+from .conditional import author_modified, authors_modified, book_modified, books_modified, make_validators
+from .models import Author, Book, BookInstance, Review
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+# columns: what the query has to load for the field; prefetch: a relation to prefetch for it; get: the value from a row
+Field = namedtuple('Field', 'columns prefetch get')
+
+
+def column(name):
+	return Field([name], None, attrgetter(name))
+
+
+BOOK_FIELDS = {
+	'id': column('id'),
+	'title': column('title'),
+	'authors': Field([], Prefetch('author', queryset=Author.objects.only('id', 'first_name', 'last_name')),
+					 lambda book: [{'id': author.pk, 'name': str(author)} for author in book.author.all()]),
+	'publisher': column('publisher'),
+	'year': column('year'),
+	'isbn': column('isbn'),
+	'call_number': column('call_number'),
+	'summary': column('summary'),
+	'cover': Field(['book_cover'], None, lambda book: covers.cover_url(book.book_cover.name, 320)),
+	'copies': Field(['num_copies'], None, attrgetter('num_copies')),
+	'copies_available': Field(['num_copies_available'], None, attrgetter('num_copies_available')),
+	'reviews': Field(['num_reviews'], None, attrgetter('num_reviews')),
+	'url': Field([], None, lambda book: reverse('api-book', args=[book.pk])),
+}
+
+AUTHOR_FIELDS = {
+	'id': column('id'),
+	'first_name': column('first_name'),
+	'last_name': column('last_name'),
+	'date_of_birth': column('date_of_birth'),
+	'date_of_death': column('date_of_death'),
+	'books': Field([], Prefetch('book_set', queryset=Book.objects.only('id')),
+				   lambda author: [book.pk for book in author.book_set.all()]),
+	'url': Field([], None, lambda author: reverse('api-author', args=[author.pk])),
+}
+
+COPY_FIELDS = {
+	'id': column('id'),
+	'status': Field(['status'], None, lambda copy: 'available' if copy.status == 'a' else 'on loan'),
+	'due_back': column('due_back'),
+}
+
+REVIEW_FIELDS = {
+	'id': column('id'),
+	'rating': column('rating'),
+	'review': column('review'),
+	'date_published': column('date_published'),
+	'user': Field(['user__username'], None, lambda review: review.user.username if review.user else None),
+}
+
+
+class BadRequest(Exception):
+	pass
+
+
+def api_view(modified):
+	"""Decorator for the API views: GET/HEAD only, with the validators of modified(request, *args, **kwargs), which
+	returns (time, version) as for conditional_page(), and errors as JSON."""
+	def validators(request, *args, **kwargs):
+		if not hasattr(request, '_catalog_validators'):		# condition() asks for the ETag and Last-Modified separately
+			last_modified, version = modified(request, *args, **kwargs)
+			request._catalog_validators = make_validators(last_modified, version, request.get_full_path())
+		return request._catalog_validators
+
+	def decorator(view):
+		@require_safe
+		@condition(etag_func=lambda request, *args, **kwargs: validators(request, *args, **kwargs)[0],
+				   last_modified_func=lambda request, *args, **kwargs: validators(request, *args, **kwargs)[1])
+		@wraps(view)
+		def wrapped(request, *args, **kwargs):
+			try:
+				return view(request, *args, **kwargs)
+			except BadRequest as error:
+				return JsonResponse({'error': str(error)}, status=400)
+			except Http404:
+				return JsonResponse({'error': 'Not found.'}, status=404)
+		return wrapped
+	return decorator
+
+
+def select(request, queryset, spec, required=('pk',)):
+	"""The fields asked for with ?fields= (all by default), and the queryset loading just what they need (and the
+	required columns)."""
+	names = [name for name in request.GET.get('fields', '').split(',') if name] or list(spec)
+	unknown = [name for name in names if name not in spec]
+	if unknown:
+		raise BadRequest('Unknown fields: %s. Available: %s.' % (', '.join(unknown), ', '.join(spec)))
+	columns = set(required)
+	for name in names:
+		field = spec[name]
+		columns.update(field.columns)
+		if field.prefetch is not None:
+			queryset = queryset.prefetch_related(field.prefetch)
+	related = {column.rsplit('__', 1)[0] for column in columns if '__' in column}
+	if related:
+		queryset = queryset.select_related(*related)
+	return names, queryset.only(*columns)
+
+
+def serialize(row, names, spec):
+	return {name: spec[name].get(row) for name in names}
+
+
+def encode_cursor(key):
+	return base64.urlsafe_b64encode(str(key).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+	try:
+		return base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+	except (binascii.Error, UnicodeDecodeError, ValueError):
+		raise BadRequest('Invalid cursor.')
+
+
+def paginate(request, queryset, spec, required=('pk',)):
+	"""One page of the queryset in id order, after the ?cursor= key, as {'results': [...], 'next': url or None}."""
+	try:
+		limit = min(int(request.GET.get('limit', DEFAULT_LIMIT)), MAX_LIMIT)
+	except ValueError:
+		raise BadRequest('Invalid limit.')
+	if limit < 1:
+		raise BadRequest('Invalid limit.')
+	names, queryset = select(request, queryset, spec, required)
+	if request.GET.get('cursor'):
+		try:
+			queryset = queryset.filter(pk__gt=queryset.model._meta.pk.to_python(decode_cursor(request.GET['cursor'])))
+		except ValidationError:
+			raise BadRequest('Invalid cursor.')
+	rows = list(queryset.order_by('pk')[:limit + 1])		# one row more tells whether there is a next page
+
+	next_url = None
+	if len(rows) > limit:
+		rows = rows[:limit]
+		query = request.GET.copy()
+		query['cursor'] = encode_cursor(rows[-1].pk)
+		next_url = request.build_absolute_uri('%s?%s' % (request.path, query.urlencode()))
+	return JsonResponse({'results': [serialize(row, names, spec) for row in rows], 'next': next_url})
+
+
+@api_view(books_modified)
+def book_list(request):
+	books = Book.objects.all()
+	if request.GET.get('q'):
+		books = search.filter_books(books, request.GET['q'])
+	books = facets.filter_books(books, facets.parse_selection(request.GET))
+	return paginate(request, books, BOOK_FIELDS)
+
+
+@api_view(book_modified)
+def book_detail(request, pk):
+	names, books = select(request, Book.objects.all(), BOOK_FIELDS)
+	return JsonResponse(serialize(get_object_or_404(books, pk=pk), names, BOOK_FIELDS))
+
+
+@api_view(book_modified)
+def book_copies(request, pk):
+	get_object_or_404(Book.objects.only('id'), pk=pk)
+	# BookInstance.from_db reads the book and status for the counters
+	return paginate(request, BookInstance.objects.filter(book_id=pk), COPY_FIELDS, ('pk', 'book', 'status'))
+
+
+@api_view(book_modified)
+def book_reviews(request, pk):
+	get_object_or_404(Book.objects.only('id'), pk=pk)
+	return paginate(request, Review.objects.filter(book_id=pk), REVIEW_FIELDS, ('pk', 'book'))		# read by Review.from_db
+
+
+@api_view(authors_modified)
+def author_list(request):
+	return paginate(request, Author.objects.all(), AUTHOR_FIELDS)
+
+
+@api_view(author_modified)
+def author_detail(request, pk):
+	names, authors = select(request, Author.objects.all(), AUTHOR_FIELDS)
+	return JsonResponse(serialize(get_object_or_404(authors, pk=pk), names, AUTHOR_FIELDS))
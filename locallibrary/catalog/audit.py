@@ -0,0 +1,151 @@
+"""Audit log (system logs) writer.
+
+Views record their actions with log_action(). With CATALOG_AUDIT_LOG_ASYNC on, the LogEntry rows are queued in memory
+and a background thread inserts them with bulk_create(), CATALOG_AUDIT_LOG_BATCH_SIZE at a time or at least every
+CATALOG_AUDIT_LOG_FLUSH_INTERVAL seconds, so the INSERT is off the request's critical path. Whatever is still queued
+is written when the process exits. With CATALOG_AUDIT_LOG_ASYNC off (the default; settings_production turns it on),
+entries are written right away.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+
+from django.conf import settings
+from django.contrib.admin.models import LogEntry
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+
+def make_entry(user_id, obj, action_flag, change_message=''):
+	"""Build (but do not save) the LogEntry for an action on obj."""
+	if isinstance(change_message, list):
+		change_message = json.dumps(change_message)
+	return LogEntry(
+		user_id=user_id,
+		content_type_id=ContentType.objects.get_for_model(obj).pk,		# cached by ContentTypeManager after the first lookup
+		object_id=str(obj.pk),
+		object_repr=str(obj)[:200],
+		action_flag=action_flag,
+		change_message=change_message,
+	)
+
+
+class AuditLogWriter:
+	"""Queues LogEntry objects and writes them in batches from a background thread."""
+
+	def __init__(self, batch_size=100, flush_interval=1.0, max_queue_size=10000):
+		self.batch_size = batch_size
+		self.flush_interval = flush_interval
+		self.queue = queue.Queue(maxsize=max_queue_size)
+		self.lock = threading.Lock()
+		self.thread = None
+		self.pid = None
+
+	def write(self, entries):
+		"""Insert the entries now, in the calling thread."""
+		if entries:
+			LogEntry.objects.bulk_create(entries, batch_size=self.batch_size)
+
+	def put(self, entry):
+		"""Queue an entry; if the queue is full the entry is written synchronously instead of being dropped."""
+		self.start()
+		try:
+			self.queue.put_nowait(entry)
+		except queue.Full:
+			self.write([entry])
+
+	def start(self):
+		"""Start the background thread (again, after a fork) if it is not running in this process."""
+		if self.thread is not None and self.thread.is_alive() and self.pid == os.getpid():
+			return
+		with self.lock:
+			if self.thread is not None and self.thread.is_alive() and self.pid == os.getpid():
+				return
+			self.pid = os.getpid()
+			self.thread = threading.Thread(target=self.run, name='audit-log-writer', daemon=True)
+			self.thread.start()
+
+	def take_batch(self, timeout):
+		"""Wait up to timeout seconds for a first entry, then take whatever else is queued, up to batch_size."""
+		try:
+			batch = [self.queue.get(timeout=timeout)]
+		except queue.Empty:
+			return []
+		while len(batch) < self.batch_size:
+			try:
+				batch.append(self.queue.get_nowait())
+			except queue.Empty:
+				break
+		return batch
+
+	def run(self):
+		try:
+			while True:
+				batch = self.take_batch(self.flush_interval)
+				stop = None in batch		# None is the shutdown marker put by stop()
+				try:
+					self.write([entry for entry in batch if entry is not None])
+				except Exception:
+					logger.exception('Could not write %d audit log entries', len(batch))
+				if stop:
+					return
+		finally:
+			connection.close()		# the thread has its own database connection
+
+	def stop(self, timeout=10):
+		"""Write everything that is queued and stop the background thread."""
+		if self.thread is None or not self.thread.is_alive() or self.pid != os.getpid():
+			return
+		self.queue.put(None)
+		self.thread.join(timeout)
+
+	def flush(self):
+		"""Write everything that is queued now, in the calling thread."""
+		pending = []
+		while True:
+			try:
+				entry = self.queue.get_nowait()
+			except queue.Empty:
+				break
+			if entry is None:
+				self.queue.put(None)		# keep the shutdown marker for the background thread
+				break
+			pending.append(entry)
+		self.write(pending)
+
+
+writer = AuditLogWriter(
+	batch_size=getattr(settings, 'CATALOG_AUDIT_LOG_BATCH_SIZE', 100),
+	flush_interval=getattr(settings, 'CATALOG_AUDIT_LOG_FLUSH_INTERVAL', 1.0),
+)
+atexit.register(writer.stop)
+
+
+def log_action(user_id, obj, action_flag, change_message=''):
+	"""Record in the system logs that user_id did action_flag (ADDITION, CHANGE or DELETION) on obj."""
+	_record(make_entry(user_id, obj, action_flag, change_message))
+
+
+def log_bulk_action(user_id, model, action_flag, object_repr, change_message=''):
+	"""Record a single entry for an action done on many objects of model at once (no object id; the ids go in the message)."""
+	entry = LogEntry(
+		user_id=user_id,
+		content_type_id=ContentType.objects.get_for_model(model).pk,
+		object_id='',
+		object_repr=object_repr[:200],
+		action_flag=action_flag,
+		change_message=change_message,
+	)
+	_record(entry)
+
+
+def _record(entry):
+	if getattr(settings, 'CATALOG_AUDIT_LOG_ASYNC', False):
+		writer.put(entry)
+	else:
+		writer.write([entry])
@@ -0,0 +1,223 @@
+"""In-process prefix index for the search box autocomplete (book titles, words of titles, author names and ISBNs).
+
+The index is a sorted list of (key, kind, id, label) tuples, where key is the normalized text a prefix is matched
+against; a lookup is a binary search for the prefix followed by a short scan, so it never touches the database. It is
+built with two queries on first use (or by warm()), and the receivers in models.py add, replace and remove the entries
+of a book or author when it is saved or deleted.
+
+Each process keeps its own copy, and rebuilds it on its next lookup when another process changed the catalog. With
+CATALOG_AUTOCOMPLETE_CACHE set to a cache shared by every server process (as in settings_production), a change replaces
+a version token kept there and the process that made it updates its own copy in place. Without one (a LocMemCache
+would not reach the other processes), the version is the newest last_modified and the number of the books and of the
+authors, two aggregate queries per lookup, and every change rebuilds the index.
+
+Settings:
+	CATALOG_AUTOCOMPLETE_CACHE			cache alias of the version token (default None: the version comes from the database)
+	CATALOG_AUTOCOMPLETE_MAX_ENTRIES	entries kept at most (default 200000, about 50 MB); books and authors beyond that
+										are not indexed, see stats()
+"""
+import bisect
+import sys
+import threading
+import unicodedata
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .conditional import newest_of_all
+from .models import Author, Book
+
+VERSION_CACHE_KEY = 'catalog:autocomplete:version'
+
+BOOK, AUTHOR = 'book', 'author'
+MIN_WORD_LENGTH = 3		# shorter words of a title ('of', 'the') are only matched as part of the whole title
+MAX_TITLE_WORDS = 8		# words of a title indexed on their own, after the first
+
+
+def normalize(text):
+	"""Lower case, without accents and with single spaces, so 'Émile  Zola' is found by 'emile z'."""
+	text = unicodedata.normalize('NFKD', text or '')
+	return ' '.join(''.join(char for char in text if not unicodedata.combining(char)).casefold().split())
+
+
+def book_entries(book_id, title, isbn):
+	label = title
+	keys = [normalize(title)]
+	words = keys[0].split(' ')
+	keys += [' '.join(words[i:]) for i in range(1, min(len(words), MAX_TITLE_WORDS + 1)) if len(words[i]) >= MIN_WORD_LENGTH]
+	if isbn:
+		keys.append(normalize(isbn))
+	return [(key, BOOK, book_id, label) for key in dict.fromkeys(keys) if key]
+
+
+def author_entries(author_id, first_name, last_name):
+	label = '%s, %s' % (last_name, first_name)
+	keys = [normalize('%s %s' % (first_name, last_name)), normalize('%s %s' % (last_name, first_name))]
+	return [(key, AUTHOR, author_id, label) for key in dict.fromkeys(keys) if key]
+
+
+class PrefixIndex:
+	"""Sorted (key, kind, id, label) entries, with the entries of each (kind, id) to remove or replace them."""
+
+	def __init__(self, max_entries):
+		self.max_entries = max_entries
+		self.entries = []
+		self.objects = {}
+		self.dropped = 0		# objects not indexed because the index was full
+
+	def add(self, kind, object_id, entries):
+		self.remove(kind, object_id)
+		if len(self.entries) + len(entries) > self.max_entries:
+			self.dropped += 1
+			return
+		for entry in entries:
+			bisect.insort(self.entries, entry)
+		self.objects[kind, object_id] = entries
+
+	def extend(self, entries_by_object):
+		"""Add many objects at once (sorting once), for building the index."""
+		for (kind, object_id), entries in entries_by_object:
+			if len(self.entries) + len(entries) > self.max_entries:
+				self.dropped += 1
+				continue
+			self.entries.extend(entries)
+			self.objects[kind, object_id] = entries
+		self.entries.sort()
+
+	def remove(self, kind, object_id):
+		for entry in self.objects.pop((kind, object_id), ()):
+			position = bisect.bisect_left(self.entries, entry)
+			if position < len(self.entries) and self.entries[position] == entry:
+				del self.entries[position]
+
+	def lookup(self, prefix, limit):
+		"""[(kind, id, label)] of the first limit objects with a key starting with prefix, in key order."""
+		results, seen = [], set()
+		position = bisect.bisect_left(self.entries, (prefix,))
+		while position < len(self.entries) and len(results) < limit:
+			key, kind, object_id, label = self.entries[position]
+			if not key.startswith(prefix):
+				break
+			if (kind, object_id) not in seen:
+				seen.add((kind, object_id))
+				results.append((kind, object_id, label))
+			position += 1
+		return results
+
+	def size(self):
+		"""Approximate memory used by the entries, in bytes (the strings are counted once per entry)."""
+		total = sys.getsizeof(self.entries) + sys.getsizeof(self.objects)
+		for entries in self.objects.values():
+			total += sys.getsizeof(entries)
+			for entry in entries:
+				total += sys.getsizeof(entry) + sys.getsizeof(entry[0]) + sys.getsizeof(entry[3])
+		return total
+
+
+_index = None
+_index_version = None
+_lock = threading.Lock()
+
+
+def _cache():
+	"""The cache of the version token (CATALOG_AUTOCOMPLETE_CACHE), None if the version comes from the database."""
+	alias = getattr(settings, 'CATALOG_AUTOCOMPLETE_CACHE', None)
+	return caches[alias] if alias else None
+
+
+def _version():
+	"""The version of the catalog the index of this process has to match."""
+	cache = _cache()
+	if cache is None:
+		return newest_of_all(Book), newest_of_all(Author)
+	version = cache.get(VERSION_CACHE_KEY)
+	if version is None:
+		cache.add(VERSION_CACHE_KEY, uuid.uuid4().hex, None)
+		version = cache.get(VERSION_CACHE_KEY)
+	return version
+
+
+def build_index():
+	"""Read every book and author. Returns a new PrefixIndex."""
+	index = PrefixIndex(getattr(settings, 'CATALOG_AUTOCOMPLETE_MAX_ENTRIES', 200000))
+	index.extend(((BOOK, book_id), book_entries(book_id, title, isbn))
+				 for book_id, title, isbn in Book.objects.order_by('id').values_list('id', 'title', 'isbn').iterator())
+	index.extend(((AUTHOR, author_id), author_entries(author_id, first_name, last_name))
+				 for author_id, first_name, last_name in Author.objects.order_by('id').values_list('id', 'first_name', 'last_name').iterator())
+	return index
+
+
+def get_index():
+	"""The index of this process, (re)built if it is missing or another process changed the catalog since."""
+	global _index, _index_version
+	version = _version()
+	if _index is None or _index_version != version:
+		with _lock:
+			if _index is None or _index_version != version:
+				_index = build_index()
+				_index_version = version
+	return _index
+
+
+def warm():
+	"""Build the index now rather than on the first lookup."""
+	return get_index()
+
+
+def lookup(text, limit=10):
+	"""Books and authors whose title, title words, name or ISBN start with text: [(kind, id, label)]."""
+	prefix = normalize(text)
+	if not prefix:
+		return []
+	return get_index().lookup(prefix, limit)
+
+
+def _changed(update):
+	"""Apply update(index) to the index of this process, and make the copies of other processes stale."""
+	global _index, _index_version
+	cache = _cache()
+	if cache is None:		# the version in the database moves with the change, the next lookup rebuilds the index
+		return
+	with _lock:
+		if _index is None or _index_version != _version():		# not built, or missing changes of another process
+			_index = None
+			invalidate()
+			return
+		update(_index)
+		_index_version = uuid.uuid4().hex
+		cache.set(VERSION_CACHE_KEY, _index_version, None)
+
+
+def book_saved(book):
+	_changed(lambda index: index.add(BOOK, book.pk, book_entries(book.pk, book.title, book.isbn)))
+
+
+def book_deleted(book_id):
+	_changed(lambda index: index.remove(BOOK, book_id))
+
+
+def author_saved(author):
+	_changed(lambda index: index.add(AUTHOR, author.pk, author_entries(author.pk, author.first_name, author.last_name)))
+
+
+def author_deleted(author_id):
+	_changed(lambda index: index.remove(AUTHOR, author_id))
+
+
+def invalidate():
+	"""Make every process rebuild its index on its next lookup, e.g. after bulk changes that send no signals (without
+	CATALOG_AUTOCOMPLETE_CACHE, only this one: the others see the changes that move last_modified or the row counts)."""
+	global _index
+	_index = None
+	cache = _cache()
+	if cache is not None:
+		cache.delete(VERSION_CACHE_KEY)
+
+
+def stats():
+	"""{'entries', 'books', 'authors', 'dropped', 'bytes'} of the index of this process (built if needed)."""
+	index = get_index()
+	kinds = [kind for kind, object_id in index.objects]
+	return {'entries': len(index.entries), 'books': kinds.count(BOOK), 'authors': kinds.count(AUTHOR),
+			'dropped': index.dropped, 'bytes': index.size()}
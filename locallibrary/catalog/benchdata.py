@@ -0,0 +1,133 @@
+"""Synthetic catalog data for the benchmarks (bench_site, bench_indexes), at any scale.
+
+generate(books) adds that many books with, in proportion, authors (1 per 5 books), members (1 per 10 books), copies (3 per
+book, 40% of them on loan, some overdue), reviews (2 per book) and system log entries (1 per book). The same number of
+books and seed give the same rows (dates are relative to the day they are generated). Rows are inserted with
+bulk_create() in chunks of CHUNK_SIZE books, so memory does not grow with the scale, and the counters, search index and
+caches are brought up to date at the end.
+
+separate_database() runs a benchmark on a database of its own, so it never writes to the configured one.
+"""
+import contextlib
+import datetime
+import random
+
+from django.contrib.admin.models import ADDITION, LogEntry
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from . import autocomplete, changes, search
+from .models import Author, Book, BookInstance, Profile, Review
+
+CHUNK_SIZE = 5000
+SCALE_SUFFIXES = {'k': 1000, 'm': 1000000}
+
+WORDS = ('river', 'night', 'garden', 'stone', 'city', 'winter', 'shadow', 'island', 'letters', 'empire', 'silence',
+		 'history', 'mountain', 'glass', 'dream', 'machine', 'ocean', 'road', 'fire', 'house', 'memory', 'war', 'light',
+		 'forest', 'science', 'music', 'kingdom', 'journey', 'mirror', 'storm')
+FIRST_NAMES = ('Ana', 'Jose', 'Maria', 'Juan', 'Elena', 'Carlos', 'Sofia', 'Miguel', 'Isabel', 'Pedro', 'Lucia', 'Diego')
+LAST_NAMES = ('Santos', 'Reyes', 'Cruz', 'Bautista', 'Garcia', 'Mendoza', 'Torres', 'Ramos', 'Aquino', 'Villanueva')
+PUBLISHERS = ['Publisher %d' % number for number in range(50)]
+
+
+def parse_scale(value):
+	"""Number of books from '1000', '1k', '100k' or '1M'."""
+	value = str(value).strip().lower()
+	multiplier = SCALE_SUFFIXES.get(value[-1:], 1)
+	if multiplier > 1:
+		value = value[:-1]
+	try:
+		books = int(float(value) * multiplier)
+	except ValueError:
+		raise ValueError('Invalid scale %r: a number of books such as 1000, 1k, 100k or 1M.' % value)
+	if books < 1:
+		raise ValueError('Invalid scale %r: at least one book.' % value)
+	return books
+
+
+@contextlib.contextmanager
+def separate_database(name, keep=False):
+	"""Switch the default connection to the database name (a file with SQLite), created and migrated as a test database,
+	for the block. It is destroyed at the end unless keep, in which case the next run with keep reuses it as it is."""
+	connection.settings_dict['TEST']['NAME'] = name
+	old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False, keepdb=keep)
+	try:
+		yield
+	finally:
+		connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=keep)
+
+
+def _new_ids(model, last_id):
+	"""The ids of the rows inserted after last_id (SQLite does not return them from bulk_create)."""
+	return list(model.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True))
+
+
+def _last_id(model):
+	return model.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+
+
+def generate(books, seed=0, progress=None):
+	"""Add books (with their authors, members, copies, reviews and log entries). Returns {model name: rows added}.
+
+	progress(books done, books) is called after every chunk.
+	"""
+	rng = random.Random(seed)
+	today = datetime.date.today()
+	now = timezone.now()
+	added = {'users': max(books // 10, 1), 'authors': max(books // 5, 1), 'books': books, 'copies': books * 3,
+			 'reviews': books * 2, 'log entries': books}
+
+	with transaction.atomic():
+		last_user = _last_id(User)
+		User.objects.bulk_create(User(username='bench-%d-%d' % (last_user, number)) for number in range(added['users']))
+		user_ids = _new_ids(User, last_user)
+		Profile.objects.bulk_create(Profile(user_id=user_id, ID_num='%010d' % user_id, role=rng.choice(['student', 'teacher']))
+									for user_id in user_ids)
+
+		last_author = _last_id(Author)
+		Author.objects.bulk_create(Author(first_name=rng.choice(FIRST_NAMES), last_name='%s %d' % (rng.choice(LAST_NAMES), number),
+										  date_of_birth=datetime.date(rng.randint(1850, 1990), rng.randint(1, 12), rng.randint(1, 28)))
+								   for number in range(added['authors']))
+		author_ids = _new_ids(Author, last_author)
+	book_type = ContentType.objects.get_for_model(Book)
+
+	for start in range(0, books, CHUNK_SIZE):
+		count = min(CHUNK_SIZE, books - start)
+		with transaction.atomic():
+			# three copies per book, 40% of them on loan (some overdue), decided first so the counters are set on insert
+			loans = [[(rng.choice(user_ids), today + datetime.timedelta(days=rng.randint(-30, 21))) if rng.random() < 0.4 else None
+					  for _ in range(3)] for _ in range(count)]
+			last_book = _last_id(Book)
+			Book.objects.bulk_create(
+				Book(title=' '.join(rng.sample(WORDS, rng.randint(1, 4))).capitalize(), publisher=rng.choice(PUBLISHERS),
+					 year=rng.randint(1900, today.year), isbn='978%010d' % (last_book + number), call_number=rng.randrange(1000),
+					 summary='Summary', num_copies=3, num_copies_available=book_loans.count(None), num_reviews=2)
+				for number, book_loans in enumerate(loans))
+			book_ids = _new_ids(Book, last_book)
+
+			Book.author.through.objects.bulk_create(
+				Book.author.through(book_id=book_id, author_id=author_id)
+				for book_id in book_ids for author_id in rng.sample(author_ids, min(len(author_ids), rng.choice((1, 1, 1, 2)))))		# a quarter have two authors
+			BookInstance.objects.bulk_create(
+				BookInstance(book_id=book_id, status='a') if loan is None else
+				BookInstance(book_id=book_id, status='r', borrower_id=loan[0], due_back=loan[1])
+				for book_id, book_loans in zip(book_ids, loans) for loan in book_loans)
+			Review.objects.bulk_create(
+				Review(book_id=book_id, user_id=rng.choice(user_ids), rating=rng.randint(0, 5), review='Review',
+					   date_published=today - datetime.timedelta(days=rng.randrange(365)))
+				for book_id in book_ids for _ in range(2))
+			LogEntry.objects.bulk_create(
+				LogEntry(user_id=rng.choice(user_ids), content_type_id=book_type.pk, object_id=str(book_id),
+						 object_repr='Book %d' % book_id, action_flag=ADDITION, change_message='[{"added": {}}]',
+						 action_time=now - datetime.timedelta(minutes=rng.randrange(365 * 24 * 60)))
+				for book_id in book_ids)
+		if progress:
+			progress(start + count, books)
+
+	search.rebuild_index()		# bulk_create sends no signals
+	changes.catalog_changed()
+	autocomplete.invalidate()
+	return added
@@ -0,0 +1,34 @@
+"""One hook for every change to the catalog tables (books, authors, copies and reviews).
+
+catalog_changed() drops what is cached from them (the homepage dashboard and the facet counts). The receivers in
+models.py call it on every save and delete; code that writes with update() or bulk_create(), which send no signals,
+calls it itself.
+
+touch_books()/touch_authors() move the last_modified of the books and authors whose pages show a change made to other
+rows (a copy, a review, the links between books and authors), for the ETags and Last-Modified of the pages and the JSON
+API (catalog/conditional.py). Unlike the caches, these are in the database and so seen by every server process.
+"""
+from django.utils import timezone
+
+from . import dashboard, facets
+
+
+def catalog_changed():
+	dashboard.invalidate()
+	facets.invalidate()
+
+
+def touch_books(book_ids):
+	from .models import Book
+
+	book_ids = {book_id for book_id in book_ids if book_id is not None}
+	if book_ids:
+		Book.objects.filter(pk__in=book_ids).update(last_modified=timezone.now())
+
+
+def touch_authors(author_ids):
+	from .models import Author
+
+	author_ids = {author_id for author_id in author_ids if author_id is not None}
+	if author_ids:
+		Author.objects.filter(pk__in=author_ids).update(last_modified=timezone.now())
@@ -0,0 +1,105 @@
+"""ETag and Last-Modified for the book and author pages, so browsers and reverse proxies revalidate them with 304s.
+
+A page is as new as the newest of the rows it shows: the book page of the book and its authors, the author page of the
+author and their books. Changes to copies and reviews move the last_modified of their book, changes to the links
+between books and authors that of both sides, and changes to an author that of their books (the receivers in
+models.py), so one aggregate query over the object and the other side answers it. The book list shows any book, its
+facet counts any copy: it uses the newest last_modified of all the books and their number, which also changes when a
+book is deleted. Everything comes from the database, so every server process gives the same validators.
+
+The same URL renders differently for each user (their name in the header, borrow and review forms) and role (manager
+controls), so the ETag includes who the page is for, responses Vary on the session cookie and the pages of logged in
+users are private. Requests with messages waiting to be shown get no validators, so the messages are not held back by a
+304.
+"""
+import hashlib
+from functools import wraps
+
+from django.contrib import messages
+from django.db.models import Count, Max
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.http import condition
+
+from .models import Author, Book
+from .roles import get_roles
+
+
+def _newest(queryset, related):
+	"""The newest last_modified of the only row of the queryset and of its related rows, None without a row."""
+	row = queryset.annotate(related=Max(related)).order_by().values_list('last_modified', 'related').first()
+	return max(value for value in row if value is not None) if row else None
+
+
+def newest_of_all(model):
+	"""(The newest last_modified of the rows of model, their number), for the validators of a list of them: a deleted
+	row moves no last_modified, but the number."""
+	state = model.objects.order_by().aggregate(newest=Max('last_modified'), count=Count('pk'))
+	return state['newest'], state['count']
+
+
+def book_modified(request, pk):
+	"""When the book page last changed: the book, or one of its authors. Returns (time, None)."""
+	return _newest(Book.objects.filter(pk=pk), 'author__last_modified'), None
+
+
+def author_modified(request, pk):
+	"""When the author page last changed: the author, or one of their books. Returns (time, None)."""
+	return _newest(Author.objects.filter(pk=pk), 'book__last_modified'), None
+
+
+def books_modified(request, *args, **kwargs):
+	"""When the book list last changed: the newest book, with the number of books as version. Returns (time, version)."""
+	return newest_of_all(Book)
+
+
+def authors_modified(request, *args, **kwargs):
+	"""When the author list (of the API) last changed: the newest author, with the number of authors as version."""
+	return newest_of_all(Author)
+
+
+def make_validators(last_modified, version, variant):
+	"""(ETag, Last-Modified) of a response last changed at last_modified (None: unknown), also as of version (not None for
+	lists, whose deletions the time does not show), for variant (the URL, and who it is for). With a version there is no
+	Last-Modified: a client revalidating with If-Modified-Since only would not see the deletions."""
+	if last_modified is None:
+		return None, None
+	etag = hashlib.md5(('%s %s %s' % (last_modified.isoformat(), version, variant)).encode()).hexdigest()
+	return etag, last_modified if version is None else None
+
+
+def audience(request):
+	"""Who the page is rendered for: anonymous, or the user with their roles."""
+	user = request.user
+	if not user.is_authenticated:
+		return 'anonymous'
+	return 'user %s %s %s' % (user.pk, user.is_staff, ','.join(get_roles(request)))
+
+
+def conditional_page(modified):
+	"""Decorator for the views of pages last changed as modified(request, *args, **kwargs) says: (time, version), the time
+	None if unknown or not found (see make_validators())."""
+	def validators(request, *args, **kwargs):
+		if not hasattr(request, '_catalog_validators'):		# condition() asks for the ETag and Last-Modified separately
+			request._catalog_validators = None, None
+			if not len(messages.get_messages(request)):
+				last_modified, version = modified(request, *args, **kwargs)
+				variant = '%s %s' % (audience(request), request.get_full_path())
+				request._catalog_validators = make_validators(last_modified, version, variant)
+		return request._catalog_validators
+
+	def decorator(view):
+		conditional_view = condition(
+			etag_func=lambda request, *args, **kwargs: validators(request, *args, **kwargs)[0],
+			last_modified_func=lambda request, *args, **kwargs: validators(request, *args, **kwargs)[1],
+		)(view)
+
+		@wraps(view)
+		def wrapped(request, *args, **kwargs):
+			response = conditional_view(request, *args, **kwargs)
+			patch_vary_headers(response, ['Cookie'])
+			patch_cache_control(response, no_cache=True)		# revalidate before every use
+			if request.user.is_authenticated:
+				patch_cache_control(response, private=True)
+			return response
+		return wrapped
+	return decorator
@@ -0,0 +1,90 @@
+"""Resized, compressed variants of the book covers.
+
+For every cover, WebP and JPEG copies are written at each width in COVER_WIDTHS under bookcovers/variants/ in the media
+storage, named after the cover and a hash of its full name, e.g. bookcovers/variants/Heap-4e76d2e7-320w.webp for
+bookcovers/Heap.jpg (so Heap.png, or a Heap.jpg in another folder, gets its own). Covers are never upscaled: a variant
+wider than the original holds the original size. The templates use them through the cover_url/cover_picture tags
+(catalog/templatetags/covers.py) and fall back to the original upload until the variants exist. The receiver in
+models.py generates them when a cover is uploaded; the generate_cover_variants command backfills existing covers and
+the default one.
+"""
+import hashlib
+import os
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image
+
+COVER_WIDTHS = (160, 320, 640)
+
+# (file extension, Pillow format, save options)
+COVER_FORMATS = (
+	('webp', 'WEBP', {'quality': 80, 'method': 4}),
+	('jpg', 'JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+)
+
+VARIANTS_DIR = 'bookcovers/variants'
+
+_generated = set()		# (storage, name) of the covers known to have all their variants on disk
+
+
+def variant_name(name, width, extension):
+	"""Storage name of one variant of the cover stored as name."""
+	stem = os.path.splitext(os.path.basename(name))[0]
+	digest = hashlib.md5(name.encode()).hexdigest()[:8]
+	return '%s/%s-%s-%dw.%s' % (VARIANTS_DIR, stem, digest, width, extension)
+
+
+def has_variants(name, storage=default_storage):
+	"""True if every variant of the cover has been generated. Variants are written largest JPEG last, so that one is checked."""
+	if (storage, name) in _generated:
+		return True
+	if storage.exists(variant_name(name, COVER_WIDTHS[-1], COVER_FORMATS[-1][0])):
+		_generated.add((storage, name))
+		return True
+	return False
+
+
+def generate_variants(name, storage=default_storage, force=False):
+	"""Write the variants of the cover stored as name. Returns the number of files written."""
+	if not name or (not force and has_variants(name, storage)):
+		return 0
+
+	with storage.open(name, 'rb') as original:
+		image = Image.open(original)
+		image.load()
+	if image.mode not in ('RGB', 'L'):
+		image = image.convert('RGB')		# JPEG has no alpha channel or palette
+
+	written = 0
+	for width in COVER_WIDTHS:
+		resized = image
+		if image.width > width:
+			resized = image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+		for extension, image_format, options in COVER_FORMATS:
+			buffer = BytesIO()
+			resized.save(buffer, image_format, **options)
+			target = variant_name(name, width, extension)
+			if storage.exists(target):
+				storage.delete(target)
+			storage.save(target, ContentFile(buffer.getvalue()))
+			written += 1
+	_generated.add((storage, name))
+	return written
+
+
+def variant_urls(name, extension, storage=default_storage):
+	"""[(width, url)] of the variants of the cover in one format, or [] if they are not generated yet."""
+	if not name or not has_variants(name, storage):
+		return []
+	return [(width, storage.url(variant_name(name, width, extension))) for width in COVER_WIDTHS]
+
+
+def cover_url(name, width, storage=default_storage):
+	"""URL of the smallest JPEG variant at least width pixels wide, or of the original if there are no variants."""
+	urls = variant_urls(name, 'jpg', storage)
+	for variant_width, url in urls:
+		if variant_width >= width:
+			return url
+	return urls[-1][1] if urls else storage.url(name)
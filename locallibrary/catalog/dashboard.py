@@ -0,0 +1,69 @@
+"""Cached data for the homepage (index view).
+
+The counts and "latest" lists are computed once and kept in the default cache until a Book, BookInstance, Author or
+Review changes; changes.catalog_changed() calls invalidate() on every save/delete of those models.
+
+Settings:
+	CATALOG_DASHBOARD_CACHE_TIMEOUT		seconds to keep the dashboard in the cache (default 300, None keeps it until invalidated)
+	CATALOG_NUM_VISITS_BATCH			write the num_visits session counter only every N visits (default 1: every visit);
+										the visits in between are counted in the cache
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Author, Book, BookInstance, Review
+
+DASHBOARD_CACHE_KEY = 'catalog:dashboard'
+VISITS_CACHE_KEY = 'catalog:visits:%s'
+
+
+def build_dashboard():
+	"""Run the homepage queries. The lists are evaluated so the cached objects need no further queries to render."""
+	return {
+		'num_books': Book.objects.count(),
+		'num_instances': BookInstance.objects.count(),
+		'num_instances_available': BookInstance.objects.filter(status__exact='a').count(),		# Available books (status = 'a')
+		'num_authors': Author.objects.count(),
+		'books': list(Book.objects.prefetch_related('author').order_by('-id')[:3]),				# get only the 3 newest books
+		'reviews': list(Review.objects.select_related('book', 'user').order_by('-id')[:3]),		# get only the 3 latest book reviews
+		'authors': list(Author.objects.order_by('-id')[:5]),										# get only the 5 latest authors
+	}
+
+
+def get_dashboard():
+	"""Return the homepage data, from the cache if it is there."""
+	dashboard = cache.get(DASHBOARD_CACHE_KEY)
+	if dashboard is None:
+		dashboard = build_dashboard()
+		cache.set(DASHBOARD_CACHE_KEY, dashboard, getattr(settings, 'CATALOG_DASHBOARD_CACHE_TIMEOUT', 300))
+	return dashboard
+
+
+def invalidate():
+	"""Drop the cached homepage data, it is rebuilt on the next visit."""
+	cache.delete(DASHBOARD_CACHE_KEY)
+
+
+def count_visit(request):
+	"""Count a visit to the homepage and return the number of earlier visits in this session.
+
+	With CATALOG_NUM_VISITS_BATCH > 1, the session (and so the session table) is only written every N visits.
+	"""
+	num_visits = request.session.get('num_visits', 0)				# initial count will be 0
+	batch = getattr(settings, 'CATALOG_NUM_VISITS_BATCH', 1)
+	session_key = request.session.session_key
+	if batch <= 1 or session_key is None:
+		request.session['num_visits'] = num_visits + 1
+		return num_visits
+
+	key = VISITS_CACHE_KEY % session_key
+	cache.add(key, 0, settings.SESSION_COOKIE_AGE)
+	try:
+		pending = cache.incr(key)
+	except ValueError:		# evicted between add() and incr()
+		cache.set(key, 1, settings.SESSION_COOKIE_AGE)
+		pending = 1
+	if pending >= batch:
+		request.session['num_visits'] = num_visits + pending
+		cache.delete(key)
+	return num_visits + pending - 1
@@ -0,0 +1,200 @@
+"""Faceted browsing of the book list: filters on publication year, publisher, Dewey class, author and availability.
+
+The selection comes from the query string (?year=1950-1999&dewey=800&available=1 ...); unknown or malformed values are
+ignored. Each facet lists its values with the number of matching books, counted with the filters of the other facets
+(so another value of the same facet can be picked) and the search text applied. The year, Dewey class and availability
+counts come from one aggregate query, the publisher and author counts from one grouped query each.
+
+Counts are kept in the default cache per selection and search text. They all go stale at once when the catalog changes:
+invalidate() replaces the version token that is part of every key (called by changes.catalog_changed()).
+
+Settings:
+	CATALOG_FACETS_CACHE_TIMEOUT	seconds to keep the counts of a selection in the cache (default 300)
+"""
+import hashlib
+import json
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, Count, IntegerField, Q, When
+
+from . import search
+from .models import Book
+
+VERSION_CACHE_KEY = 'catalog:facets:version'
+COUNTS_CACHE_KEY = 'catalog:facets:%s:%s'		# version, hash of the selection and search text
+
+FACET_SIZE = 10		# publishers and authors shown, those with the most books first
+
+# (value, label, first year, last year)
+YEAR_RANGES = [
+	('-1899', 'Before 1900', None, 1899),
+	('1900-1949', '1900 - 1949', 1900, 1949),
+	('1950-1999', '1950 - 1999', 1950, 1999),
+	('2000-2009', '2000 - 2009', 2000, 2009),
+	('2010-2019', '2010 - 2019', 2010, 2019),
+	('2020-', '2020 and later', 2020, None),
+]
+
+# Dewey Decimal classes, by the hundreds of the call number
+DEWEY_CLASSES = [
+	(0, '000 General works'),
+	(100, '100 Philosophy and psychology'),
+	(200, '200 Religion'),
+	(300, '300 Social sciences'),
+	(400, '400 Language'),
+	(500, '500 Science'),
+	(600, '600 Technology'),
+	(700, '700 Arts and recreation'),
+	(800, '800 Literature'),
+	(900, '900 History and geography'),
+]
+
+FACET_TITLES = [('year', 'Publication year'), ('dewey', 'Subject'), ('available', 'Availability'),
+				('publisher', 'Publisher'), ('author', 'Author')]
+BUCKET_FACETS = ('year', 'dewey', 'available')		# fixed values, counted together in one aggregate
+
+
+def _year_q(value):
+	for key, label, first, last in YEAR_RANGES:
+		if key == value:
+			q = Q()
+			if first is not None:
+				q &= Q(year__gte=first)
+			if last is not None:
+				q &= Q(year__lte=last)
+			return q
+
+
+def _facet_q(name, value):
+	"""The filter for one facet value."""
+	if name == 'year':
+		return _year_q(value)
+	if name == 'dewey':
+		return Q(call_number__gte=value, call_number__lte=value + 99)		# a range, so the column can use an index
+	if name == 'available':
+		return Q(num_copies_available__gt=0)
+	if name == 'publisher':
+		return Q(publisher=value)
+	if name == 'author':
+		return Q(pk__in=Book.author.through.objects.filter(author_id=value).values('book_id'))
+
+
+def parse_selection(params):
+	"""The valid facet values in params (a QueryDict or dict), as {facet: value}."""
+	selection = {}
+	if params.get('year') in [key for key, label, first, last in YEAR_RANGES]:
+		selection['year'] = params['year']
+	try:
+		dewey = int(params.get('dewey', ''))
+		if dewey in dict(DEWEY_CLASSES):
+			selection['dewey'] = dewey
+	except ValueError:
+		pass
+	if params.get('available') == '1':
+		selection['available'] = True
+	if params.get('publisher'):
+		selection['publisher'] = params['publisher']
+	if str(params.get('author', '')).isdigit():
+		selection['author'] = int(params['author'])
+	return selection
+
+
+def filter_books(queryset, selection, exclude=()):
+	"""Filter a Book queryset by the selected values of every facet but those in exclude."""
+	for name, value in selection.items():
+		if name not in exclude:
+			queryset = queryset.filter(_facet_q(name, value))
+	return queryset
+
+
+def _is_selected(field, value):
+	return Case(When(**{field: value}, then=1), default=0, output_field=IntegerField())
+
+
+def count_facets(selection, text=None):
+	"""Run the count queries. Returns {facet: [(value, label, count)]}, with the values without books left out."""
+	books = Book.objects.order_by()
+	if text:
+		books = search.filter_books(books, text)
+
+	# year, Dewey class and availability: one COUNT(...) FILTER (WHERE ...) per value, the selected values of the
+	# other two applied in the filter and those of publisher and author in the WHERE clause
+	buckets = {
+		'year': [(key, label, _year_q(key)) for key, label, first, last in YEAR_RANGES],
+		'dewey': [(hundreds, label, _facet_q('dewey', hundreds)) for hundreds, label in DEWEY_CLASSES],
+		'available': [(True, 'Available now', _facet_q('available', True))],
+	}
+	aggregates = {}
+	for name, values in buckets.items():
+		others = Q(*[_facet_q(other, selection[other]) for other in BUCKET_FACETS if other != name and other in selection])
+		for i, (value, label, q) in enumerate(values):
+			aggregates['%s_%d' % (name, i)] = Count('pk', filter=q & others)
+	totals = filter_books(books, selection, exclude=BUCKET_FACETS).aggregate(**aggregates)
+	counts = {name: [(value, label, totals['%s_%d' % (name, i)]) for i, (value, label, q) in enumerate(values)]
+			  for name, values in buckets.items()}
+
+	# the selected publisher and author come first, so they can be dropped even when they are not in the top FACET_SIZE
+	publishers = (filter_books(books, selection, exclude=['publisher']).values('publisher')
+				  .annotate(count=Count('pk'), selected=_is_selected('publisher', selection.get('publisher')))
+				  .order_by('-selected', '-count', 'publisher')[:FACET_SIZE])
+	counts['publisher'] = [(row['publisher'], row['publisher'], row['count']) for row in publishers]
+
+	authors = (Book.author.through.objects
+			   .filter(book_id__in=filter_books(books, selection, exclude=['author']).values('pk'))
+			   .values('author_id', 'author__first_name', 'author__last_name')
+			   .annotate(count=Count('book_id'), selected=_is_selected('author_id', selection.get('author')))
+			   .order_by('-selected', '-count', 'author__last_name', 'author__first_name')[:FACET_SIZE])
+	counts['author'] = [(row['author_id'], '%s, %s' % (row['author__last_name'], row['author__first_name']), row['count'])
+						for row in authors]
+
+	return {name: [value for value in values if value[2]] for name, values in counts.items()}
+
+
+def _version():
+	version = cache.get(VERSION_CACHE_KEY)
+	if version is None:
+		cache.add(VERSION_CACHE_KEY, uuid.uuid4().hex, None)
+		version = cache.get(VERSION_CACHE_KEY)
+	return version
+
+
+def get_counts(selection, text=None):
+	"""count_facets(), from the cache if these counts were made since the catalog last changed."""
+	digest = hashlib.md5(json.dumps([sorted(selection.items()), text or '']).encode()).hexdigest()
+	key = COUNTS_CACHE_KEY % (_version(), digest)
+	counts = cache.get(key)
+	if counts is None:
+		counts = count_facets(selection, text)
+		cache.set(key, counts, getattr(settings, 'CATALOG_FACETS_CACHE_TIMEOUT', 300))
+	return counts
+
+
+def invalidate():
+	"""Make every cached count stale."""
+	cache.delete(VERSION_CACHE_KEY)
+
+
+def build_facets(params, selection, text=None):
+	"""The facets for the template: [{'name', 'title', 'values': [{'label', 'count', 'selected', 'query'}]}].
+
+	query is the query string of the book list with that value picked (or dropped, if it is selected), keeping the
+	search text and the other facets and going back to the first page.
+	"""
+	counts = get_counts(selection, text)
+	facets = []
+	for name, title in FACET_TITLES:
+		values = []
+		for value, label, count in counts[name]:
+			query = params.copy()
+			query.pop('page', None)
+			selected = selection.get(name) == value
+			if selected:
+				query.pop(name, None)
+			else:
+				query[name] = '1' if value is True else value
+			values.append({'label': label, 'count': count, 'selected': selected, 'query': query.urlencode()})
+		if values:
+			facets.append({'name': name, 'title': title, 'values': values})
+	return facets
@@ -1,11 +1,14 @@
 from django import forms
 from django.contrib.auth.models import User
 from django.contrib.auth.forms import UserCreationForm
+from django.contrib.admin.models import ADDITION, CHANGE, DELETION
+from django.contrib.contenttypes.models import ContentType
 from .import models
 
 USER_ROLE = [('teacher','Teacher'),('student','Student')]
 STAR_RATING = [('0','0 Stars'),('1','1 Star'),('2','2 Stars'),('3','3 Stars'),('4','4 Stars'),('5','5 Stars')]
 COPY_STATUS = [('a','Available'),('r','Reserved')]
+ACTION_FLAG = [('','All actions'),(ADDITION,'Addition'),(CHANGE,'Change'),(DELETION,'Deletion')]
 
 class SignUpForm(UserCreationForm):
 	role = forms.ChoiceField(choices=USER_ROLE, widget=forms.RadioSelect,)
@@ -53,6 +56,31 @@ class BookInstanceForm(forms.ModelForm):
 		model = models.BookInstance 
 		fields = ('id', 'book', 'status', 'due_back', 'borrower')
 
+class AddCopiesForm(forms.Form):
+	# typed in rather than picked from a list of every book in the catalog
+	book = forms.CharField(max_length=17, widget=forms.TextInput(attrs={'class': "form-control", 'placeholder': 'Book id or ISBN'}))
+	count = forms.IntegerField(min_value=1, max_value=1000, initial=1, widget=forms.NumberInput(attrs={'class': "form-control"}))
+
+	def clean_book(self):
+		"""The Book with this id, or with this ISBN (10 digits or more, hyphens allowed; an ISBN-10 may end in the check
+		digit X)."""
+		value = self.cleaned_data['book'].strip().replace('-', '').upper()
+		isbn10_with_x = len(value) == 10 and value[:9].isdigit() and value[9] == 'X'
+		if not value.isdigit() and not isbn10_with_x:
+			raise forms.ValidationError('Enter a book id or an ISBN.')
+		if len(value) >= 10:
+			books = list(models.Book.objects.filter(isbn__in=[value, value.lower()])[:2])		# the X as saved, in either case
+			if len(books) > 1:
+				raise forms.ValidationError('Several books have the ISBN %s; enter the book id instead.' % value)
+		else:
+			books = list(models.Book.objects.filter(pk=value))
+		if not books:
+			raise forms.ValidationError('No book has the id or ISBN %s.' % value)
+		return books[0]
+
+class ReturnCopiesForm(forms.Form):
+	copies = forms.ModelMultipleChoiceField(queryset=models.BookInstance.objects.all())
+
 class CreateManagerForm(UserCreationForm):
 	first_name = forms.CharField(max_length=30,
 	widget=forms.TextInput(attrs={'autofocus': 'autofocus'}))	# This makes the cursor focus on first name input; it defaults to username
@@ -68,4 +96,9 @@ class CreateManagerForm(UserCreationForm):
 
 	
 
-
+class LogFilterForm(forms.Form):
+	action_flag = forms.TypedChoiceField(choices=ACTION_FLAG, coerce=int, empty_value=None, required=False)
+	user = forms.CharField(max_length=150, required=False, widget=forms.TextInput(attrs={'placeholder': 'Username', 'class': "form-control"}))
+	content_type = forms.ModelChoiceField(queryset=ContentType.objects.order_by('app_label', 'model'), empty_label='All content types', required=False, widget=forms.Select(attrs={'class': "form-control"}))
+	date_from = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date'}))
+	date_to = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date'}))
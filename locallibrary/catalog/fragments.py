@@ -0,0 +1,57 @@
+"""Cached template fragments: the book cards of the book list, the copies of a book, the reviews of the profile page.
+
+{% fragment name vary_on... %}...{% endfragment %} (templatetags/fragments.py) keeps the rendered block in the
+'template_fragments' cache (the default cache if there is none) under a key made from its name and the vary_on values,
+the way Django's {% cache %} does. The templates pass the last_modified of the rows the block shows (which the receivers
+in models.py move whenever the book, its copies, reviews or authors change) and the role flags the block depends on,
+so a change gives new keys, and users with the same role share the entries. Old entries are never read again and
+expire after CATALOG_FRAGMENT_CACHE_TIMEOUT seconds, or are culled first by the cache.
+
+{% csrf_token %} inside a fragment is cached as a placeholder and replaced with the token of the current user on every
+render. stats() gives the hits and misses of each fragment in this process.
+"""
+import hashlib
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+
+CACHE_ALIAS = 'template_fragments'
+KEY_PREFIX = 'catalog:fragment:%s:%s'
+CSRF_PLACEHOLDER = 'catalog-fragment-csrf-token'		# rendered by {% csrf_token %} in place of the real token
+
+_hits, _misses = Counter(), Counter()
+_lock = threading.Lock()
+
+
+def get_cache():
+	return caches[CACHE_ALIAS if CACHE_ALIAS in settings.CACHES else DEFAULT_CACHE_ALIAS]
+
+
+def make_key(name, vary_on):
+	return KEY_PREFIX % (name, hashlib.md5(':'.join(str(value) for value in vary_on).encode()).hexdigest())
+
+
+def get_or_render(name, vary_on, render):
+	"""The cached fragment for name and vary_on, or render() it and cache it."""
+	cache, key = get_cache(), make_key(name, vary_on)
+	content = cache.get(key)
+	with _lock:
+		(_hits if content is not None else _misses)[name] += 1
+	if content is None:
+		content = render()
+		cache.set(key, content, getattr(settings, 'CATALOG_FRAGMENT_CACHE_TIMEOUT', 86400))
+	return content
+
+
+def stats():
+	"""{fragment name: {'hits': n, 'misses': n}} since this process started (or the last reset_stats())."""
+	with _lock:
+		return {name: {'hits': _hits[name], 'misses': _misses[name]} for name in sorted(set(_hits) | set(_misses))}
+
+
+def reset_stats():
+	with _lock:
+		_hits.clear()
+		_misses.clear()
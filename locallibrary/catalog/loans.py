@@ -0,0 +1,70 @@
+"""Borrowing copies safely under concurrent requests, and adding or returning copies in bulk.
+
+A copy is claimed with one conditional UPDATE (status 'a' -> 'r' only if it is still 'a'), so when two members try to
+borrow the same copy at the same time exactly one of them gets it, without locking and without rewriting the other
+columns of the row. Bulk additions and returns are a single INSERT or UPDATE whatever the number of copies.
+"""
+import datetime
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import changes, counters
+from .models import Book, BookInstance
+
+LOAN_PERIOD = datetime.timedelta(weeks=3)		# set book borrow time to 3 weeks
+AVAILABLE, RESERVED = 'a', 'r'
+
+
+def borrow_copy(copy_id, user):
+	"""Lend the copy to user if it is still available. Returns True on success, False if someone else got it first."""
+	due_back = datetime.date.today() + LOAN_PERIOD
+	now = timezone.now()
+	with transaction.atomic():
+		claimed = BookInstance.objects.filter(pk=copy_id, status=AVAILABLE).update(
+			status=RESERVED, borrower=user, due_back=due_back, fine=0, last_modified=now)		# a new loan starts without the fine of the last one
+		if claimed:		# update() sends no signals: adjust the counter in the same transaction and drop the cached counts
+			Book.objects.filter(bookinstance=copy_id).update(num_copies_available=F('num_copies_available') - 1, last_modified=now)
+			changes.catalog_changed()
+	return bool(claimed)
+
+
+def borrow_any_copy(book_id, user, candidates=5, attempts=3):
+	"""Lend user any available copy of the book. Returns the id of the copy, or None if there is none left.
+
+	Reads a few available copies and claims the first one nobody else has claimed in the meantime.
+	"""
+	for _ in range(attempts):
+		copy_ids = list(BookInstance.objects.filter(book_id=book_id, status=AVAILABLE)
+						.order_by().values_list('pk', flat=True)[:candidates])
+		if not copy_ids:
+			return None
+		for copy_id in copy_ids:
+			if borrow_copy(copy_id, user):
+				return copy_id
+	return None
+
+
+def add_copies(book_id, count):
+	"""Add count available copies of the book with one INSERT. Returns the new copies."""
+	with transaction.atomic():
+		copies = BookInstance.objects.bulk_create(BookInstance(book_id=book_id, status=AVAILABLE) for _ in range(count))
+		counters.adjust(book_id, copies=count, available=count)		# bulk_create sends no signals
+		changes.touch_books([book_id])
+		changes.catalog_changed()
+	return copies
+
+
+def return_copies(copy_ids):
+	"""Make the reserved copies among copy_ids available again with one UPDATE. Returns the ids of the copies returned."""
+	with transaction.atomic():
+		reserved = BookInstance.objects.filter(pk__in=copy_ids, status=RESERVED)
+		returned = dict(reserved.values_list('pk', 'book_id'))
+		if returned:
+			BookInstance.objects.filter(pk__in=list(returned), status=RESERVED).update(
+				status=AVAILABLE, borrower=None, due_back=None, fine=0, last_modified=timezone.now())		# the fine ends with the loan
+			counters.repair(Book.objects.filter(pk__in=set(returned.values())))		# recount rather than trust the read above
+			changes.touch_books(returned.values())
+			changes.catalog_changed()
+	return list(returned)
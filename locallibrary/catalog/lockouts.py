@@ -0,0 +1,122 @@
+"""Login failure tracking for django-axes in the cache (AXES_HANDLER = 'catalog.lockouts.LockoutCacheHandler').
+
+axes' database handler reads and writes its AccessAttempt table on every login attempt, so a burst of failed logins
+keeps the database busy. This handler counts the failures in the AXES_CACHE cache instead, with the same few cache
+operations per attempt however long the burst, and enforces the same AXES_FAILURE_LIMIT and AXES_COOLOFF_TIME (the
+cool-off restarts with every failure, as with the database handler).
+
+Only lockouts are written to the database: an AccessAttempt is saved when a client reaches the limit, so lockouts show
+in the admin, deleting one there lifts it, and they are loaded back into the cache when it starts empty (e.g. after a
+restart). Successful logins and logouts are not logged (no AccessLog rows). With several server processes AXES_CACHE
+has to be shared between them (as in settings_production), or each process counts the failures it sees on its own.
+"""
+from logging import getLogger
+
+from django.db.models import Q
+from django.utils import timezone
+
+from axes.attempts import clean_expired_user_attempts
+from axes.conf import settings
+from axes.handlers.cache import AxesCacheHandler
+from axes.helpers import get_client_cache_key, get_client_username, get_cool_off, get_failure_limit, get_query_str
+from axes.models import AccessAttempt
+from axes.signals import user_locked_out
+
+log = getLogger(__name__)
+
+LOADED_CACHE_KEY = 'catalog:lockouts:loaded'		# set once the saved lockouts are in the cache
+
+
+class LockoutCacheHandler(AxesCacheHandler):
+
+	def load_lockouts(self):
+		"""Put the lockouts saved in the database that have not cooled off yet into the cache."""
+		cool_off = get_cool_off()
+		attempts = AccessAttempt.objects.all()
+		if cool_off is not None:
+			attempts = attempts.filter(attempt_time__gte=timezone.now() - cool_off)
+		for attempt in attempts:
+			timeout = None
+			if cool_off is not None:
+				timeout = max(int((attempt.attempt_time + cool_off - timezone.now()).total_seconds()), 1)
+			for cache_key in get_client_cache_key(attempt):
+				if self.cache.get(cache_key, 0) < attempt.failures_since_start:
+					self.cache.set(cache_key, attempt.failures_since_start, timeout)
+		self.cache.set(LOADED_CACHE_KEY, True, None)
+
+	def get_failures(self, request, credentials=None):
+		cache_keys = get_client_cache_key(request, credentials)
+		failures = self.cache.get_many(cache_keys + [LOADED_CACHE_KEY])
+		if LOADED_CACHE_KEY not in failures:
+			self.load_lockouts()
+			failures = self.cache.get_many(cache_keys)
+		return max(failures.get(cache_key, 0) for cache_key in cache_keys)
+
+	def user_login_failed(self, sender, credentials, request=None, **kwargs):
+		"""Count the failure in the cache, and lock the client out (saving the lockout) when it reaches the limit."""
+		if request is None:
+			log.error('AXES: LockoutCacheHandler.user_login_failed does not function without a request.')
+			return
+		username = get_client_username(request, credentials)
+		if settings.AXES_ONLY_USER_FAILURES and username is None:
+			return
+		if self.is_whitelisted(request, credentials):
+			return
+
+		self.get_failures(request, credentials)		# loads the saved lockouts into an empty cache
+		failures = 0
+		for cache_key in get_client_cache_key(request, credentials):
+			try:
+				count = self.cache.incr(cache_key)
+				self.cache.touch(cache_key, self.cache_timeout)		# the cool-off restarts with every failure
+			except ValueError:		# first failure (or the last one has cooled off)
+				count = 1
+				self.cache.set(cache_key, count, self.cache_timeout)
+			failures = max(failures, count)
+		request.axes_failures_since_start = failures
+
+		limit = get_failure_limit(request, credentials)
+		if settings.AXES_LOCK_OUT_AT_FAILURE and failures >= limit:
+			if failures == limit:		# later failures only extend the lockout already saved
+				self.save_lockout(request, username, failures)
+			log.warning('AXES: Locking out %s after %d login failures.', username, failures)
+			request.axes_locked_out = True
+			request.axes_credentials = credentials
+			user_locked_out.send('axes', request=request, username=username, ip_address=request.axes_ip_address)
+
+	def save_lockout(self, request, username, failures):
+		clean_expired_user_attempts(request.axes_attempt_time)
+		AccessAttempt.objects.update_or_create(
+			username=username, ip_address=request.axes_ip_address, user_agent=request.axes_user_agent,
+			defaults={
+				'get_data': get_query_str(request.GET).replace('\0', '0x00'),
+				'post_data': get_query_str(request.POST).replace('\0', '0x00'),
+				'http_accept': request.axes_http_accept,
+				'path_info': request.axes_path_info,
+				'failures_since_start': failures,
+				'attempt_time': request.axes_attempt_time,
+			})
+
+	def reset_attempts(self, *, ip_address=None, username=None, ip_or_username=False):
+		"""Forget the failures and lift the lockouts of these clients, or of every client if none is given."""
+		attempts = AccessAttempt.objects.all()
+		if ip_or_username:
+			attempts = attempts.filter(Q(ip_address=ip_address) | Q(username=username))
+		else:
+			if ip_address:
+				attempts = attempts.filter(ip_address=ip_address)
+			if username:
+				attempts = attempts.filter(username=username)
+		if ip_address is None and username is None:
+			self.cache.clear()		# AXES_CACHE holds nothing else
+		else:
+			self.cache.delete_many(get_client_cache_key(AccessAttempt(username=username, ip_address=ip_address)))
+		count, _ = attempts.delete()		# post_delete_access_attempt clears their counters
+		return count
+
+	def post_save_access_attempt(self, instance, **kwargs):
+		pass
+
+	def post_delete_access_attempt(self, instance, **kwargs):
+		"""A lockout deleted (e.g. in the admin) is lifted."""
+		self.cache.delete_many(get_client_cache_key(instance))
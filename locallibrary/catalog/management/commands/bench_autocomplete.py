@@ -0,0 +1,73 @@
+import os
+import random
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from catalog import autocomplete, benchdata
+from catalog.models import Book
+
+
+class Command(BaseCommand):
+	help = ('Build the autocomplete prefix index and report its size (entries, estimated and traced memory) and the '
+			'time of a build and of a lookup, on a generated catalog of --books books (see catalog/benchdata.py). The '
+			'data goes to a separate database (--database, kept with --keep so the next run skips the generation); the '
+			'configured database is not touched.')
+
+	def add_arguments(self, parser):
+		parser.add_argument('--books', default='10k', help='Scale: number of books, e.g. 1000, 10k, 100k, 1M (default: 10k)')
+		parser.add_argument('--database', help='Database (SQLite file) for the generated data (default: one per scale '
+											   'in the temporary directory)')
+		parser.add_argument('--keep', action='store_true', help='Keep the database for the next run')
+		parser.add_argument('--lookups', type=int, default=10000, help='Lookups to time (default: 10000)')
+
+	def handle(self, *args, **options):
+		try:
+			books = benchdata.parse_scale(options['books'])
+		except ValueError as error:
+			raise CommandError(error)
+		name = options['database'] or 'locallibrary_bench_autocomplete_%d' % books
+		if connection.vendor == 'sqlite' and not options['database']:
+			name = os.path.join(tempfile.gettempdir(), name + '.sqlite3')
+		with benchdata.separate_database(name, keep=options['keep']):
+			if not Book.objects.exists():
+				started = time.perf_counter()
+				benchdata.generate(books, progress=lambda done, total: self.stdout.write(
+					'generated %d/%d books (%.0fs)' % (done, total, time.perf_counter() - started)))
+			self.run(options['lookups'])
+
+	def run(self, lookups):
+		tracemalloc.start()
+		started = time.perf_counter()
+		index = autocomplete.build_index()
+		build_seconds = time.perf_counter() - started
+		traced = tracemalloc.get_traced_memory()[0]
+		tracemalloc.stop()
+
+		kinds = [kind for kind, object_id in index.objects]
+		self.stdout.write('%d entries for %d books and %d authors (%d not indexed, max %d)' % (
+			len(index.entries), kinds.count(autocomplete.BOOK), kinds.count(autocomplete.AUTHOR), index.dropped,
+			index.max_entries))
+		self.stdout.write('memory: %.1f MB estimated, %.1f MB traced during the build' % (index.size() / 2 ** 20, traced / 2 ** 20))
+		self.stdout.write('build: %.2f s' % build_seconds)
+		if not index.entries:
+			return
+
+		# prefixes of 1 to 6 characters of random keys, as typed into the search box
+		rng = random.Random(0)
+		prefixes = []
+		for _ in range(lookups):
+			key = rng.choice(index.entries)[0]
+			prefixes.append(key[:rng.randint(1, 6)])
+		runs = []
+		for prefix in prefixes:
+			started = time.perf_counter()
+			index.lookup(prefix, 10)
+			runs.append((time.perf_counter() - started) * 1e6)
+		runs.sort()
+		self.stdout.write('lookup: median %.1f us, 99th percentile %.1f us, max %.1f us' % (
+			statistics.median(runs), runs[int(len(runs) * 0.99)], runs[-1]))
@@ -0,0 +1,96 @@
+import os
+import random
+import tempfile
+import threading
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connection
+
+from catalog import benchdata, counters, loans
+from catalog.models import Book, BookInstance
+
+
+class Command(BaseCommand):
+	help = ('Benchmark borrowing under contention: threads race to borrow copies from a shared pool, once with the old '
+			'read-modify-save path and once with the conditional UPDATE of catalog/loans.py. The book, copies and users '
+			'go to a separate database (--database, a file in the temporary directory by default), destroyed at the '
+			'end; the configured database is not touched.')
+
+	def add_arguments(self, parser):
+		parser.add_argument('--threads', type=int, default=16)
+		parser.add_argument('--copies', type=int, default=200)
+		parser.add_argument('--attempts', type=int, default=25, help='Borrow attempts per thread (default: 25)')
+		parser.add_argument('--think-time', type=float, default=0.002,
+							help='Seconds of request work between reading a copy and saving it (default: 0.002)')
+		parser.add_argument('--database', help='Database (SQLite file) to run in (default: one in the temporary directory)')
+
+	def handle(self, *args, **options):
+		name = options['database'] or 'locallibrary_bench_borrow'
+		if connection.vendor == 'sqlite' and not options['database']:
+			name = os.path.join(tempfile.gettempdir(), name + '.sqlite3')		# a file, so the threads share it
+		with benchdata.separate_database(name):
+			self.run(options)
+
+	def run(self, options):
+		book = Book.objects.create(title='Borrow benchmark', publisher='Benchmark', isbn='0000000000000', summary='-')
+		copy_ids = [BookInstance.objects.create(book=book).pk for _ in range(options['copies'])]
+		users = [User.objects.create_user('bench-borrow-%d' % i) for i in range(options['threads'])]
+		self.stdout.write('%-8s %9s %9s %7s %9s %11s %9s' % (
+			'mode', 'borrowed', 'conflicts', 'errors', 'lost', 'counter ok', 'ops/s'))
+		for mode in ('save', 'update'):
+			BookInstance.objects.filter(pk__in=copy_ids).update(status='a', borrower=None, due_back=None)
+			counters.repair(Book.objects.filter(pk=book.pk))
+			self.run_mode(mode, book, copy_ids, users, options)
+
+	def run_mode(self, mode, book, copy_ids, users, options):
+		results = {'borrowed': 0, 'conflicts': 0, 'errors': 0}
+		lock = threading.Lock()
+		start_barrier = threading.Barrier(len(users))
+
+		def borrow_with_save(copy_id, user):
+			"""The old BorrowBookView: read the copy, change it in Python, save the whole row."""
+			copy = BookInstance.objects.get(pk=copy_id)
+			if copy.status != 'a':
+				return False
+			time.sleep(options['think_time'])
+			copy.borrower = user
+			copy.status = 'r'
+			copy.save()
+			return True
+
+		def borrow_with_update(copy_id, user):
+			time.sleep(options['think_time'])
+			return loans.borrow_copy(copy_id, user)
+
+		borrow = borrow_with_save if mode == 'save' else borrow_with_update
+
+		def worker(user, seed):
+			rng = random.Random(seed)
+			start_barrier.wait()
+			try:
+				for _ in range(options['attempts']):
+					try:
+						outcome = 'borrowed' if borrow(rng.choice(copy_ids), user) else 'conflicts'
+					except DatabaseError:		# e.g. "database is locked" on SQLite
+						outcome = 'errors'
+					with lock:
+						results[outcome] += 1
+			finally:
+				connection.close()
+
+		threads = [threading.Thread(target=worker, args=(user, i)) for i, user in enumerate(users)]
+		started = time.perf_counter()
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+		elapsed = time.perf_counter() - started
+
+		reserved = BookInstance.objects.filter(pk__in=copy_ids, status='r').count()
+		counter_ok = not counters.stale(Book.objects.filter(pk=book.pk)).exists()
+		self.stdout.write('%-8s %9d %9d %7d %9d %11s %9.0f' % (
+			mode, results['borrowed'], results['conflicts'], results['errors'],
+			results['borrowed'] - reserved,		# borrows that overwrote someone else's borrow of the same copy
+			'yes' if counter_ok else 'NO', sum(results.values()) / elapsed))
@@ -0,0 +1,114 @@
+import importlib
+import os
+import statistics
+import tempfile
+import time
+
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Max
+
+from catalog import benchdata
+from catalog.models import Author, Book, BookInstance, Review
+
+INDEX_MIGRATION = 'catalog.migrations.0018_list_view_indexes'
+
+
+class Command(BaseCommand):
+	help = ('Show the query plan and median time of the queries behind each list view, without and then with the '
+			'indexes of migration 0018, on a generated catalog of --books books (see catalog/benchdata.py). The data '
+			'goes to a separate database (--database, kept with --keep so the next run skips the generation); the '
+			'configured database is not touched.')
+
+	def add_arguments(self, parser):
+		parser.add_argument('--books', default='10k', help='Scale: number of books, e.g. 1000, 10k, 100k, 1M (default: 10k)')
+		parser.add_argument('--database', help='Database (SQLite file) for the generated data (default: one per scale '
+											   'in the temporary directory)')
+		parser.add_argument('--keep', action='store_true', help='Keep the database for the next run')
+		parser.add_argument('--repeat', type=int, default=5, help='Runs of each query; the median is reported (default: 5)')
+
+	def handle(self, *args, **options):
+		try:
+			books = benchdata.parse_scale(options['books'])
+		except ValueError as error:
+			raise CommandError(error)
+		name = options['database'] or 'locallibrary_bench_indexes_%d' % books
+		if connection.vendor == 'sqlite' and not options['database']:
+			name = os.path.join(tempfile.gettempdir(), name + '.sqlite3')
+		with benchdata.separate_database(name, keep=options['keep']):
+			self.run(books, options['repeat'])
+
+	def run(self, books, repeat):
+		indexes = [(apps.get_model('catalog', operation.model_name), operation.index)
+				   for operation in importlib.import_module(INDEX_MIGRATION).Migration.operations]
+		with connection.cursor() as cursor:
+			missing = [index.name for model, index in indexes
+					   if index.name not in connection.introspection.get_constraints(cursor, model._meta.db_table)]
+		if missing:
+			raise CommandError('Indexes %s are missing from %s: delete it and run again.' % (', '.join(missing), connection.settings_dict['NAME']))
+
+		if Book.objects.exists():
+			self.stdout.write('Using the %d books already in %s' % (Book.objects.count(), connection.settings_dict['NAME']))
+		else:
+			self.seed(books)
+		queries = self.list_view_queries()
+
+		self.stdout.write(self.style.MIGRATE_HEADING('Without the indexes of %s:' % INDEX_MIGRATION.rpartition('.')[2]))
+		with connection.schema_editor() as editor:
+			for model, index in indexes:
+				editor.remove_index(model, index)
+		try:
+			before = self.report(queries, repeat)
+		finally:
+			with connection.schema_editor() as editor:
+				for model, index in indexes:
+					editor.add_index(model, index)
+		self.stdout.write(self.style.MIGRATE_HEADING('With them:'))
+		after = self.report(queries, repeat)
+
+		self.stdout.write(self.style.MIGRATE_HEADING('Summary (ms):'))
+		for name in queries:
+			self.stdout.write('%-28s %10.2f %10.2f %8.1fx' % (name, before[name], after[name], before[name] / max(after[name], 0.001)))
+
+	def list_view_queries(self):
+		"""{view: function running its query}, for a page in the middle of each list and a typical book and member."""
+		book_id = Book.objects.order_by().aggregate(Max('id'))['id__max'] or 0
+		member_id = BookInstance.objects.filter(status='r').exclude(borrower=None).values_list('borrower', flat=True).first()
+		reviewer_id = Review.objects.exclude(user=None).values_list('user', flat=True).first()
+		middle = lambda queryset: queryset.count() // 2 // 10 * 10		# offset of the page halfway through a list of 10 per page
+		book_offset, copy_offset, author_offset = middle(Book.objects), middle(BookInstance.objects), middle(Author.objects)
+		return {
+			'book list (page)': lambda: Book.objects.all()[book_offset:book_offset + 10],
+			'book detail (copies)': lambda: BookInstance.objects.filter(book_id=book_id),
+			'book detail (reviews)': lambda: Review.objects.filter(book_id=book_id),
+			'book by isbn': lambda: Book.objects.filter(isbn='9780000000000'),
+			'author list (page)': lambda: Author.objects.all()[author_offset:author_offset + 10],
+			'copies (page)': lambda: BookInstance.objects.all()[copy_offset:copy_offset + 10],
+			'my borrowed books': lambda: BookInstance.objects.filter(borrower=member_id, status='r').order_by('due_back'),
+			'my reviews': lambda: Review.objects.filter(user=reviewer_id).order_by('date_published'),
+			'overdue loans (page)': lambda: BookInstance.objects.overdue().order_by('due_back', 'id')[:20],
+			'managers (admin)': lambda: User.objects.filter(profile__role='manager'),
+		}
+
+	def report(self, queries, repeat):
+		"""Print the plan and median time of every query. Returns {view: milliseconds}."""
+		timings = {}
+		for name, query in queries.items():
+			runs = []
+			for _ in range(repeat):
+				started = time.perf_counter()
+				list(query())
+				runs.append((time.perf_counter() - started) * 1000)
+			timings[name] = statistics.median(runs)
+			self.stdout.write('%-28s %10.2f ms' % (name, timings[name]))
+			for line in query().explain().splitlines():
+				self.stdout.write('    ' + line)
+		return timings
+
+	def seed(self, count):
+		"""Add count books, with their authors, copies, reviews, members and log entries (catalog/benchdata.py)."""
+		started = time.perf_counter()
+		benchdata.generate(count, progress=lambda done, total: self.stdout.write(
+			'generated %d/%d books (%.0fs)' % (done, total, time.perf_counter() - started)))
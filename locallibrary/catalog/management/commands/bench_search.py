@@ -0,0 +1,86 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Q
+
+from catalog import search
+from catalog.models import Author, Book
+
+WORDS = (
+	'garden history night river empire silent winter secret stone light ocean city war children glass '
+	'memory house music shadow letters island journey kingdom machine mountain paper portrait science '
+	'summer theory voices water wild world desire painting grammar botany colour photography policy'
+).split()
+
+SYLLABLES = 'ka lo mi ne ru sa te vo bi da fe gu ha ji ko la ma no pe ri'.split()
+
+FIRST_NAMES = 'Ana Ben Carla Diego Elena Felix Grace Hugo Iris Jose Kara Luis Maria Nina Oscar Paula'.split()
+LAST_NAMES = 'Santos Reyes Cruz Garcia Mendoza Torres Flores Ramos Rivera Aquino Bautista Castro'.split()
+
+
+class Command(BaseCommand):
+	help = ('Benchmark the book search: full-text index vs the old title__icontains scan. '
+			'Synthetic books are added inside a transaction that is rolled back, so the database is left untouched.')
+
+	def add_arguments(self, parser):
+		parser.add_argument('--books', type=int, default=20000, help='Number of synthetic books to add (default: 20000)')
+		parser.add_argument('--repeat', type=int, default=20, help='Runs per query (default: 20)')
+		parser.add_argument('--page-size', type=int, default=12, help='Page size, same as BookListView (default: 12)')
+		parser.add_argument('--seed', type=int, default=42)
+
+	def handle(self, *args, **options):
+		if not search.is_enabled():
+			raise CommandError('The full-text index needs an SQLite database.')
+
+		rng = random.Random(options['seed'])
+		# a real catalog has a long tail of words: a few common ones and thousands of rare ones (log-uniform draws below)
+		vocabulary = WORDS + sorted(set(''.join(rng.choice(SYLLABLES) for _ in range(3)) for _ in range(6000)))
+		queries = [WORDS[0], WORDS[1] + ' ' + WORDS[2], 'phot', vocabulary[200], vocabulary[3000][:4], 'zzzz']
+
+		with transaction.atomic():
+			self.seed(rng, vocabulary, options['books'])
+
+			self.stdout.write('%-22s %12s %12s %8s' % ('query', 'icontains ms', 'fts5 ms', 'matches'))
+			for text in queries:
+				scan = self.time_page(lambda: Book.objects.filter(Q(title__icontains=text)), options)
+				indexed = self.time_page(lambda: search.search_books(Book.objects.all(), text), options)
+				matches = search.search_books(Book.objects.all(), text).count()
+				self.stdout.write('%-22s %12.2f %12.2f %8d' % (text, scan, indexed, matches))
+
+			transaction.set_rollback(True)		# throw the synthetic catalog away
+
+	def seed(self, rng, vocabulary, count):
+		"""Add count books with one or two random authors each, then rebuild the index (bulk_create sends no signals)."""
+		start = time.perf_counter()
+		num_authors = max(count // 10, 1)
+		Author.objects.bulk_create(
+			Author(first_name=rng.choice(FIRST_NAMES), last_name=rng.choice(LAST_NAMES)) for _ in range(num_authors))
+		authors = list(Author.objects.order_by('-id')[:num_authors])		# SQLite does not return the ids from bulk_create
+
+		def sentence(words):
+			return ' '.join(vocabulary[int(len(vocabulary) ** rng.random()) - 1] for _ in range(words))
+
+		Book.objects.bulk_create(
+			(Book(title=sentence(rng.randint(2, 5)).title(), publisher=sentence(2).title(), isbn='9780000000000',
+				  summary=sentence(40), year=rng.randint(1900, 2020), call_number=rng.randint(0, 999)) for _ in range(count)))
+		books = Book.objects.order_by('-id').values_list('id', flat=True)[:count]
+
+		Book.author.through.objects.bulk_create(
+			(Book.author.through(book_id=book_id, author_id=author.id)
+			 for book_id in books for author in rng.sample(authors, min(len(authors), rng.randint(1, 2)))))
+		search.rebuild_index()
+		self.stdout.write('Seeded %d books in %.1fs\n' % (count, time.perf_counter() - start))
+
+	def time_page(self, make_queryset, options):
+		"""Median time in ms to count the results and load the first page, which is what the paginated list view does."""
+		timings = []
+		for _ in range(options['repeat']):
+			start = time.perf_counter()
+			queryset = make_queryset()
+			queryset.count()
+			list(queryset[:options['page_size']])
+			timings.append((time.perf_counter() - start) * 1000)
+		return statistics.median(timings)
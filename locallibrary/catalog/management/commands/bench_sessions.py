@@ -0,0 +1,71 @@
+import os
+import random
+import tempfile
+import time
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from catalog import benchdata
+
+PAGES = ['index', 'books', 'authors', 'my-borrowed']
+
+
+class Command(BaseCommand):
+	help = ('Load test of the session table: simulated members browse the site (a page every --think-time seconds of '
+			'simulated time) once with the database session engine and once with catalog.sessions, and the INSERT/'
+			'UPDATE/DELETE statements on django_session are counted. The users and their sessions go to a separate '
+			'database (--database, a file in the temporary directory by default), destroyed at the end; the configured '
+			'database is not touched.')
+
+	def add_arguments(self, parser):
+		parser.add_argument('--users', type=int, default=20)
+		parser.add_argument('--minutes', type=int, default=30, help='Simulated browsing time per user (default: 30)')
+		parser.add_argument('--think-time', type=float, default=10, help='Simulated seconds between pages (default: 10)')
+		parser.add_argument('--database', help='Database (SQLite file) to run in (default: one in the temporary directory)')
+
+	def handle(self, *args, **options):
+		name = options['database'] or 'locallibrary_bench_sessions'
+		if connection.vendor == 'sqlite' and not options['database']:
+			name = os.path.join(tempfile.gettempdir(), name + '.sqlite3')
+		with benchdata.separate_database(name):
+			# audit entries written in the request, not by a thread that would outlive the database
+			with override_settings(CATALOG_AUDIT_LOG_ASYNC=False):
+				self.run(options)
+
+	def run(self, options):
+		users = [User.objects.create_user('bench-sessions-%d' % i) for i in range(options['users'])]
+		self.stdout.write('%-36s %8s %14s %12s' % ('engine', 'pages', 'session writes', 'writes/page'))
+		for engine in ('django.contrib.sessions.backends.db', 'catalog.sessions'):
+			with override_settings(SESSION_ENGINE=engine):
+				pages, writes = self.browse(users, options)
+			self.stdout.write('%-36s %8d %14d %12.3f' % (engine, pages, writes, writes / pages))
+
+	def browse(self, users, options):
+		"""Interleave the page views of every user over the simulated time. Returns (pages, session table writes)."""
+		rng = random.Random(0)
+		clock = [time.time()]
+		pages, writes = 0, [0]
+
+		def count_writes(execute, sql, params, many, context):
+			if sql.startswith(('INSERT', 'UPDATE', 'DELETE')) and '"django_session"' in sql:
+				writes[0] += 1
+			return execute(sql, params, many, context)
+
+		with mock.patch('time.time', lambda: clock[0]):
+			clients = []
+			for user in users:
+				client = Client(HTTP_HOST='localhost')
+				client.force_login(user)
+				clients.append(client)
+			with connection.execute_wrapper(count_writes):		# not counting the logins
+				for _ in range(int(options['minutes'] * 60 / options['think_time'])):
+					clock[0] += options['think_time']
+					for client in clients:
+						client.get(reverse(rng.choice(PAGES)))
+						pages += 1
+		return pages, writes[0]
@@ -0,0 +1,244 @@
+import datetime
+import json
+import math
+import os
+import platform
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+import django
+from django.contrib.auth.models import Group, User
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, reverse
+
+from catalog import autocomplete, benchdata, urls
+from catalog.models import Author, Book, BookInstance, Profile, Review
+from catalog.roles import ADMINISTRATOR, MANAGER
+
+PERCENTILES = (50, 90, 95, 99)
+
+
+class Command(BaseCommand):
+	help = ('Benchmark every URL of catalog/urls.py on a generated catalog of --books books (1000, 1k, 100k, 1M; with '
+			'authors, copies, reviews, members and log entries in proportion, see catalog/benchdata.py). The data goes '
+			'to a separate database (--database, kept with --keep so the next run skips the generation). Each URL is '
+			'fetched with the test client as the user it is meant for; the latency percentiles, queries per request '
+			'and peak memory of a request are printed and written as JSON to --output. --compare prints the change '
+			'from an earlier results file. Only GET requests are made: the views that delete on GET get a new row '
+			'to delete for every request.')
+
+	def add_arguments(self, parser):
+		parser.add_argument('--books', default='1k', help='Scale: number of books, e.g. 1000, 1k, 100k, 1M (default: 1k)')
+		parser.add_argument('--seed', type=int, default=0, help='Seed of the data generator (default: 0)')
+		parser.add_argument('--requests', type=int, default=20, help='Timed requests per URL (default: 20)')
+		parser.add_argument('--warmup', type=int, default=2, help='Untimed requests per URL first (default: 2)')
+		parser.add_argument('--only', default='', help='Comma-separated URL names to benchmark (default: all)')
+		parser.add_argument('--database', help='Database (SQLite file) for the generated data (default: one per scale '
+											   'in the temporary directory)')
+		parser.add_argument('--keep', action='store_true', help='Keep the database for the next run')
+		parser.add_argument('--output', help='Results file (default: bench-site-<books>-<time>.json)')
+		parser.add_argument('--compare', help='Results file of an earlier run to compare with')
+
+	def handle(self, *args, **options):
+		try:
+			books = benchdata.parse_scale(options['books'])
+		except ValueError as error:
+			raise CommandError(error)
+		previous = None
+		if options['compare']:
+			with open(options['compare']) as results:
+				previous = json.load(results)
+
+		name = options['database'] or 'locallibrary_bench_%d' % books
+		if connection.vendor == 'sqlite' and not options['database']:
+			name = os.path.join(tempfile.gettempdir(), name + '.sqlite3')
+		with benchdata.separate_database(name, keep=options['keep']):
+			# audit entries written in the request, not by a thread that would outlive the database
+			with override_settings(CATALOG_AUDIT_LOG_ASYNC=False, ALLOWED_HOSTS=['*'], DEBUG=False):
+				results = self.run(books, options)
+
+		output = options['output'] or 'bench-site-%s-%s.json' % (options['books'], datetime.datetime.now().strftime('%Y%m%d-%H%M%S'))
+		with open(output, 'w') as results_file:
+			json.dump(results, results_file, indent=2)
+		self.stdout.write(self.style.SUCCESS('Results written to %s' % output))
+		if previous:
+			self.compare(previous, results)
+
+	def run(self, books, options):
+		for alias in ('default', 'template_fragments'):		# of this process; not the caches shared with the site
+			caches[alias].clear()
+		autocomplete.invalidate()
+		if Book.objects.exists():
+			self.stdout.write('Using the %d books already in %s' % (Book.objects.count(), connection.settings_dict['NAME']))
+		else:
+			started = time.perf_counter()
+			benchdata.generate(books, seed=options['seed'], progress=lambda done, total: self.stdout.write(
+				'generated %d/%d books (%.0fs)' % (done, total, time.perf_counter() - started)))
+
+		clients = self.clients()
+		only = {name for name in options['only'].split(',') if name}
+		targets = [target for target in self.targets() if not only or target[0] in only]
+		missing = self.url_names() - {target[0] for target in self.targets()}
+		if missing:
+			self.stderr.write('Not benchmarked (no target for them yet): %s' % ', '.join(sorted(missing)))
+
+		self.stdout.write('%-20s %-14s %6s %9s %9s %9s %9s %8s %10s' % (
+			'url', 'user', 'status', 'p50 ms', 'p90 ms', 'p99 ms', 'max ms', 'queries', 'peak KB'))
+		measurements = []
+		for url_name, role, path in targets:
+			measurement = self.measure(clients[role], path, options['warmup'], options['requests'])
+			variant = sum(1 for other in measurements if (other['url'], other['user']) == (url_name, role))		# same URL, other query
+			measurement.update(url=url_name, user=role, variant=variant)
+			measurements.append(measurement)
+			latency = measurement['latency_ms']
+			self.stdout.write('%-20s %-14s %6s %9.2f %9.2f %9.2f %9.2f %8d %10.0f' % (
+				url_name, role, measurement['status'], latency['p50'], latency['p90'], latency['p99'], latency['max'],
+				measurement['queries']['max'], measurement['peak_memory_kb']))
+
+		return {
+			'started': datetime.datetime.now().isoformat(timespec='seconds'),
+			'books': books,
+			'seed': options['seed'],
+			'rows': {'books': Book.objects.count(), 'authors': Author.objects.count(), 'copies': BookInstance.objects.count(),
+					 'reviews': Review.objects.count(), 'users': User.objects.count()},
+			'requests': options['requests'],
+			'environment': {'python': platform.python_version(), 'django': django.get_version(), 'database': connection.vendor,
+							'settings': os.environ.get('DJANGO_SETTINGS_MODULE')},
+			'results': measurements,
+		}
+
+	def url_names(self):
+		return {pattern.name for pattern in urls.urlpatterns if isinstance(pattern, URLPattern) and pattern.name}
+
+	def clients(self):
+		"""A test client logged in as a user of each role (anonymous, member, manager, administrator). Errors in the views
+		are reported as their 500 status."""
+		users = {}
+		for role, group, is_staff in (('member', 'Library Members', False), ('manager', MANAGER, True),
+									  ('administrator', ADMINISTRATOR, True)):
+			user, _ = User.objects.get_or_create(username='bench-site-%s' % role, defaults={'is_staff': is_staff})
+			Profile.objects.update_or_create(user=user, defaults={'role': role, 'ID_num': '0' * 10})
+			Group.objects.get_or_create(name=group)[0].user_set.add(user)
+			users[role] = user
+		clients = {'anonymous': Client(HTTP_HOST='localhost', raise_request_exception=False)}
+		for role, user in users.items():
+			clients[role] = Client(HTTP_HOST='localhost', raise_request_exception=False)
+			clients[role].force_login(user)
+		if not Review.objects.filter(user=users['member']).exists():		# something on the member's own pages
+			book_ids = list(Book.objects.order_by('id').values_list('id', flat=True)[:3])
+			for book_id in book_ids:
+				Review.objects.create(book_id=book_id, user=users['member'], rating=4, review='Review')
+			copy = BookInstance.objects.filter(status='a').order_by('id').first()
+			if copy:
+				BookInstance.objects.filter(pk=copy.pk).update(status='r', borrower=users['member'],
+																due_back=datetime.date.today() + datetime.timedelta(days=7))
+		return clients
+
+	def targets(self):
+		"""[(url name, role of the user fetching it, function returning the path)], for a book, author and copy in the
+		middle of the catalog."""
+		middle = lambda queryset: queryset.order_by('id')[queryset.count() // 2]
+		book = middle(Book.objects.all())
+		author = middle(Author.objects.all())
+		copy = middle(BookInstance.objects.filter(status='a'))
+		book_pages = Book.objects.count() // 12 // 2 + 1
+
+		def new_book():
+			return Book.objects.create(title='Bench book', publisher='Publisher', isbn='9780000000000', summary='Summary')
+
+		path = lambda name, *args, query='': lambda: reverse(name, args=args) + query
+		return [
+			('index', 'anonymous', path('index')),
+			('index', 'member', path('index')),
+			('books', 'anonymous', path('books')),
+			('books', 'anonymous', path('books', query='?page=%d' % book_pages)),
+			('books', 'member', path('books', query='?q=river+night')),
+			('books', 'anonymous', path('books', query='?year=1950-1999&available=1')),
+			('books', 'manager', path('books')),
+			('autocomplete', 'anonymous', path('autocomplete', query='?q=riv')),
+			('book-detail', 'anonymous', path('book-detail', book.pk)),
+			('book-detail', 'member', path('book-detail', book.pk)),
+			('authors', 'anonymous', path('authors')),
+			('author-detail', 'anonymous', path('author-detail', author.pk)),
+			('my-borrowed', 'member', path('my-borrowed')),
+			('signup', 'anonymous', path('signup')),
+			('user-profile', 'member', path('user-profile', 'bench-site-member')),
+			('borrow-book', 'member', path('borrow-book', copy.pk)),
+			('borrow-any-copy', 'member', path('borrow-any-copy', book.pk)),
+			('review-book', 'member', path('review-book', book.pk)),
+			('change-password', 'member', path('change-password')),
+			('404', 'anonymous', path('404')),
+			('delete-book', 'manager', lambda: reverse('delete-book', args=[new_book().pk])),
+			('add-book', 'manager', path('add-book')),
+			('edit-book', 'manager', path('edit-book', book.pk)),
+			('book-copies', 'manager', path('book-copies')),
+			('book-copies', 'manager', path('book-copies', query='?q=river')),
+			('delete-copy', 'manager', lambda: reverse('delete-copy', args=[BookInstance.objects.create(book=book).pk])),
+			('add-copy', 'manager', path('add-copy')),
+			('add-copies', 'manager', path('add-copies')),
+			('return-copies', 'manager', path('return-copies')),
+			('overdue-loans', 'manager', path('overdue-loans')),
+			('edit-copy', 'manager', path('edit-copy', copy.pk)),
+			('system-logs', 'administrator', path('system-logs')),
+			('system-logs', 'administrator', path('system-logs', query='?action_flag=1')),
+			('managers', 'administrator', path('managers')),
+			('add-manager', 'administrator', path('add-manager')),
+			('timeout', 'anonymous', path('timeout')),
+			('api-books', 'anonymous', path('api-books')),
+			('api-books', 'anonymous', path('api-books', query='?fields=id,title,authors&limit=200&q=river')),
+			('api-book', 'anonymous', path('api-book', book.pk)),
+			('api-book-copies', 'anonymous', path('api-book-copies', book.pk)),
+			('api-book-reviews', 'anonymous', path('api-book-reviews', book.pk)),
+			('api-authors', 'anonymous', path('api-authors')),
+			('api-author', 'anonymous', path('api-author', author.pk)),
+		]
+
+	def measure(self, client, path, warmup, requests):
+		"""Latency percentiles and queries of requests to the path, and the peak memory allocated by one of them."""
+		for _ in range(warmup):
+			client.get(path())
+		latencies, queries = [], []
+		for _ in range(requests):
+			url = path()
+			with CaptureQueriesContext(connection) as captured:
+				started = time.perf_counter()
+				response = client.get(url)
+				latencies.append((time.perf_counter() - started) * 1000)
+			queries.append(len(captured))
+
+		url = path()
+		tracemalloc.start()
+		client.get(url)
+		peak = tracemalloc.get_traced_memory()[1]
+		tracemalloc.stop()
+
+		latencies.sort()
+		percentile = lambda p: latencies[max(math.ceil(p / 100 * len(latencies)) - 1, 0)]		# nearest rank
+		return {
+			'path': url,
+			'status': response.status_code,
+			'latency_ms': dict({'p%d' % p: round(percentile(p), 3) for p in PERCENTILES},
+							   min=round(latencies[0], 3), max=round(latencies[-1], 3), mean=round(statistics.mean(latencies), 3)),
+			'queries': {'median': statistics.median(queries), 'max': max(queries)},
+			'peak_memory_kb': round(peak / 1024, 1),
+		}
+
+	def compare(self, previous, current):
+		"""Print the p50 latency and the queries of each URL against those of the previous results."""
+		before = {(result['url'], result['user'], result['variant']): result for result in previous['results']}
+		self.stdout.write(self.style.MIGRATE_HEADING('Compared with the run of %s (%d books):' % (previous['started'], previous['books'])))
+		self.stdout.write('%-20s %-14s %10s %10s %8s %9s' % ('url', 'user', 'p50 before', 'p50 now', 'change', 'queries'))
+		for result in current['results']:
+			old = before.get((result['url'], result['user'], result['variant']))
+			if old is None:
+				continue
+			old_p50, new_p50 = old['latency_ms']['p50'], result['latency_ms']['p50']
+			self.stdout.write('%-20s %-14s %10.2f %10.2f %+7.0f%% %4d->%-4d' % (
+				result['url'], result['user'], old_p50, new_p50, (new_p50 - old_p50) / max(old_p50, 0.001) * 100,
+				old['queries']['max'], result['queries']['max']))
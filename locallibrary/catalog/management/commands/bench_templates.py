@@ -0,0 +1,107 @@
+import os
+import statistics
+import tempfile
+import time
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.template import Context, Engine, engines
+from django.template.base import Template
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from catalog import benchdata, fragments, warmup
+from catalog.models import Author, Book
+
+
+class Command(BaseCommand):
+	help = ('Render time of every template of the catalog pages, with the contexts of real requests: the pages are '
+			'fetched once (anonymously and as a member) to record the context each template is rendered with, then every '
+			'template is compiled and rendered with the filesystem loaders (read and parsed on every use, as with DEBUG = '
+			'True) and with the cached loader of settings_production. The fragment cache is cleared before every render. '
+			'The pages are fetched from a generated catalog of --books books (see catalog/benchdata.py) in a separate '
+			'database (--database, kept with --keep so the next run skips the generation); the configured database is '
+			'not touched.')
+
+	def add_arguments(self, parser):
+		parser.add_argument('--books', default='100', help='Scale: number of books, e.g. 100, 1k (default: 100)')
+		parser.add_argument('--database', help='Database (SQLite file) for the generated data (default: one per scale '
+											   'in the temporary directory)')
+		parser.add_argument('--keep', action='store_true', help='Keep the database for the next run')
+		parser.add_argument('--repeat', type=int, default=50, help='Renders per template and loader (default: 50)')
+
+	def handle(self, *args, **options):
+		try:
+			books = benchdata.parse_scale(options['books'])
+		except ValueError as error:
+			raise CommandError(error)
+		name = options['database'] or 'locallibrary_bench_templates_%d' % books
+		if connection.vendor == 'sqlite' and not options['database']:
+			name = os.path.join(tempfile.gettempdir(), name + '.sqlite3')
+		with benchdata.separate_database(name, keep=options['keep']):
+			if not Book.objects.exists():
+				benchdata.generate(books)
+			# audit entries written in the request, not by a thread that would outlive the database
+			with override_settings(CATALOG_AUDIT_LOG_ASYNC=False, ALLOWED_HOSTS=['*'], DEBUG=False):
+				contexts = self.record_contexts()
+			self.report(contexts, options['repeat'])		# the contexts hold querysets, evaluated again on this database
+
+	def report(self, contexts, repeat):
+		project = engines['django'].engine
+		loaders = ['django.template.loaders.filesystem.Loader', 'django.template.loaders.app_directories.Loader']
+		plain = Engine(dirs=project.dirs, loaders=loaders, libraries=project.libraries, debug=False)
+		cached = Engine(dirs=project.dirs, loaders=[('django.template.loaders.cached.Loader', loaders)],
+						libraries=project.libraries, debug=False)
+		compile_times = warmup.compile_templates(plain)
+		warmup.compile_templates(cached)
+
+		self.stdout.write('%-45s %10s %14s %14s' % ('template', 'compile', 'render', 'render cached'))
+		totals = [0, 0]
+		for name in sorted(contexts):
+			runs = [self.time_render(engine, name, contexts[name], repeat) for engine in (plain, cached)]
+			totals = [total + run for total, run in zip(totals, runs)]
+			self.stdout.write('%-45s %8.2fms %12.2fms %12.2fms' % (name, compile_times.get(name, 0) * 1000, runs[0] * 1000, runs[1] * 1000))
+		self.stdout.write('%-45s %10s %12.2fms %12.2fms' % ('total', '', totals[0] * 1000, totals[1] * 1000))
+		not_rendered = sorted(set(compile_times) - set(contexts))
+		if not_rendered:
+			self.stdout.write('not rendered by the pages fetched: %s' % ', '.join(not_rendered))
+
+	def record_contexts(self):
+		"""{template name: the flattened context of its first render} over a visit of the catalog pages."""
+		contexts = {}
+		names = set(warmup.template_names())		# not the form widgets, rendered by the forms renderer
+		render = Template._render
+
+		def record(template, context):
+			if template.name in names and template.name not in contexts:
+				contexts[template.name] = context.flatten()
+			return render(template, context)
+
+		member, _ = User.objects.get_or_create(username='bench-templates')		# kept with the database by --keep
+		book, author = Book.objects.order_by('-num_reviews').first(), Author.objects.first()
+		urls = [reverse('index'), reverse('books'), reverse('authors')]
+		if book:
+			urls.append(reverse('book-detail', args=[book.pk]))
+		if author:
+			urls.append(reverse('author-detail', args=[author.pk]))
+		with mock.patch.object(Template, '_render', record):
+			anonymous = Client(HTTP_HOST='localhost')
+			for url in urls + [reverse('login'), reverse('signup')]:
+				anonymous.get(url)
+			client = Client(HTTP_HOST='localhost')
+			client.force_login(member)
+			for url in urls + [reverse('my-borrowed'), reverse('user-profile', args=[member.username]), reverse('change-password')]:
+				client.get(url)
+		return contexts
+
+	def time_render(self, engine, name, context, repeat):
+		"""Median seconds to get the template from the engine and render it (with its parents and includes)."""
+		runs = []
+		for _ in range(repeat):
+			fragments.get_cache().clear()
+			started = time.perf_counter()
+			engine.get_template(name).render(Context(context))
+			runs.append(time.perf_counter() - started)
+		return statistics.median(runs)
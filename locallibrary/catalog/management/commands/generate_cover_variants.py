@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from catalog import covers
+from catalog.models import Book
+
+
+class Command(BaseCommand):
+	help = 'Generate the resized WebP/JPEG variants of the book covers that do not have them yet.'
+
+	def add_arguments(self, parser):
+		parser.add_argument('--force', action='store_true', help='Regenerate the variants of every cover')
+
+	def handle(self, *args, **options):
+		names = Book.objects.order_by().values_list('book_cover', flat=True).distinct()
+		generated = failed = 0
+		for name in names.iterator():
+			try:
+				if covers.generate_variants(name, force=options['force']):
+					generated += 1
+			except (OSError, ValueError) as error:
+				failed += 1
+				self.stderr.write('%s: %s' % (name, error))
+		self.stdout.write(self.style.SUCCESS('Generated the variants of %d covers (%d failed).' % (generated, failed)))
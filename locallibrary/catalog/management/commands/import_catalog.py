@@ -0,0 +1,165 @@
+import csv
+import datetime
+import io
+import json
+import os
+import sys
+import time
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max
+
+from catalog import autocomplete, changes, search
+from catalog.models import Author, Book, BookInstance
+
+
+def split_name(name):
+	"""'Last, First' or 'First Middle Last' -> (first_name, last_name). Last names of several words need the first form."""
+	name = ' '.join(name.split())
+	if ',' in name:
+		last_name, _, first_name = name.partition(',')
+		return first_name.strip(), last_name.strip()
+	first_name, _, last_name = name.rpartition(' ')
+	return first_name, last_name
+
+
+def parse_authors(value):
+	"""Authors of a row: 'First Last; First Last' in CSV, a list of names or of {first_name, last_name} in JSONL."""
+	if isinstance(value, str):
+		value = value.split(';')
+	authors = []
+	for author in value or []:
+		if isinstance(author, dict):
+			authors.append((author.get('first_name', '').strip(), author.get('last_name', '').strip()))
+		elif author.strip():
+			authors.append(split_name(author))
+	return authors
+
+
+class Command(BaseCommand):
+	help = ('Import books, their authors and copies from a CSV or JSONL file (- for stdin), streaming it in chunks. '
+			'Columns/keys: title, authors, publisher, year, isbn, call_number, summary, copies (number of available copies). '
+			'Authors are matched by name with the existing ones.')
+
+	def add_arguments(self, parser):
+		parser.add_argument('path')
+		parser.add_argument('--format', choices=['csv', 'jsonl'], help='Default: from the file extension')
+		parser.add_argument('--chunk-size', type=int, default=2000, help='Rows per transaction (default: 2000)')
+
+	def handle(self, *args, **options):
+		file_format = options['format'] or ('jsonl' if options['path'].endswith(('.jsonl', '.json')) else 'csv')
+		if options['path'] == '-':
+			stream = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8', newline='')
+		elif os.path.isfile(options['path']):
+			stream = open(options['path'], encoding='utf-8', newline='')
+		else:
+			raise CommandError('No such file: %s' % options['path'])
+
+		# (first name, last name) in lower case -> author id; grows with the number of distinct authors, not of rows
+		self.author_ids = {
+			(first_name.lower(), last_name.lower()): author_id
+			for author_id, first_name, last_name in Author.objects.order_by('-id').values_list('id', 'first_name', 'last_name')
+		}
+		self.stats = {'books': 0, 'authors': 0, 'copies': 0, 'skipped': 0}
+		self.started = time.perf_counter()
+
+		with stream:
+			if file_format == 'csv':
+				rows = enumerate(csv.DictReader(stream), 1)
+			else:
+				rows = ((line_number, line) for line_number, line in enumerate(stream, 1) if line.strip())	# decoded in build_book
+			chunk = []
+			for line_number, row in rows:
+				chunk.append((line_number, row))
+				if len(chunk) >= options['chunk_size']:
+					self.import_chunk(chunk)
+					chunk = []
+			if chunk:
+				self.import_chunk(chunk)
+
+		changes.catalog_changed()
+		autocomplete.invalidate()
+		self.stdout.write(self.style.SUCCESS('Imported %(books)d books, %(authors)d new authors and %(copies)d copies '
+											 '(%(skipped)d rows skipped)' % self.stats + ' in %.1fs.' % (time.perf_counter() - self.started)))
+
+	def build_book(self, line_number, row):
+		"""(Book with its counters already set, its authors) from a row (a JSONL line is decoded first), or None if the row
+		is not valid."""
+		try:
+			if isinstance(row, str):
+				row = json.loads(row)
+			if not isinstance(row, dict):
+				raise TypeError('not a JSON object')
+			authors = parse_authors(row.get('authors'))
+			copies = int(row.get('copies') or 0)
+			if copies < 0:
+				raise ValueError('negative number of copies')
+			book = Book(
+				title=str(row.get('title') or '').strip(),
+				publisher=str(row.get('publisher') or '').strip(),
+				year=int(row.get('year') or datetime.date.today().year),
+				isbn=str(row.get('isbn') or '').strip(),
+				call_number=int(row.get('call_number') or 0),
+				summary=str(row.get('summary') or '').strip(),
+				num_copies=copies,
+				num_copies_available=copies,
+			)
+			book.clean_fields(exclude=['book_cover'])		# same limits as BookForm: lengths, year and call number ranges
+		except (AttributeError, TypeError, ValueError) as error:		# json.JSONDecodeError is a ValueError
+			self.stderr.write('Row %d skipped: %s' % (line_number, error))
+			return None
+		except ValidationError as error:
+			self.stderr.write('Row %d skipped: %s' % (line_number, '; '.join(
+				'%s: %s' % (field, ' '.join(messages)) for field, messages in error.message_dict.items())))
+			return None
+		return book, authors
+
+	def import_chunk(self, chunk):
+		books, book_authors = [], []
+		for line_number, row in chunk:
+			built = self.build_book(line_number, row)
+			if built is None:
+				self.stats['skipped'] += 1
+				continue
+			books.append(built[0])
+			book_authors.append(built[1])
+
+		with transaction.atomic():
+			self.create_authors(author for authors in book_authors for author in authors)
+
+			last_id = Book.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+			Book.objects.bulk_create(books)
+			if books and books[0].pk is None:
+				# SQLite does not return the new ids; the writer holds the database lock, so they are the next ones in order
+				for book, book_id in zip(books, Book.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)):
+					book.pk = book_id
+
+			Book.author.through.objects.bulk_create(
+				Book.author.through(book_id=book.pk, author_id=author_id)
+				for book, authors in zip(books, book_authors)
+				for author_id in dict.fromkeys(self.author_ids[first_name.lower(), last_name.lower()] for first_name, last_name in authors))
+			BookInstance.objects.bulk_create(
+				BookInstance(book_id=book.pk, status='a') for book in books for _ in range(book.num_copies))
+			search.index_books(book.pk for book in books)		# bulk_create sends no signals
+
+		self.stats['books'] += len(books)
+		self.stats['copies'] += sum(book.num_copies for book in books)
+		elapsed = time.perf_counter() - self.started
+		self.stdout.write('%d rows, %.0f rows/s' % (self.stats['books'] + self.stats['skipped'], (self.stats['books'] + self.stats['skipped']) / elapsed))
+
+	def create_authors(self, names):
+		"""Create the authors (in the order of the rows) not seen yet and add their ids to the map."""
+		new = {}		# one author per name whatever its case: the first spelling met is kept
+		for first_name, last_name in names:
+			key = first_name.lower(), last_name.lower()
+			if key not in self.author_ids:
+				new.setdefault(key, (first_name, last_name))
+		if not new:
+			return
+		last_id = Author.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+		Author.objects.bulk_create(Author(first_name=first_name, last_name=last_name) for first_name, last_name in new.values())
+		for author_id, first_name, last_name in Author.objects.filter(id__gt=last_id).values_list('id', 'first_name', 'last_name'):
+			self.author_ids[first_name.lower(), last_name.lower()] = author_id
+		self.stats['authors'] += len(new)
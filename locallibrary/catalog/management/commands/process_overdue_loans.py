@@ -0,0 +1,44 @@
+import datetime
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from catalog.models import BookInstance
+
+
+class Command(BaseCommand):
+	help = ('Set the fine of every overdue loan to CATALOG_OVERDUE_FINE_PER_DAY times the number of days it is overdue. '
+			'Loans are updated one due date at a time, in chunks of --chunk-size copies per transaction, and only if their '
+			'fine changed, so the command can be interrupted and run again.')
+
+	def add_arguments(self, parser):
+		parser.add_argument('--chunk-size', type=int, default=5000, help='Copies per UPDATE (default: 5000)')
+		parser.add_argument('--date', type=datetime.date.fromisoformat, help='Compute the fines as of this day, YYYY-MM-DD (default: today)')
+
+	def handle(self, *args, **options):
+		today = options['date'] or datetime.date.today()
+		fine_per_day = Decimal(str(getattr(settings, 'CATALOG_OVERDUE_FINE_PER_DAY', '5.00')))
+		started = time.perf_counter()
+
+		# one row per distinct due date, read from the (status, due_back) index; copies due the same day owe the same fine
+		due_dates = list(BookInstance.objects.overdue(today).order_by('due_back').values_list('due_back', flat=True).distinct())
+		loans = updated = 0
+		for due_back in due_dates:
+			fine = fine_per_day * (today - due_back).days
+			# status and due_back only, without overdue()'s due_back < today: SQLite would scan that whole range every chunk
+			loans_due = BookInstance.objects.filter(status='r', due_back=due_back).order_by()
+			pending = loans_due.exclude(fine=fine)
+			while True:
+				# UPDATE ... WHERE id IN (SELECT id ... LIMIT n): the chunk is picked and updated by the database in one statement
+				with transaction.atomic():
+					chunk = BookInstance.objects.filter(pk__in=pending.values('pk')[:options['chunk_size']]).update(fine=fine)
+				if not chunk:
+					break
+				updated += chunk
+			loans += loans_due.count()
+
+		self.stdout.write(self.style.SUCCESS('%d overdue loans (%d fines updated) in %.1fs.' % (
+			loans, updated, time.perf_counter() - started)))
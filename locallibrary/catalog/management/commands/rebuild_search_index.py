@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from catalog import search
+
+
+class Command(BaseCommand):
+	help = 'Rebuild the full-text search index of the book catalog from scratch.'
+
+	def handle(self, *args, **options):
+		if not search.is_enabled():
+			self.stdout.write('The search index is only available on SQLite; nothing to do.')
+			return
+
+		with transaction.atomic():
+			count = search.rebuild_index()
+		self.stdout.write(self.style.SUCCESS('Indexed %d books.' % count))
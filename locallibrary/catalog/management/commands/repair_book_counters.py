@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from catalog import counters
+from catalog.models import Book
+
+
+class Command(BaseCommand):
+	help = 'Recompute the copy, available copy and review counters of every book and fix the ones that are out of sync.'
+
+	def add_arguments(self, parser):
+		parser.add_argument('--dry-run', action='store_true', help='Only report the books whose counters are wrong')
+
+	def handle(self, *args, **options):
+		if options['dry_run']:
+			for book in counters.stale(Book.objects.all()):
+				self.stdout.write('%s (id %d): copies %d/%d, available %d/%d, reviews %d/%d (stored/actual)' % (
+					book.title, book.id, book.num_copies, book.actual_copies, book.num_copies_available,
+					book.actual_copies_available, book.num_reviews, book.actual_reviews))
+			return
+
+		with transaction.atomic():
+			repaired = counters.repair(Book.objects.all())
+		self.stdout.write(self.style.SUCCESS('Repaired the counters of %d books.' % repaired))
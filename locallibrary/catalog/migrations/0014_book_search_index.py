@@ -0,0 +1,43 @@
+from django.db import migrations
+
+# Full-text search index for the book list (see catalog/search.py). FTS5 is SQLite only; on other databases this is a no-op
+# and the search falls back to a title substring filter.
+
+CREATE_INDEX_SQL = (
+    "CREATE VIRTUAL TABLE catalog_book_fts USING fts5("
+    "title, summary, publisher, authors, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+)
+
+POPULATE_INDEX_SQL = (
+    "INSERT INTO catalog_book_fts (rowid, title, summary, publisher, authors) "
+    "SELECT b.id, b.title, b.summary, b.publisher, COALESCE(("
+    "SELECT group_concat(a.first_name || ' ' || a.last_name, ' ') "
+    "FROM catalog_author a INNER JOIN catalog_book_author ba ON ba.author_id = a.id "
+    "WHERE ba.book_id = b.id), '') FROM catalog_book b"
+)
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(CREATE_INDEX_SQL)
+    # rank by bm25() with the column weights title, summary, publisher, authors (a match in the title counts the most)
+    schema_editor.execute("INSERT INTO catalog_book_fts (catalog_book_fts, rank) VALUES ('rank', 'bm25(10.0, 1.0, 2.0, 5.0)')")
+    schema_editor.execute(POPULATE_INDEX_SQL)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute("DROP TABLE IF EXISTS catalog_book_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0013_auto_20201029_1934'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
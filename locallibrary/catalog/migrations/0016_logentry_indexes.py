@@ -0,0 +1,28 @@
+from django.db import migrations
+
+# Indexes for the filters of the system logs page (SystemLogsView). LogEntry belongs to django.contrib.admin, so they
+# are added with plain SQL. Each filter column is paired with id, the keyset pagination key, so a filtered page is a
+# single index range scan.
+
+INDEXES = [
+    ('catalog_logentry_flag_id_idx', 'action_flag, id'),
+    ('catalog_logentry_user_id_idx', 'user_id, id'),
+    ('catalog_logentry_ctype_id_idx', 'content_type_id, id'),
+    ('catalog_logentry_time_idx', 'action_time'),
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('admin', '0003_logentry_add_action_flag_choices'),
+        ('catalog', '0015_book_counters'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            'CREATE INDEX %s ON django_admin_log (%s)' % (name, columns),
+            'DROP INDEX %s' % name,
+        )
+        for name, columns in INDEXES
+    ]
@@ -0,0 +1,34 @@
+from django.db import migrations, models
+
+# When each row last changed, for the ETag/Last-Modified of the book and author pages (catalog/conditional.py). Existing
+# rows start at the time of the migration.
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0018_list_view_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='author',
+            name='last_modified',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='last_modified',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='bookinstance',
+            name='last_modified',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='review',
+            name='last_modified',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
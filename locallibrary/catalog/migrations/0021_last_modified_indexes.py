@@ -0,0 +1,22 @@
+from django.db import migrations, models
+
+# The newest last_modified and the number of the books (and authors) are the validators of the book list and the API
+# lists (catalog/conditional.py): with an index on the column they are read from the index rather than the table.
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0020_drop_covered_fk_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['last_modified'], name='book_modified_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='author',
+            index=models.Index(fields=['last_modified'], name='author_modified_idx'),
+        ),
+    ]
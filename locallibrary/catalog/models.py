@@ -1,4 +1,5 @@
 from django.db import models
+import logging
 from django.urls import reverse # Used to generate URLs by reversing the URL patterns
 import uuid # Required for unique book instances
 import datetime # for publishing year
@@ -7,6 +8,9 @@ from datetime import date
 
 from django.contrib.auth.models import User  # Required to assign User as a borrower
 
+from . import counters  # Denormalized copy/review counters on Book
+from . import covers  # Resized variants of the book covers
+
 # Create your models here.
 		
 class Book(models.Model):
@@ -39,10 +43,21 @@ class Book(models.Model):
 	
 	summary = models.TextField(max_length=1000, help_text='Enter a brief description of the book')
 	book_cover = models.ImageField(default='bookcovers/no-cover.jpg', upload_to='bookcovers', height_field=None, width_field=None, max_length=100)
-
+	
+	# Denormalized counters, kept up to date by the receivers at the bottom of this file (see catalog/counters.py)
+	num_copies = models.PositiveIntegerField(default=0, editable=False)
+	num_copies_available = models.PositiveIntegerField(default=0, editable=False)
+	num_reviews = models.PositiveIntegerField(default=0, editable=False)
+	# also moved when its copies, reviews or authors change (see the receivers at the bottom, catalog/conditional.py and fragments.py)
+	last_modified = models.DateTimeField(auto_now=True)
 	
 	class Meta:
 		ordering = ['title']
+		indexes = [
+			models.Index(fields=['title'], name='book_title_idx'),		# default ordering of the book list
+			models.Index(fields=['isbn'], name='book_isbn_idx'),
+			models.Index(fields=['last_modified'], name='book_modified_idx'),		# validators of the book list
+		]
 	
 	def __str__(self):
 		"""String for representing the Model object."""
@@ -58,13 +73,32 @@ class Book(models.Model):
 	def get_absolute_url(self):
 		"""Returns the url to access a detail record for this book."""
 		return reverse('book-detail', args=[str(self.id)])
+	
+	@property
+	def cover_thumbnail_url(self):
+		"""URL of the 320px wide JPEG of the cover (the original until the variants are generated, see catalog/covers.py)."""
+		return covers.cover_url(self.book_cover.name, 320)
+	
+	@property
+	def cover_srcset(self):
+		"""srcset of the WebP variants of the cover, empty until they are generated."""
+		return ', '.join('%s %dw' % (url, width) for width, url in covers.variant_urls(self.book_cover.name, 'webp'))
 		
+class BookInstanceQuerySet(models.QuerySet):
+	def overdue(self, today=None):
+		"""Copies still out on loan after their due date, found through the (status, due_back) index."""
+		return self.filter(status='r', due_back__lt=today or date.today())
+
 class BookInstance(models.Model):
 	"""Model representing a specific copy of a book (i.e. that can be borrowed from the library)."""
 	id = models.UUIDField(primary_key=True, default=uuid.uuid4, help_text='Unique ID')
-	book = models.ForeignKey('Book', on_delete=models.SET_NULL, null=True)
+	book = models.ForeignKey('Book', on_delete=models.SET_NULL, null=True, db_index=False)		# indexed by bookinstance_book_due_idx
 	due_back = models.DateField(null=True, blank=True)
-	borrower = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+	borrower = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, db_index=False)		# by bookinstance_borrower_due_idx
+	fine = models.DecimalField(max_digits=8, decimal_places=2, default=0, editable=False)		# set by the process_overdue_loans command
+	last_modified = models.DateTimeField(auto_now=True)
+	
+	objects = BookInstanceQuerySet.as_manager()
 
 	@property
 	def is_overdue(self):
@@ -88,10 +122,28 @@ class BookInstance(models.Model):
 	class Meta:
 		ordering = ['due_back']
 		permissions = (("can_mark_returned", "Set book as returned"),)
+		indexes = [
+			models.Index(fields=['status', 'due_back'], name='bookinstance_status_due_idx'),		# overdue loans
+			models.Index(fields=['borrower', 'status', 'due_back'], name='bookinstance_borrower_due_idx'),		# a member's loans
+			models.Index(fields=['due_back'], name='bookinstance_due_idx'),		# default ordering of the copies page
+			models.Index(fields=['book', 'due_back'], name='bookinstance_book_due_idx'),		# copies on the book page
+		]
 	
 	def __str__(self):
 		"""String for representing the Model object."""
 		return f'{self.id} ({self.book.title})'
+	
+	@classmethod
+	def from_db(cls, db, field_names, values):
+		"""Remember the book and status as loaded, so the Book counters can be adjusted on save/delete."""
+		instance = super().from_db(db, field_names, values)
+		instance._counter_state = counters.copy_state(instance)
+		return instance
+
+	def save(self, *args, **kwargs):
+		if self.status != 'r':
+			self.fine = 0		# a copy returned (e.g. through the edit form) no longer has the fine of its loan
+		super().save(*args, **kwargs)
 		
 class Author(models.Model):
 	"""Model representing an author."""
@@ -99,9 +151,14 @@ class Author(models.Model):
 	last_name = models.CharField(max_length=100)
 	date_of_birth = models.DateField(null=True, blank=True)
 	date_of_death = models.DateField('Died', null=True, blank=True)
+	last_modified = models.DateTimeField(auto_now=True)		# also moved when books are added to or removed from the author
 	
 	class Meta:
 		ordering = ['last_name', 'first_name']
+		indexes = [
+			models.Index(fields=['last_name', 'first_name'], name='author_name_idx'),		# default ordering of the author list
+			models.Index(fields=['last_modified'], name='author_modified_idx'),		# validators of the API author list
+		]
 		
 	def __str__(self):
 		"""String for representing the Model object."""
@@ -114,8 +171,8 @@ class Author(models.Model):
 class Review(models.Model):
 	"""Model representing a review for a certain book."""
 	id = models.UUIDField(primary_key=True, default=uuid.uuid4, help_text='Unique ID')
-	book = models.ForeignKey('Book', on_delete=models.SET_NULL, null=True)
-	user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+	book = models.ForeignKey('Book', on_delete=models.SET_NULL, null=True, db_index=False)		# indexed by review_book_date_idx
+	user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, db_index=False)		# by review_user_date_idx
 	date_published = models.DateField(default=datetime.datetime.today, editable=False)		# hide the date_published since it should not be edited, set to today always 
 	rating = models.PositiveSmallIntegerField(
 		help_text='Enter book rating out of 5',
@@ -125,13 +182,25 @@ class Review(models.Model):
         ]
 	)
 	review = models.TextField(max_length=1000, help_text='Enter book review')
+	last_modified = models.DateTimeField(auto_now=True)
 	
 	class Meta:
 		ordering = ['date_published']
+		indexes = [
+			models.Index(fields=['book', 'date_published'], name='review_book_date_idx'),		# reviews on the book page
+			models.Index(fields=['user', 'date_published'], name='review_user_date_idx'),		# a member's reviews
+		]
 
 	def __str__(self):
 		"""String for representing the Model object."""
 		return f'{self.id} ({self.book.title})'
+	
+	@classmethod
+	def from_db(cls, db, field_names, values):
+		"""Remember the book as loaded, so the Book review counter can be adjusted on save/delete."""
+		instance = super().from_db(db, field_names, values)
+		instance._counter_book_id = instance.book_id
+		return instance
 		
 
 # Extending the existing User model (add more details such as ID)		
@@ -144,6 +213,11 @@ class Profile(models.Model):
 	ID_num = models.CharField(max_length=10)
 	role = models.CharField(max_length=20, blank=True)
 	
+	class Meta:
+		indexes = [
+			models.Index(fields=['role'], name='profile_role_idx'),		# managers list in the admin
+		]
+	
 	def __str__(self):
 		return self.user.username
 
@@ -152,6 +226,163 @@ def update_profile_signal(sender, instance, created, **kwargs):
 	if created:
 		Profile.objects.create(user=instance)
 	instance.profile.save()
-	
 
-	
+# Keep the book search index (catalog/search.py) in sync with the catalog
+from django.db.models.signals import post_delete, pre_delete, m2m_changed
+from . import search
+
+@receiver(post_save, sender=Book)
+def index_book_signal(sender, instance, **kwargs):
+	search.index_books([instance.pk])
+
+@receiver(post_delete, sender=Book)
+def unindex_book_signal(sender, instance, **kwargs):
+	search.unindex_books([instance.pk])
+
+@receiver(m2m_changed, sender=Book.author.through)
+def index_book_authors_signal(sender, instance, action, reverse, pk_set, **kwargs):
+	if not reverse:
+		if action in ('post_add', 'post_remove', 'post_clear'):
+			search.index_books([instance.pk])		# authors of a book changed
+	elif action == 'pre_clear':
+		instance._search_book_ids = list(instance.book_set.values_list('id', flat=True))		# books of an author are about to be cleared
+	elif action == 'post_clear':
+		search.index_books(getattr(instance, '_search_book_ids', []))
+	elif action in ('post_add', 'post_remove'):
+		search.index_books(pk_set)		# books added to / removed from an author
+
+@receiver(post_save, sender=Author)
+def index_author_books_signal(sender, instance, created, **kwargs):
+	if not created:
+		search.index_books(instance.book_set.values_list('id', flat=True))		# author names are part of the index
+
+@receiver(pre_delete, sender=Author)
+def collect_author_books_signal(sender, instance, **kwargs):
+	instance._search_book_ids = list(instance.book_set.values_list('id', flat=True))		# the links are gone by post_delete
+
+@receiver(post_delete, sender=Author)
+def reindex_author_books_signal(sender, instance, **kwargs):
+	search.index_books(getattr(instance, '_search_book_ids', []))
+
+# Keep the autocomplete prefix index of this process (catalog/autocomplete.py) in sync with the catalog
+from . import autocomplete
+
+@receiver(post_save, sender=Book)
+def autocomplete_book_signal(sender, instance, **kwargs):
+	autocomplete.book_saved(instance)
+
+@receiver(post_delete, sender=Book)
+def autocomplete_remove_book_signal(sender, instance, **kwargs):
+	autocomplete.book_deleted(instance.pk)
+
+@receiver(post_save, sender=Author)
+def autocomplete_author_signal(sender, instance, **kwargs):
+	autocomplete.author_saved(instance)
+
+@receiver(post_delete, sender=Author)
+def autocomplete_remove_author_signal(sender, instance, **kwargs):
+	autocomplete.author_deleted(instance.pk)
+
+# Move the last_modified of the books and authors whose pages show a change to other rows (catalog/conditional.py).
+# Before the counter receivers below, which replace the book id remembered from the database with the new one.
+from . import changes
+
+@receiver(post_save, sender=BookInstance)
+@receiver(post_delete, sender=BookInstance)
+def touch_copy_book_signal(sender, instance, **kwargs):
+	loaded = getattr(instance, '_counter_state', None)
+	changes.touch_books([loaded[0] if loaded else None, instance.book_id])		# the book it left, and the one it is in
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def touch_review_book_signal(sender, instance, **kwargs):
+	changes.touch_books([getattr(instance, '_counter_book_id', None), instance.book_id])
+
+@receiver(m2m_changed, sender=Book.author.through)
+def touch_book_authors_signal(sender, instance, action, reverse, pk_set, **kwargs):
+	touch_instance, touch_others = (changes.touch_authors, changes.touch_books) if reverse else (changes.touch_books, changes.touch_authors)
+	if action == 'pre_clear':
+		instance._touch_ids = list((instance.book_set if reverse else instance.author).values_list('id', flat=True))
+	elif action == 'post_clear':
+		touch_instance([instance.pk])
+		touch_others(getattr(instance, '_touch_ids', []))
+	elif action in ('post_add', 'post_remove'):
+		touch_instance([instance.pk])
+		touch_others(pk_set)
+
+@receiver(post_save, sender=Author)
+def touch_author_books_signal(sender, instance, created, **kwargs):
+	if not created:
+		changes.touch_books(instance.book_set.values_list('id', flat=True))		# the book cards show the author names
+
+@receiver(pre_delete, sender=Book)
+def touch_deleted_book_authors_signal(sender, instance, **kwargs):
+	changes.touch_authors(instance.author.values_list('id', flat=True))
+
+@receiver(post_delete, sender=Author)
+def touch_deleted_author_books_signal(sender, instance, **kwargs):
+	changes.touch_books(getattr(instance, '_search_book_ids', []))		# collected by collect_author_books_signal
+
+# Keep the copy and review counters on Book in sync (catalog/counters.py)
+@receiver(post_save, sender=BookInstance)
+def count_copy_signal(sender, instance, **kwargs):
+	new_state = counters.copy_state(instance)
+	counters.copy_changed(getattr(instance, '_counter_state', None), new_state)
+	instance._counter_state = new_state
+
+@receiver(post_delete, sender=BookInstance)
+def uncount_copy_signal(sender, instance, **kwargs):
+	counters.copy_changed(getattr(instance, '_counter_state', counters.copy_state(instance)), None)
+	instance._counter_state = None
+
+@receiver(post_save, sender=Review)
+def count_review_signal(sender, instance, **kwargs):
+	counters.review_changed(getattr(instance, '_counter_book_id', None), instance.book_id)
+	instance._counter_book_id = instance.book_id
+
+@receiver(post_delete, sender=Review)
+def uncount_review_signal(sender, instance, **kwargs):
+	counters.review_changed(getattr(instance, '_counter_book_id', instance.book_id), None)
+	instance._counter_book_id = None
+
+# Drop what is cached from the catalog (catalog/changes.py) whenever it changes
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+@receiver(post_save, sender=BookInstance)
+@receiver(post_delete, sender=BookInstance)
+@receiver(post_save, sender=Author)
+@receiver(post_delete, sender=Author)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+@receiver(m2m_changed, sender=Book.author.through)
+def catalog_changed_signal(sender, **kwargs):
+	changes.catalog_changed()
+
+# Generate the resized variants of a newly uploaded cover (catalog/covers.py); the generate_cover_variants command
+# does the default cover
+
+@receiver(post_save, sender=Book)
+def generate_cover_variants_signal(sender, instance, **kwargs):
+	if instance.book_cover.name == Book._meta.get_field('book_cover').default:
+		return
+	try:
+		covers.generate_variants(instance.book_cover.name)
+	except (OSError, ValueError):
+		logging.getLogger(__name__).exception('Could not generate the variants of the cover %s', instance.book_cover.name)
+
+# Make the roles stored in the sessions (catalog/roles.py) stale when group membership changes
+from django.contrib.auth.models import Group
+from . import roles
+
+@receiver(m2m_changed, sender=User.groups.through)
+def invalidate_roles_signal(sender, instance, action, reverse, pk_set, **kwargs):
+	if action in ('post_add', 'post_remove'):
+		roles.invalidate(pk_set if reverse else [instance.pk])		# reverse: instance is a group, pk_set its users
+	elif action == 'pre_clear':
+		roles.invalidate(instance.user_set.values_list('pk', flat=True) if reverse else [instance.pk])
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidate_all_roles_signal(sender, **kwargs):
+	roles.invalidate()
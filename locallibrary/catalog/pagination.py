@@ -0,0 +1,57 @@
+"""Keyset (seek) pagination for large, append-mostly tables such as the system logs.
+
+Unlike ?page=N (LIMIT/OFFSET), which makes the database walk over every skipped row, a keyset page starts right after
+the last key the client has seen, so every page costs the same no matter how deep the client is.
+"""
+
+
+class KeysetPage:
+	"""One page of rows ordered by a unique key, newest (highest key) first."""
+
+	def __init__(self, object_list, has_next, has_previous, key):
+		self.object_list = object_list
+		self.has_next = has_next
+		self.has_previous = has_previous
+		self.key = key
+
+	def __iter__(self):
+		return iter(self.object_list)
+
+	def __len__(self):
+		return len(self.object_list)
+
+	@property
+	def next_cursor(self):
+		"""Pass as ?before= to get the following (older) page."""
+		return getattr(self.object_list[-1], self.key) if self.has_next else None
+
+	@property
+	def previous_cursor(self):
+		"""Pass as ?after= to get the preceding (newer) page."""
+		return getattr(self.object_list[0], self.key) if self.has_previous else None
+
+
+def parse_cursor(value):
+	"""Read a cursor from the query string, None if it is missing or not a number."""
+	try:
+		return int(value)
+	except (TypeError, ValueError):
+		return None
+
+
+def keyset_paginate(queryset, per_page, before=None, after=None, key='id'):
+	"""Return the KeysetPage of the queryset just below the key `before`, or just above the key `after`.
+
+	Fetches one extra row to find out whether there is a page beyond this one, so only one query is run.
+	"""
+	if after is not None:
+		rows = list(queryset.filter(**{key + '__gt': after}).order_by(key)[:per_page + 1])
+		has_more = len(rows) > per_page
+		rows = rows[:per_page][::-1]
+		return KeysetPage(rows, has_next=bool(rows), has_previous=has_more, key=key)
+
+	if before is not None:
+		queryset = queryset.filter(**{key + '__lt': before})
+	rows = list(queryset.order_by('-' + key)[:per_page + 1])
+	has_more = len(rows) > per_page
+	return KeysetPage(rows[:per_page], has_next=has_more, has_previous=before is not None and bool(rows), key=key)
@@ -0,0 +1,162 @@
+"""Per-request profile of where the time goes, sent back as Server-Timing headers (opt-in).
+
+Profiling is on when the server is started with CATALOG_PROFILING=1 in its environment. settings.py then passes
+MIDDLEWARE through instrument(): ProfilingMiddleware goes first and a LayerTimer before every middleware and the view.
+Each response then gets a header such as
+
+	Server-Timing: sql;dur=3.12;desc="7 queries", tpl;dur=8.40, session;dur=0.55, mw-SessionMiddleware;dur=0.61, ...,
+		view;dur=14.90, total;dur=17.30
+
+with the time spent in SQL (every connection, through connection.execute_wrapper()), rendering templates, loading and
+saving the session, in each middleware (its own time, without the layers inside it) and in the view (with the
+process_view/process_exception hooks and the rendering of template responses). SQL, templates and session overlap the
+middleware and view times. Browsers show the header in their developer tools. A fraction of the requests,
+CATALOG_PROFILING_LOG_SAMPLE_RATE (default 0), is also logged as one JSON line to the 'catalog.profiling' logger.
+
+With profiling off nothing is added to MIDDLEWARE and nothing is patched, so there is no cost. The body of streaming
+responses is produced after the middleware returns and is not counted.
+"""
+import collections
+import contextlib
+import contextvars
+import json
+import logging
+import random
+import time
+from functools import wraps
+from importlib import import_module
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template.base import Template
+
+logger = logging.getLogger(__name__)
+
+_current = contextvars.ContextVar('catalog_profile', default=None)
+_patched = set()
+
+
+def instrument(middleware):
+	"""The MIDDLEWARE setting with ProfilingMiddleware first and a LayerTimer around every middleware and the view."""
+	timed = ['catalog.profiling.ProfilingMiddleware']
+	for path in middleware:
+		timed += ['catalog.profiling.LayerTimer', path]
+	return timed + ['catalog.profiling.LayerTimer']
+
+
+class Profile:
+	"""What one request spent, in seconds."""
+
+	def __init__(self):
+		self.started = time.perf_counter()
+		self.total = 0.0
+		self.queries = 0
+		self.timings = collections.Counter()		# 'sql', 'tpl', 'session'
+		self.depth = collections.Counter()			# nested template renders (includes) and session calls are counted once
+		self.layers = []							# (name, seconds including the layers inside), innermost first
+
+	def metrics(self):
+		"""[(name, milliseconds, description)] in Server-Timing order."""
+		metrics = [('sql', self.timings['sql'], '%d queries' % self.queries), ('tpl', self.timings['tpl'], None),
+				   ('session', self.timings['session'], None)]
+		layers = self.layers[::-1]
+		seen = collections.Counter()
+		for index, (name, elapsed) in enumerate(layers):
+			inner = layers[index + 1][1] if index + 1 < len(layers) else 0.0
+			seen[name] += 1
+			if name != 'view':
+				name = 'mw-%s%s' % (name, '-%d' % seen[name] if seen[name] > 1 else '')		# SessionMiddleware is listed twice
+			metrics.append((name, elapsed - inner, None))
+		metrics.append(('total', self.total, None))
+		return [(name, seconds * 1000, description) for name, seconds, description in metrics]
+
+
+def _timed(function, metric):
+	"""function, adding its time to metric of the request being profiled (the outermost call only, when nested)."""
+	@wraps(function)
+	def wrapper(*args, **kwargs):
+		profile = _current.get()
+		if profile is None or profile.depth[metric]:
+			return function(*args, **kwargs)
+		profile.depth[metric] += 1
+		started = time.perf_counter()
+		try:
+			return function(*args, **kwargs)
+		finally:
+			profile.timings[metric] += time.perf_counter() - started
+			profile.depth[metric] -= 1
+	return wrapper
+
+
+def _patch(owner, name, metric):
+	if (owner, name) not in _patched:
+		setattr(owner, name, _timed(getattr(owner, name), metric))
+		_patched.add((owner, name))
+
+
+def _time_queries(execute, sql, params, many, context):
+	profile = _current.get()
+	started = time.perf_counter()
+	try:
+		return execute(sql, params, many, context)
+	finally:
+		if profile is not None:
+			profile.timings['sql'] += time.perf_counter() - started
+			profile.queries += 1
+
+
+class ProfilingMiddleware:
+	"""Profiles every request and adds the Server-Timing header (see the module docstring). Goes first in MIDDLEWARE."""
+
+	def __init__(self, get_response):
+		self.get_response = get_response
+		_patch(Template, 'render', 'tpl')			# includes render through it too, hence the depth count
+		session_store = import_module(settings.SESSION_ENGINE).SessionStore
+		_patch(session_store, 'load', 'session')
+		_patch(session_store, 'save', 'session')
+
+	def __call__(self, request):
+		profile = Profile()
+		token = _current.set(profile)
+		try:
+			with contextlib.ExitStack() as stack:
+				for connection in connections.all():
+					stack.enter_context(connection.execute_wrapper(_time_queries))
+				response = self.get_response(request)
+		finally:
+			_current.reset(token)
+		profile.total = time.perf_counter() - profile.started
+
+		metrics = profile.metrics()
+		header = ', '.join('%s;dur=%.2f%s' % (name, milliseconds, ';desc="%s"' % description if description else '')
+						   for name, milliseconds, description in metrics)
+		response['Server-Timing'] = '%s, %s' % (response['Server-Timing'], header) if response.has_header('Server-Timing') else header
+
+		rate = getattr(settings, 'CATALOG_PROFILING_LOG_SAMPLE_RATE', 0)
+		if rate and random.random() < rate:
+			logger.info(json.dumps({
+				'method': request.method, 'path': request.path, 'status': response.status_code, 'queries': profile.queries,
+				'ms': {name: round(milliseconds, 2) for name, milliseconds, _ in metrics},
+			}))
+		return response
+
+
+class LayerTimer:
+	"""Times the middleware (or the view) that comes after it in MIDDLEWARE, for ProfilingMiddleware."""
+
+	def __init__(self, get_response):
+		self.get_response = get_response
+		layer = getattr(get_response, '__wrapped__', get_response)		# Django wraps each layer in convert_exception_to_response()
+		if isinstance(layer, LayerTimer):
+			raise MiddlewareNotUsed('The middleware after it is not used.')
+		self.name = 'view' if hasattr(layer, '__func__') else getattr(layer, '__name__', type(layer).__name__)	# the handler's _get_response() is the view
+
+	def __call__(self, request):
+		profile = _current.get()
+		started = time.perf_counter()
+		try:
+			return self.get_response(request)
+		finally:
+			if profile is not None:
+				profile.layers.append((self.name, time.perf_counter() - started))
@@ -0,0 +1,145 @@
+"""The groups (roles) of the current user, resolved at most once per request, or once per session with a shared cache.
+
+RolesMiddleware sets request.roles, which reads the user's group names on first use, with one query. With
+CATALOG_ROLES_CACHE set to a cache shared by every server process (as in settings_production), they are kept in the
+session instead, with version tokens kept in that cache: the receivers in models.py call invalidate() when group
+membership changes (or a group is renamed or deleted), which replaces the tokens, so sessions holding older roles look
+them up again. A cache of one process (LocMemCache) would leave a revoked role in force in the others, so without a
+shared cache the roles are not kept.
+
+Views are protected with the manager_required/administrator_required decorators or the ManagerRequiredMixin/
+AdministratorRequiredMixin classes, and templates get the roles from the context_processor below as {{ roles }}.
+"""
+import uuid
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import Http404
+from django.shortcuts import redirect
+from django.utils.functional import cached_property
+
+MANAGER = 'Manager'
+ADMINISTRATOR = 'Administrator'
+
+SESSION_KEY = '_catalog_roles'
+VERSION_CACHE_KEY = 'catalog:roles:%s'		# per user id, and 'groups' for changes to the groups themselves
+
+
+def _cache():
+	"""The cache of the version tokens (CATALOG_ROLES_CACHE), None if the roles are not kept in the sessions."""
+	alias = getattr(settings, 'CATALOG_ROLES_CACHE', None)
+	return caches[alias] if alias else None
+
+
+def _version(cache, key):
+	"""The current version token of key, created if the cache does not have one (yet, or any more)."""
+	version = cache.get(key)
+	if version is None:
+		cache.add(key, uuid.uuid4().hex, None)
+		version = cache.get(key)
+	return version
+
+
+def invalidate(user_ids=None):
+	"""Make the roles stored in the sessions of these users (of every user if None) stale."""
+	cache = _cache()
+	if cache is None:
+		return
+	if user_ids is None:
+		cache.delete(VERSION_CACHE_KEY % 'groups')
+	else:
+		cache.delete_many([VERSION_CACHE_KEY % user_id for user_id in user_ids])
+
+
+class Roles:
+	"""The group names of request.user, looked up on first use."""
+
+	def __init__(self, request):
+		self.request = request
+
+	@cached_property
+	def names(self):
+		user = self.request.user
+		if not user.is_authenticated:
+			return frozenset()
+		cache = _cache()
+		if cache is None:
+			return frozenset(user.groups.values_list('name', flat=True))
+		version = [_version(cache, VERSION_CACHE_KEY % 'groups'), _version(cache, VERSION_CACHE_KEY % user.pk)]
+		stored = self.request.session.get(SESSION_KEY)
+		if stored and stored[0] == user.pk and stored[1] == version:
+			return frozenset(stored[2])
+		names = sorted(user.groups.values_list('name', flat=True))
+		self.request.session[SESSION_KEY] = [user.pk, version, names]
+		return frozenset(names)
+
+	def __contains__(self, name):
+		return name in self.names
+
+	def __iter__(self):
+		return iter(sorted(self.names))
+
+	@property
+	def is_manager(self):
+		return self.request.user.is_staff and MANAGER in self.names
+
+	@property
+	def is_administrator(self):
+		return self.request.user.is_staff and ADMINISTRATOR in self.names
+
+
+def get_roles(request):
+	"""request.roles, also for requests that did not go through RolesMiddleware."""
+	if not hasattr(request, 'roles'):
+		request.roles = Roles(request)
+	return request.roles
+
+
+class RolesMiddleware:
+	"""Set request.roles. Goes after AuthenticationMiddleware."""
+
+	def __init__(self, get_response):
+		self.get_response = get_response
+
+	def __call__(self, request):
+		request.roles = Roles(request)
+		return self.get_response(request)
+
+
+def context_processor(request):
+	return {'roles': get_roles(request)}
+
+
+def _role_required(check):
+	"""Decorator for function views, sending the users that fail check(roles) to the 404 page."""
+	def decorator(view):
+		@wraps(view)
+		def wrapped(request, *args, **kwargs):
+			if not check(get_roles(request)):
+				return redirect('404')
+			return view(request, *args, **kwargs)
+		return wrapped
+	return decorator
+
+
+manager_required = _role_required(lambda roles: roles.is_manager)
+administrator_required = _role_required(lambda roles: roles.is_administrator)
+
+
+class ManagerRequiredMixin:
+	"""For class-based views: 404 unless the user is a manager."""
+
+	def dispatch(self, request, *args, **kwargs):
+		if not get_roles(request).is_manager:
+			raise Http404
+		return super().dispatch(request, *args, **kwargs)
+
+
+class AdministratorRequiredMixin:
+	"""For class-based views: 404 unless the user is an administrator."""
+
+	def dispatch(self, request, *args, **kwargs):
+		if not get_roles(request).is_administrator:
+			raise Http404
+		return super().dispatch(request, *args, **kwargs)
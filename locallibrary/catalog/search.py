@@ -0,0 +1,113 @@
+"""Full-text search over the book catalog, backed by an SQLite FTS5 index.
+
+The index lives in the virtual table ``catalog_book_fts`` (created by migration 0014) and holds one row per book,
+keyed by the book id, with the title, summary, publisher and author names. The receivers in models.py keep it in sync.
+On database backends other than SQLite, searching falls back to the plain title substring filter.
+"""
+import re
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+FTS_TABLE = 'catalog_book_fts'
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+AUTHOR_NAMES_SQL = (
+	"SELECT group_concat(a.first_name || ' ' || a.last_name, ' ') "
+	"FROM catalog_author a INNER JOIN catalog_book_author ba ON ba.author_id = a.id "
+	"WHERE ba.book_id = b.id"
+)
+
+# (re)index every book in one statement, used by the migration and the rebuild_search_index command
+REBUILD_SQL = (
+	"INSERT INTO " + FTS_TABLE + " (rowid, title, summary, publisher, authors) "
+	"SELECT b.id, b.title, b.summary, b.publisher, COALESCE((" + AUTHOR_NAMES_SQL + "), '') FROM catalog_book b"
+)
+
+
+def is_enabled():
+	"""Return True if the FTS5 index can be used on the default database."""
+	return connection.vendor == 'sqlite'
+
+
+def build_match_query(text):
+	"""Turn free text from the search box into a safe FTS5 MATCH expression.
+
+	Every word becomes a quoted prefix term, so 'harry pot' finds 'Harry Potter' and FTS5 operators
+	typed by the user (AND, NEAR, quotes, column filters) are matched literally instead of being parsed.
+	Returns an empty string if the text has no searchable words.
+	"""
+	return ' '.join('"%s"*' % token for token in TOKEN_RE.findall(text or ''))
+
+
+def search_books(queryset, text):
+	"""Filter a Book queryset to the books matching the text, ordered by relevance (best match first)."""
+	if not is_enabled():
+		return queryset.filter(Q(title__icontains=text))
+
+	match = build_match_query(text)
+	if not match:
+		return queryset.none()
+
+	# join the index on the book id; "rank" is bm25() with the column weights set up by the migration
+	return queryset.extra(
+		tables=[FTS_TABLE],
+		where=['%s.rowid = catalog_book.id' % FTS_TABLE, '%s MATCH %%s' % FTS_TABLE],
+		params=[match],
+		select={'search_rank': '%s.rank' % FTS_TABLE},
+	).order_by('search_rank', 'title')			# bm25() is negative, the lower the better
+
+
+def filter_books(queryset, text):
+	"""Filter a Book queryset to the books matching the text, unordered. Unlike search_books() the result can be used
+	in subqueries and aggregates (e.g. the facet counts)."""
+	if not is_enabled():
+		return queryset.filter(Q(title__icontains=text))
+
+	match = build_match_query(text)
+	if not match:
+		return queryset.none()
+	return queryset.filter(pk__in=RawSQL('SELECT rowid FROM %s WHERE %s MATCH %%s' % (FTS_TABLE, FTS_TABLE), [match]))
+
+
+def _chunks(book_ids, size=500):
+	"""Split the ids so a statement never goes over SQLite's limit on query parameters."""
+	book_ids = sorted(set(int(book_id) for book_id in book_ids))
+	for start in range(0, len(book_ids), size):
+		yield book_ids[start:start + size]
+
+
+def index_books(book_ids):
+	"""Refresh the index rows of the given books (books that no longer exist are dropped from the index)."""
+	if not is_enabled():
+		return
+
+	with connection.cursor() as cursor:
+		for chunk in _chunks(book_ids):
+			placeholders = ', '.join(['%s'] * len(chunk))
+			cursor.execute('DELETE FROM %s WHERE rowid IN (%s)' % (FTS_TABLE, placeholders), chunk)
+			cursor.execute(REBUILD_SQL + ' WHERE b.id IN (%s)' % placeholders, chunk)
+
+
+def unindex_books(book_ids):
+	"""Remove the given books from the index."""
+	if not is_enabled():
+		return
+
+	with connection.cursor() as cursor:
+		for chunk in _chunks(book_ids):
+			cursor.execute('DELETE FROM %s WHERE rowid IN (%s)' % (FTS_TABLE, ', '.join(['%s'] * len(chunk))), chunk)
+
+
+def rebuild_index():
+	"""Drop and refill the whole index from the catalog tables. Returns the number of indexed books."""
+	if not is_enabled():
+		return 0
+
+	with connection.cursor() as cursor:
+		cursor.execute('DELETE FROM %s' % FTS_TABLE)
+		cursor.execute(REBUILD_SQL)
+		cursor.execute('SELECT count(*) FROM %s' % FTS_TABLE)
+		return cursor.fetchone()[0]
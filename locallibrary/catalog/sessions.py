@@ -0,0 +1,45 @@
+"""Session engine that keeps frequently changing bookkeeping out of the session table (SESSION_ENGINE = 'catalog.sessions').
+
+Like Django's cached_db engine, sessions are read from the cache and fall back to the database. Unlike it, a save that
+only changes VOLATILE_KEYS (the activity timestamp of django_session_timeout and the homepage visit counter) goes to the
+cache only, and reaches the database at most every CATALOG_SESSION_DB_WRITE_INTERVAL seconds (default 300). Any other
+change (login, messages, roles, ...) is written through to the database right away, as with cached_db.
+
+If the cache loses a session, it is read back from the database with the volatile keys as of the last database write,
+so a user may be timed out up to CATALOG_SESSION_DB_WRITE_INTERVAL seconds early. The cache of SESSION_CACHE_ALIAS has
+to be shared by every server process (files on one host, memcached across hosts; not the per-process LocMemCache) and
+kept for the sessions alone, as in settings_production: otherwise a logout in one process is not seen by the others, and
+cached timestamps not yet written are lost whenever other keys push the session out.
+"""
+import time
+
+from django.conf import settings
+from django.contrib.sessions.backends.cached_db import SessionStore as CachedDBStore
+
+VOLATILE_KEYS = frozenset(['_session_init_timestamp_', 'num_visits'])
+DB_SAVED_KEY = '_catalog_db_saved'		# when the session was last written to the database
+
+
+def _persistent(data):
+	"""The part of the session data whose changes are written to the database right away."""
+	return {key: value for key, value in data.items() if key not in VOLATILE_KEYS and key != DB_SAVED_KEY}
+
+
+class SessionStore(CachedDBStore):
+	cache_key_prefix = 'catalog.sessions'
+
+	def load(self):
+		data = super().load()
+		self._loaded = _persistent(data)
+		return data
+
+	def save(self, must_create=False):
+		data = self._get_session(no_load=must_create)
+		interval = getattr(settings, 'CATALOG_SESSION_DB_WRITE_INTERVAL', 300)
+		if (must_create or self.session_key is None or _persistent(data) != getattr(self, '_loaded', None)
+				or time.time() - data.get(DB_SAVED_KEY, 0) >= interval):
+			data[DB_SAVED_KEY] = int(time.time())
+			super().save(must_create)
+			self._loaded = _persistent(data)
+		else:
+			self._cache.set(self.cache_key, data, self.get_expiry_age())
@@ -0,0 +1,149 @@
+"""Static files served by the WSGI application itself, fingerprinted and pre-compressed.
+
+collectstatic (with STATICFILES_STORAGE = 'catalog.staticfiles.CompressedManifestStaticFilesStorage') copies every
+file to STATIC_ROOT under a content-hashed name (css/style.55e7cbef7b8d.css) and writes gzip (.gz) and, if the optional
+brotli package is installed, brotli (.br) copies next to the compressible ones.
+
+StaticFilesApplication wraps the Django WSGI application (see locallibrary/wsgi.py) and answers requests under
+STATIC_URL from an index of STATIC_ROOT built at startup: it picks the smallest encoding the client accepts, and marks
+hashed files as cacheable forever since their content can never change under the same name.
+"""
+import gzip
+import mimetypes
+import os
+import re
+from email.utils import formatdate
+from wsgiref.util import FileWrapper
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+try:
+	import brotli
+except ImportError:		# brotli is optional, gzip is always available
+	brotli = None
+
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.map', '.svg', '.txt', '.html', '.json', '.xml', '.ttf', '.otf', '.eot', '.ico')
+
+# ManifestStaticFilesStorage inserts the first 12 hex digits of the md5 of the content before the extension
+HASHED_NAME_RE = re.compile(r'\.[0-9a-f]{12}\.[^./]+$')
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'		# one year, the most browsers honour
+DEFAULT_CACHE_CONTROL = 'public, max-age=60'
+
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))		# in order of preference
+
+
+def compress_file(path):
+	"""Write path.gz (and path.br) next to path if that makes it smaller. Returns the names of the files written."""
+	with open(path, 'rb') as original:
+		data = original.read()
+
+	written = []
+	variants = [('.gz', lambda: gzip.compress(data, compresslevel=9, mtime=0))]
+	if brotli is not None:
+		variants.append(('.br', lambda: brotli.compress(data, quality=11)))
+	for suffix, compress in variants:
+		compressed = compress()
+		if len(compressed) < len(data) * 0.95:		# not worth a second request variant otherwise
+			with open(path + suffix, 'wb') as target:
+				target.write(compressed)
+			written.append(path + suffix)
+	return written
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+	"""ManifestStaticFilesStorage that also writes the gzip/brotli copies at collectstatic time."""
+
+	manifest_strict = False
+
+	def hashed_name(self, name, content=None, filename=None):
+		try:
+			return super().hashed_name(name, content, filename)
+		except ValueError:		# not collected (e.g. while testing) or referenced by a vendor stylesheet but not shipped
+			return name
+
+	def post_process(self, paths, dry_run=False, **options):
+		yield from super().post_process(paths, dry_run, **options)
+		if dry_run:
+			return
+		for name in set(paths) | set(self.hashed_files.values()):
+			if name.endswith(COMPRESSIBLE_EXTENSIONS) and self.exists(name):
+				compress_file(self.path(name))
+
+
+class StaticFile:
+	"""A file under STATIC_ROOT with its precompressed variants."""
+
+	def __init__(self, path, url_path):
+		self.content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+		if self.content_type.startswith('text/') or self.content_type in ('application/javascript', 'application/json'):
+			self.content_type += '; charset=utf-8'
+		self.cache_control = IMMUTABLE_CACHE_CONTROL if HASHED_NAME_RE.search(url_path) else DEFAULT_CACHE_CONTROL
+		self.variants = {}
+		for encoding, suffix in ENCODINGS + ((None, ''),):
+			if os.path.isfile(path + suffix):
+				stat = os.stat(path + suffix)
+				self.variants[encoding] = (path + suffix, stat.st_size, '"%x-%x%s"' % (int(stat.st_mtime), stat.st_size, suffix))
+		self.last_modified = formatdate(os.stat(path).st_mtime, usegmt=True)
+
+	def choose(self, accept_encoding):
+		"""(encoding, (path, size, etag)) of the smallest variant the client accepts."""
+		accepted = set()
+		for part in accept_encoding.split(','):
+			coding, _, params = part.strip().partition(';')
+			if params.replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+				accepted.add(coding.strip().lower())
+		for encoding, _ in ENCODINGS:
+			if encoding in self.variants and (encoding in accepted or '*' in accepted):
+				return encoding, self.variants[encoding]
+		return None, self.variants[None]
+
+
+class StaticFilesApplication:
+	"""WSGI middleware serving STATIC_ROOT under STATIC_URL, and passing every other request to the Django application."""
+
+	def __init__(self, application, root, prefix):
+		self.application = application
+		self.prefix = prefix
+		self.files = self.scan(root, prefix) if root and os.path.isdir(root) else {}
+
+	@staticmethod
+	def scan(root, prefix):
+		"""Index every file of root by its URL path. Files collected after startup are served once the process restarts."""
+		files = {}
+		compressed = tuple(suffix for _, suffix in ENCODINGS)
+		for directory, _, names in os.walk(root):
+			for name in names:
+				if name.endswith(compressed) and os.path.isfile(os.path.join(directory, name[:-3])):
+					continue		# served as a variant of the uncompressed file
+				path = os.path.join(directory, name)
+				url_path = prefix + os.path.relpath(path, root).replace(os.sep, '/')
+				files[url_path] = StaticFile(path, url_path)
+		return files
+
+	def __call__(self, environ, start_response):
+		static_file = self.files.get(environ.get('PATH_INFO', '')) if self.files else None
+		if static_file is None or environ['REQUEST_METHOD'] not in ('GET', 'HEAD'):
+			return self.application(environ, start_response)
+
+		encoding, (path, size, etag) = static_file.choose(environ.get('HTTP_ACCEPT_ENCODING', ''))
+		headers = [
+			('Cache-Control', static_file.cache_control),
+			('ETag', etag),
+			('Last-Modified', static_file.last_modified),
+		]
+		if len(static_file.variants) > 1:
+			headers.append(('Vary', 'Accept-Encoding'))
+
+		if etag in environ.get('HTTP_IF_NONE_MATCH', ''):
+			start_response('304 Not Modified', headers)
+			return []
+
+		headers += [('Content-Type', static_file.content_type), ('Content-Length', str(size))]
+		if encoding:
+			headers.append(('Content-Encoding', encoding))
+		start_response('200 OK', headers)
+		if environ['REQUEST_METHOD'] == 'HEAD':
+			return []
+		file_wrapper = environ.get('wsgi.file_wrapper', FileWrapper)
+		return file_wrapper(open(path, 'rb'), 64 * 1024)
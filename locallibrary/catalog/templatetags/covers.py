@@ -0,0 +1,38 @@
+from django import template
+from django.utils.html import format_html, format_html_join
+
+from catalog import covers
+
+register = template.Library()
+
+
+@register.simple_tag
+def cover_url(book, width=320):
+	"""URL of the book cover resized to at least width pixels, e.g. for CSS backgrounds: {% cover_url book 320 %}"""
+	if book is None:		# the copies and reviews of a deleted book keep a null book
+		return ''
+	return covers.cover_url(book.book_cover.name, width)
+
+
+@register.simple_tag
+def cover_picture(book, sizes='100vw', width=320, **attrs):
+	"""<picture> with WebP and JPEG srcsets of the book cover, e.g. {% cover_picture book sizes="150px" style="width: 100px" %}
+
+	width picks the JPEG used as the <img> src for browsers without srcset support.
+	Extra keyword arguments become attributes of the <img>. Nothing for no book (as for a copy of a deleted book).
+	"""
+	if book is None:
+		return ''
+	name = book.book_cover.name
+	img_attrs = format_html_join('', ' {}="{}"', ((key.replace('_', '-'), value) for key, value in sorted(attrs.items())))
+	webp = covers.variant_urls(name, 'webp')
+	if not webp:
+		return format_html('<img src="{}" alt="{}"{}>', covers.cover_url(name, width), book.title, img_attrs)
+
+	def srcset(extension):
+		return ', '.join('%s %dw' % (url, variant_width) for variant_width, url in covers.variant_urls(name, extension))
+
+	return format_html(
+		'<picture><source type="image/webp" srcset="{}" sizes="{}">'
+		'<img src="{}" srcset="{}" sizes="{}" alt="{}"{}></picture>',
+		srcset('webp'), sizes, covers.cover_url(name, width), srcset('jpg'), sizes, book.title, img_attrs)
@@ -0,0 +1,37 @@
+from django import template
+from django.utils.safestring import mark_safe
+
+from catalog import fragments
+
+register = template.Library()
+
+
+class FragmentNode(template.Node):
+	def __init__(self, nodelist, name, vary_on):
+		self.nodelist = nodelist
+		self.name = name
+		self.vary_on = vary_on
+
+	def render(self, context):
+		def render():
+			with context.push(csrf_token=fragments.CSRF_PLACEHOLDER):		# the token of whoever renders it first must not be cached
+				return self.nodelist.render(context)
+
+		content = fragments.get_or_render(self.name.resolve(context), [value.resolve(context) for value in self.vary_on], render)
+		if fragments.CSRF_PLACEHOLDER in content:
+			content = content.replace(fragments.CSRF_PLACEHOLDER, str(context.get('csrf_token', '')))
+		return mark_safe(content)
+
+
+@register.tag
+def fragment(parser, token):
+	"""Cache the enclosed block under its name and the values it varies on:
+
+		{% fragment 'book-card' book.pk book.last_modified roles.is_manager %} ... {% endfragment %}
+	"""
+	bits = token.split_contents()
+	if len(bits) < 2:
+		raise template.TemplateSyntaxError("'%s' takes at least one argument (the fragment name)" % bits[0])
+	nodelist = parser.parse(('endfragment',))
+	parser.delete_first_token()
+	return FragmentNode(nodelist, parser.compile_filter(bits[1]), [parser.compile_filter(bit) for bit in bits[2:]])
@@ -1,3 +1,1218 @@
-from django.test import TestCase
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.conf import settings
 
 # Create your tests here.
+from django.contrib.admin.models import LogEntry, ADDITION, CHANGE
+from django.contrib.auth.models import Group, User
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import caches
+from axes.models import AccessAttempt
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.urls import reverse
+from unittest import mock, skipUnless
+import contextlib
+import datetime
+import json
+from decimal import Decimal
+
+from django.core.management import call_command
+from io import BytesIO, StringIO
+from django.core.files.storage import FileSystemStorage
+from django.template import Context, Engine, Template, engines
+from PIL import Image
+import os
+import shutil
+import tempfile
+
+from catalog.models import Author, Book, BookInstance, Review
+from catalog import (audit, autocomplete, benchdata, changes, counters, covers, dashboard, facets, fragments, loans, profiling, roles,
+					 search, sessions, warmup)
+from catalog.staticfiles import StaticFilesApplication, compress_file
+from catalog.views import BookListView, LOGS_PER_PAGE
+
+
+def create_books(count, authors_per_book=2):
+	"""Add count books, each written by its own authors_per_book authors."""
+	for i in range(count):
+		book = Book.objects.create(title='Book %d' % i, publisher='Publisher', isbn='9780000000000', summary='Summary')
+		for j in range(authors_per_book):
+			book.author.add(Author.objects.create(first_name='First %d' % j, last_name='Last %d' % i))
+
+
+@skipUnless(search.is_enabled(), 'The search index needs SQLite FTS5')
+class SearchIndexTest(TestCase):
+	"""The receivers keep the full-text index in step with the books and their authors."""
+
+	def setUp(self):
+		self.author = Author.objects.create(first_name='Jose', last_name='Rizal')
+		self.book = Book.objects.create(title='Noli Me Tangere', summary='A novel', publisher='Berliner', isbn='9789710810736')
+		self.book.author.add(self.author)
+
+	def found(self, text):
+		return list(search.search_books(Book.objects.all(), text))
+
+	def test_book_changes(self):
+		self.assertEqual(self.found('tangere'), [self.book])
+		self.book.title = 'El Filibusterismo'
+		self.book.save()
+		self.assertEqual(self.found('filibusterismo'), [self.book])
+		self.assertEqual(self.found('tangere'), [])
+		self.book.delete()
+		self.assertEqual(self.found('filibusterismo'), [])
+
+	def test_author_changes(self):
+		self.assertEqual(self.found('rizal'), [self.book])
+		self.author.last_name = 'Mercado'
+		self.author.save()
+		self.assertEqual(self.found('mercado'), [self.book])
+		self.assertEqual(self.found('rizal'), [])
+
+		other = Author.objects.create(first_name='Andres', last_name='Bonifacio')
+		self.book.author.set([other])
+		self.assertEqual(self.found('bonifacio'), [self.book])
+		self.assertEqual(self.found('mercado'), [])
+		other.book_set.clear()		# from the author's side
+		self.assertEqual(self.found('bonifacio'), [])
+		self.author.book_set.add(self.book)
+		self.assertEqual(self.found('mercado'), [self.book])
+		self.author.delete()
+		self.assertEqual(self.found('mercado'), [])
+
+	def test_prefix_and_ranking(self):
+		in_summary = Book.objects.create(title='Essays', summary='On the Noli', isbn='9780000000001')
+		self.assertEqual(self.found('nol'), [self.book, in_summary])		# a title match ranks first
+		self.assertEqual(self.found('noli tang'), [self.book])				# every word has to match
+		self.assertEqual(self.found('"noli" OR essays'), [])				# operators are matched as words
+		self.assertEqual(self.found('!!'), [])
+
+	def test_rebuild_command(self):
+		with connection.cursor() as cursor:
+			cursor.execute('DELETE FROM %s' % search.FTS_TABLE)
+		self.assertEqual(self.found('tangere'), [])
+		out = StringIO()
+		call_command('rebuild_search_index', stdout=out)
+		self.assertIn('Indexed 1 books.', out.getvalue())
+		self.assertEqual(self.found('rizal tangere'), [self.book])
+
+
+@override_settings(CATALOG_ROLES_CACHE='default')		# the roles kept in the session, as in production
+class BookListQueryBudgetTest(TestCase):
+	"""The book list page must run the same number of queries however many books are shown."""
+
+	# session, user, validators (newest book and number of books), count, page of books, authors of the page (the roles
+	# are kept in the session)
+	QUERY_BUDGET = 6
+
+	@classmethod
+	def setUpTestData(cls):
+		cls.manager = User.objects.create_user('manager', password='password', is_staff=True)
+		Group.objects.create(name='Manager').user_set.add(cls.manager)
+
+	def count_queries(self, path):
+		self.client.get(path)		# the first request of a session also saves the session-timeout timestamp
+		with CaptureQueriesContext(connection) as queries:
+			response = self.client.get(path)
+		self.assertEqual(response.status_code, 200)
+		return len(queries)
+
+	def test_query_budget_for_manager(self):
+		self.client.force_login(self.manager)
+		create_books(3)
+		self.assertLessEqual(self.count_queries(reverse('books')), self.QUERY_BUDGET)
+
+	def test_query_count_independent_of_catalog_size_and_page_size(self):
+		self.client.force_login(self.manager)
+		create_books(2)
+		baseline = self.count_queries(reverse('books'))
+
+		create_books(30)
+		self.assertEqual(self.count_queries(reverse('books')), baseline)
+		with mock.patch.object(BookListView, 'paginate_by', 30):
+			self.assertEqual(self.count_queries(reverse('books')), baseline)
+			self.assertEqual(self.count_queries(reverse('books') + '?q=book'), baseline)
+
+	def test_query_count_for_anonymous_user(self):
+		create_books(2)
+		baseline = self.count_queries(reverse('books'))
+		create_books(20)
+		self.assertEqual(self.count_queries(reverse('books')), baseline)
+
+
+class AuthorDetailTest(TestCase):
+	"""The author page lists a page of books with their copy counts in a fixed number of queries."""
+
+	# last change of the author and their books (for the ETag), author, count, page of books
+	QUERY_BUDGET = 4
+
+	def setUp(self):
+		self.author = Author.objects.create(first_name='Terry', last_name='Pratchett')
+
+	def add_books(self, count):
+		for i in range(count):
+			book = Book.objects.create(title='Book %02d' % i, publisher='Publisher', isbn='9780000000000', summary='Summary')
+			book.author.add(self.author)
+			BookInstance.objects.create(book=book)
+			BookInstance.objects.create(book=book, status='r')
+
+	def test_query_budget(self):
+		self.add_books(3)
+		with self.assertNumQueries(self.QUERY_BUDGET):
+			self.client.get(reverse('author-detail', args=[self.author.pk]))
+		self.add_books(30)
+		with self.assertNumQueries(self.QUERY_BUDGET):
+			response = self.client.get(reverse('author-detail', args=[self.author.pk]), {'page': 2})
+		self.assertEqual(response.context['author'], self.author)
+		self.assertEqual(response.context['page_obj'].paginator.count, 33)
+		self.assertEqual([book.title for book in response.context['object_list']][:2], ['Book 07', 'Book 08'])		# after 00-02 twice
+		self.assertContains(response, '2 copies found, 1 available')
+
+	def test_unknown_author(self):
+		self.assertTemplateUsed(self.client.get(reverse('author-detail', args=[self.author.pk + 1])), '404.html')
+
+
+class ConditionalGetTest(TestCase):
+	"""The book and author pages answer revalidations with a 304 until something they show changes, per user."""
+
+	def setUp(self):
+		self.author = Author.objects.create(first_name='Terry', last_name='Pratchett')
+		self.book = Book.objects.create(title='Mort', publisher='Gollancz', isbn='9780575038356', summary='Summary')
+		self.book.author.add(self.author)
+		self.member = User.objects.create_user('member', password='password')
+
+	def assertRevalidates(self, url, fresh=True):
+		"""Get url, change things in the with block, then check whether a revalidation gets a 304."""
+		response = self.client.get(url)
+		self.assertEqual(response.status_code, 200)
+		self.assertIn('Cookie', response['Vary'])
+		yield
+		status = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code
+		self.assertEqual(status, 304 if fresh else 200)
+
+	def revalidation(self, url, fresh=True):
+		return contextlib.contextmanager(self.assertRevalidates)(url, fresh)
+
+	def test_book_page(self):
+		url = reverse('book-detail', args=[self.book.pk])
+		with self.revalidation(url):
+			Book.objects.create(title='Other', publisher='Publisher', isbn='9780000000000', summary='Summary')
+		with self.revalidation(url, fresh=False):
+			copy = BookInstance.objects.create(book=self.book)
+		with self.revalidation(url, fresh=False):
+			copy.due_back = datetime.date(2030, 1, 1)		# not counted, still shown
+			copy.save()
+		with self.revalidation(url, fresh=False):
+			Review.objects.create(book=self.book, user=self.member, rating=4, review='Review')
+		with self.revalidation(url, fresh=False):
+			self.author.first_name = 'T.'
+			self.author.save()
+		with self.revalidation(url, fresh=False):
+			self.client.force_login(self.member)		# another user gets another page
+
+	def test_author_page(self):
+		url = reverse('author-detail', args=[self.author.pk])
+		with self.revalidation(url, fresh=False):
+			loans.add_copies(self.book.pk, 2)		# the counts of the book change
+		with self.revalidation(url, fresh=False):
+			self.book.delete()
+		with self.revalidation(url):
+			Author.objects.create(first_name='Neil', last_name='Gaiman')
+		etag = self.client.get(url)['ETag']
+		with self.assertNumQueries(1):
+			response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+		self.assertEqual(response.status_code, 304)
+
+	def test_book_list(self):
+		Book.objects.create(title='Eric', publisher='Gollancz', isbn='9780575046368', summary='Summary')
+		with self.revalidation(reverse('books') + '?q=mort', fresh=False):
+			self.book.delete()		# not the newest book
+		with self.revalidation(reverse('books')):
+			pass
+		self.assertFalse(self.client.get(reverse('books')).has_header('Last-Modified'))		# it could not show deletions
+
+	def test_changes_made_by_other_processes(self):
+		"""The validators come from the database, not from what this process saw change (its own cache)."""
+		with mock.patch.object(changes, 'catalog_changed'):
+			with self.revalidation(reverse('books'), fresh=False):
+				self.book.title = 'Reaper Man'
+				self.book.save()
+			with self.revalidation(reverse('books'), fresh=False):
+				Review.objects.create(book=self.book, user=self.member, rating=4, review='Review')
+
+
+class FragmentCacheTest(TestCase):
+	"""Book cards, copies and profile reviews are rendered once per change and role, and shared between users."""
+
+	def setUp(self):
+		fragments.get_cache().clear()
+		fragments.reset_stats()
+		self.book = Book.objects.create(title='Mort', publisher='Gollancz', isbn='9780575038356', summary='Summary')
+		self.book.author.add(Author.objects.create(first_name='Terry', last_name='Pratchett'))
+		BookInstance.objects.create(book=self.book)
+		self.first = User.objects.create_user('first', password='password')
+		self.second = User.objects.create_user('second', password='password')
+
+	def test_book_card(self):
+		self.client.get(reverse('books'))
+		self.client.force_login(self.first)
+		self.assertContains(self.client.get(reverse('books')), 'Mort')
+		self.assertEqual(fragments.stats()['book-card'], {'hits': 1, 'misses': 1})		# same role as anonymous users
+		author = self.book.author.get()
+		author.last_name = 'Pratchett Jr.'
+		author.save()
+		self.assertContains(self.client.get(reverse('books')), 'Pratchett Jr.')
+		self.assertEqual(fragments.stats()['book-card'], {'hits': 1, 'misses': 2})
+
+	def test_copies_with_csrf_token(self):
+		url = reverse('book-detail', args=[self.book.pk])
+		tokens = []
+		for user in (self.first, self.second):
+			client = Client()
+			client.force_login(user)
+			response = client.get(url)
+			self.assertContains(response, 'borrow copy')
+			self.assertNotContains(response, fragments.CSRF_PLACEHOLDER)
+			self.assertContains(response, 'value="%s"' % response.context['csrf_token'])
+			tokens.append(client.cookies['csrftoken'].value)
+		self.assertNotEqual(tokens[0], tokens[1])
+		self.assertEqual(fragments.stats()['book-copies'], {'hits': 1, 'misses': 1})
+		self.book.bookinstance_set.update(status='r', due_back=datetime.date(2030, 1, 2))
+		self.book.save()
+		self.assertNotContains(self.client.get(url), 'borrow copy')
+
+	def test_profile_reviews(self):
+		Review.objects.create(book=self.book, user=self.first, rating=4, review='Very good')
+		self.client.force_login(self.first)
+		url = reverse('user-profile', args=['first'])
+		self.client.get(url)
+		self.book.title = 'Mort (new edition)'
+		self.book.save()
+		self.assertContains(self.client.get(url), 'Mort (new edition)')
+		self.assertEqual(fragments.stats()['profile-review'], {'hits': 0, 'misses': 2})
+		self.assertContains(self.client.get(url), 'Very good')
+		self.assertEqual(fragments.stats()['profile-review'], {'hits': 1, 'misses': 2})
+
+
+class FacetsTest(TestCase):
+	"""The book list is filtered by the facets in the query string, and each facet counts the books of its values."""
+
+	def setUp(self):
+		self.pratchett = Author.objects.create(first_name='Terry', last_name='Pratchett')
+		self.gaiman = Author.objects.create(first_name='Neil', last_name='Gaiman')
+		for i in range(15):
+			book = Book.objects.create(title='Discworld %02d' % i, publisher='Gollancz', year=1983 + i, call_number=823,
+									   isbn='9780000000000', summary='Summary')
+			book.author.add(self.pratchett)
+			if i % 3 == 0:
+				BookInstance.objects.create(book=book)
+		book = Book.objects.create(title='Good Omens', publisher='Workman', year=1990, call_number=823,
+								   isbn='9780000000000', summary='Summary')
+		book.author.add(self.pratchett, self.gaiman)
+		Book.objects.create(title='Cosmos', publisher='Random House', year=1980, call_number=520, isbn='9780000000000',
+							summary='Summary')
+
+	def facet(self, response, name):
+		facet = [facet for facet in response.context['facets'] if facet['name'] == name]
+		return {value['label']: value['count'] for value in facet[0]['values']} if facet else {}
+
+	def test_filters_and_counts(self):
+		response = self.client.get(reverse('books'), {'dewey': '800', 'year': '1950-1999'})
+		self.assertEqual(response.context['page_obj'].paginator.count, 16)		# Discworld and Good Omens
+		self.assertEqual(self.facet(response, 'dewey'), {'500 Science': 1, '800 Literature': 16})		# Cosmos is from 1980
+		self.assertEqual(self.facet(response, 'year'), {'1950 - 1999': 16})
+		self.assertEqual(self.facet(response, 'available'), {'Available now': 5})
+		self.assertEqual(self.facet(response, 'publisher'), {'Gollancz': 15, 'Workman': 1})
+		self.assertEqual(self.facet(response, 'author'), {'Pratchett, Terry': 16, 'Gaiman, Neil': 1})
+
+		response = self.client.get(reverse('books'), {'author': self.gaiman.pk, 'available': '1', 'year': 'bogus'})
+		self.assertEqual(response.context['page_obj'].paginator.count, 0)
+		self.assertEqual(self.facet(response, 'available'), {})
+
+	def test_pages_keep_the_filters(self):
+		response = self.client.get(reverse('books'), {'publisher': 'Gollancz'})
+		self.assertEqual(response.context['page_obj'].paginator.count, 15)
+		self.assertContains(response, '?publisher=Gollancz&page=2')
+		response = self.client.get(reverse('books'), {'publisher': 'Gollancz', 'page': 2})
+		self.assertEqual(len(response.context['book_list']), 3)
+
+	def test_counts_cached_until_catalog_changes(self):
+		self.client.get(reverse('books'))
+		with self.assertNumQueries(0):
+			facets.get_counts({})
+		facets.invalidate()
+		with self.assertNumQueries(3):		# the bucket facets, publishers, authors
+			facets.get_counts({})
+		Book.objects.create(title='Sandman', publisher='DC', year=1989, isbn='9780000000000', summary='Summary')
+		self.assertEqual(dict((label, count) for value, label, count in facets.get_counts({})['publisher'])['DC'], 1)
+
+
+@override_settings(CATALOG_AUTOCOMPLETE_CACHE='default')		# one test process: its own cache is shared by all of it
+class AutocompleteTest(TestCase):
+	"""Search box suggestions come from the in-memory prefix index, which follows saves and deletes."""
+
+	def setUp(self):
+		autocomplete.invalidate()		# rebuilt from this test's database on first use
+		self.book = Book.objects.create(title='The Colour of Magic', publisher='Colin Smythe', isbn='9780861403240',
+										summary='Summary')
+		self.author = Author.objects.create(first_name='Terry', last_name='Pratchett')
+
+	def suggest(self, text):
+		return [result['label'] for result in self.client.get(reverse('autocomplete'), {'q': text}).json()['results']]
+
+	def test_lookup(self):
+		self.assertEqual(self.suggest('the col'), ['The Colour of Magic'])
+		with self.assertNumQueries(0):
+			self.assertEqual(autocomplete.lookup('MAGIC'), [(autocomplete.BOOK, self.book.pk, 'The Colour of Magic')])
+			self.assertEqual(autocomplete.lookup('978086'), [(autocomplete.BOOK, self.book.pk, 'The Colour of Magic')])
+			self.assertEqual(autocomplete.lookup('pratchett t'), [(autocomplete.AUTHOR, self.author.pk, 'Pratchett, Terry')])
+			self.assertEqual(autocomplete.lookup('of'), [])		# short words only as part of the whole title
+		self.assertEqual(self.client.get(reverse('autocomplete'), {'q': 'terry'}).json()['results'][0]['url'],
+						 reverse('author-detail', args=[self.author.pk]))
+
+	def test_follows_changes(self):
+		autocomplete.warm()
+		self.book.title = 'Mort'
+		self.book.save()
+		self.author.delete()
+		with self.assertNumQueries(0):
+			self.assertEqual(autocomplete.lookup('colour'), [])
+			self.assertEqual(autocomplete.lookup('mo'), [(autocomplete.BOOK, self.book.pk, 'Mort')])
+			self.assertEqual(autocomplete.lookup('terry'), [])
+
+	@override_settings(CATALOG_AUTOCOMPLETE_CACHE=None)
+	def test_follows_changes_of_other_processes(self):
+		self.assertEqual(autocomplete.lookup('mag'), [(autocomplete.BOOK, self.book.pk, 'The Colour of Magic')])
+		with mock.patch.object(autocomplete, '_changed'):		# made by another process
+			Book.objects.create(title='Mort', summary='Summary', isbn='9780552131063')
+			self.book.delete()
+		with self.assertNumQueries(4):		# the version of the books and of the authors, then the rebuild
+			self.assertEqual(autocomplete.lookup('mag'), [])
+		with self.assertNumQueries(2):
+			self.assertEqual([label for _, _, label in autocomplete.lookup('mort')], ['Mort'])
+
+	def test_bench_autocomplete(self):
+		Book.objects.all().delete()		# an empty database, filled with generated books
+		out = StringIO()
+		with mock.patch.object(benchdata, 'separate_database', return_value=contextlib.nullcontext()) as separate_database:
+			call_command('bench_autocomplete', books='20', lookups=10, stdout=out)
+		separate_database.assert_called_once()		# not the configured database
+		self.assertEqual(Book.objects.count(), 20)
+		self.assertIn('lookup: median', out.getvalue())
+
+	def test_shared_cache_in_production(self):
+		from locallibrary import settings as development, settings_production as production
+		self.assertIsNone(development.CATALOG_AUTOCOMPLETE_CACHE)
+		backend = production.CACHES[production.CATALOG_AUTOCOMPLETE_CACHE]['BACKEND']
+		self.assertNotEqual(backend, 'django.core.cache.backends.locmem.LocMemCache')		# seen by every server process
+
+	@override_settings(CATALOG_AUTOCOMPLETE_MAX_ENTRIES=5)
+	def test_bounded(self):
+		autocomplete.invalidate()
+		stats = autocomplete.stats()
+		self.assertEqual((stats['books'], stats['authors'], stats['dropped']), (1, 0, 1))		# 4 entries for the book
+		self.assertLessEqual(stats['entries'], 5)
+		self.assertGreater(stats['bytes'], 0)
+
+
+class ApiTest(TestCase):
+	"""The JSON API loads only the fields asked for, pages with a cursor and answers unchanged polls with a 304."""
+
+	def setUp(self):
+		self.author = Author.objects.create(first_name='Terry', last_name='Pratchett')
+		for number in range(5):
+			book = Book.objects.create(title='Book %d' % number, publisher='Publisher', year=1990 + number,
+									   isbn='978000000000%d' % number, summary='Summary')
+			book.author.add(self.author)
+		self.book = book
+		BookInstance.objects.create(book=book, status='a')
+
+	def test_fields(self):
+		with self.assertNumQueries(3):		# the validators, the books, and their authors
+			results = self.client.get(reverse('api-books'), {'fields': 'id,title,authors'}).json()['results']
+		self.assertEqual(results[0], {'id': results[0]['id'], 'title': 'Book 0',
+									  'authors': [{'id': self.author.pk, 'name': 'Pratchett, Terry'}]})
+		book = self.client.get(reverse('api-book', args=[self.book.pk]), {'fields': 'title,copies_available'}).json()
+		self.assertEqual(book, {'title': 'Book 4', 'copies_available': 1})
+		self.assertEqual(self.client.get(reverse('api-books'), {'fields': 'title,borrower'}).status_code, 400)
+		self.assertEqual(self.client.get(reverse('api-book', args=[0])).status_code, 404)
+		copies = self.client.get(reverse('api-book-copies', args=[self.book.pk])).json()['results']
+		self.assertEqual([copy['status'] for copy in copies], ['available'])
+		Review.objects.create(book=self.book, user=User.objects.create_user('reader', password='password'), rating=5,
+							  review='Good')
+		with self.assertNumQueries(3):		# the validators, the book, and its reviews with their users
+			reviews = self.client.get(reverse('api-book-reviews', args=[self.book.pk]), {'fields': 'user,rating'}).json()
+		self.assertEqual(reviews['results'], [{'user': 'reader', 'rating': 5}])
+
+	def test_cursor(self):
+		titles, url = [], reverse('api-books') + '?fields=title&limit=2'
+		while url:
+			page = self.client.get(url).json()
+			titles += [book['title'] for book in page['results']]
+			url = page['next']
+		self.assertEqual(titles, ['Book %d' % number for number in range(5)])
+		self.assertEqual(self.client.get(reverse('api-books'), {'cursor': '!'}).status_code, 400)
+
+	def test_conditional_get(self):
+		url = reverse('api-book', args=[self.book.pk])
+		response = self.client.get(url)
+		self.assertTrue(response.has_header('Last-Modified'))
+		with self.assertNumQueries(1):		# the validators
+			self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+		with mock.patch.object(changes, 'catalog_changed'):		# as if another process saved it
+			self.book.title = 'Mort'
+			self.book.save()
+		self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+		copies = reverse('api-book-copies', args=[self.book.pk])
+		response = self.client.get(copies)
+		self.assertEqual(self.client.get(copies, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+		BookInstance.objects.create(book=self.book, status='a')
+		self.assertEqual(self.client.get(copies, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+	def test_conditional_get_list(self):
+		url = reverse('api-books')
+		response = self.client.get(url)
+		self.assertFalse(response.has_header('Last-Modified'))		# a deletion would not move it
+		with self.assertNumQueries(1):
+			self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+		self.assertNotEqual(self.client.get(url + '?limit=2')['ETag'], response['ETag'])
+		with mock.patch.object(changes, 'catalog_changed'):
+			Book.objects.filter(title='Book 0').delete()
+		self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+
+class BookCountersTest(TestCase):
+	"""The copy and review counters on Book follow the saves and deletes of copies and reviews."""
+
+	def setUp(self):
+		self.book = Book.objects.create(title='Book', publisher='Publisher', isbn='9780000000000', summary='Summary')
+		self.other = Book.objects.create(title='Other', publisher='Publisher', isbn='9780000000000', summary='Summary')
+
+	def assertCounters(self, book, copies, available, reviews):
+		book.refresh_from_db()
+		self.assertEqual((book.num_copies, book.num_copies_available, book.num_reviews), (copies, available, reviews))
+
+	def test_copies(self):
+		copy = BookInstance.objects.create(book=self.book)
+		BookInstance.objects.create(book=self.book, status='r')
+		self.assertCounters(self.book, 2, 1, 0)
+
+		copy = BookInstance.objects.get(pk=copy.pk)
+		copy.status = 'r'
+		copy.save()
+		self.assertCounters(self.book, 2, 0, 0)
+
+		copy.book = self.other
+		copy.status = 'a'
+		copy.save()
+		self.assertCounters(self.book, 1, 0, 0)
+		self.assertCounters(self.other, 1, 1, 0)
+
+		BookInstance.objects.get(pk=copy.pk).delete()
+		self.assertCounters(self.other, 0, 0, 0)
+
+	def test_reviews(self):
+		review = Review(rating=5, review='Good')
+		review.save()
+		review.book = self.book
+		review.save()
+		self.assertCounters(self.book, 0, 0, 1)
+
+		Review.objects.get(pk=review.pk).delete()
+		self.assertCounters(self.book, 0, 0, 0)
+
+	def test_repair_command(self):
+		BookInstance.objects.create(book=self.book)
+		Review.objects.create(book=self.book, rating=3, review='Fine')
+		Book.objects.update(num_copies=7, num_copies_available=0, num_reviews=0)
+
+		out = StringIO()
+		call_command('repair_book_counters', stdout=out)
+		self.assertIn('2 books', out.getvalue())
+		self.assertCounters(self.book, 1, 1, 1)
+		self.assertCounters(self.other, 0, 0, 0)
+
+
+class DashboardCacheTest(TestCase):
+	"""The homepage data is cached until the catalog changes."""
+
+	def setUp(self):
+		dashboard.invalidate()
+
+	def test_cached_until_catalog_changes(self):
+		self.client.get(reverse('index'))
+		with self.assertNumQueries(0):
+			self.assertEqual(dashboard.get_dashboard()['num_books'], 0)
+
+		create_books(1)
+		response = self.client.get(reverse('index'))
+		self.assertEqual(response.context['num_books'], 1)
+		self.assertEqual(response.context['books'][0].title, 'Book 0')
+
+	@override_settings(CATALOG_NUM_VISITS_BATCH=3)
+	def test_batched_visit_counter(self):
+		self.client.get(reverse('index'))		# creates the session
+		visits = [self.client.get(reverse('index')).context['num_visits'] for _ in range(5)]
+		self.assertEqual(visits, [1, 2, 3, 4, 5])
+		self.assertEqual(self.client.session['num_visits'], 4)		# written on the 4th visit only
+
+
+class SystemLogsViewTest(TestCase):
+	"""The system logs are paginated by id and filtered in the database."""
+
+	@classmethod
+	def setUpTestData(cls):
+		cls.admin = User.objects.create_user('admin', password='password', is_staff=True)
+		Group.objects.create(name='Administrator').user_set.add(cls.admin)
+		content_type = ContentType.objects.get_for_model(Book)
+		for i in range(LOGS_PER_PAGE + 10):
+			LogEntry.objects.log_action(cls.admin.id, content_type.pk, i, 'Book %d' % i, ADDITION if i % 2 else CHANGE)
+
+	def setUp(self):
+		self.client.force_login(self.admin)
+
+	def test_keyset_pages(self):
+		first = self.client.get(reverse('system-logs')).context['logs']
+		self.assertEqual(len(first), LOGS_PER_PAGE)
+		self.assertTrue(first.has_next)
+		self.assertFalse(first.has_previous)
+
+		second = self.client.get(reverse('system-logs'), {'before': first.next_cursor}).context['logs']
+		self.assertEqual(len(second), 10)
+		self.assertFalse(second.has_next)
+		self.assertEqual([log.id for log in second], sorted((log.id for log in second), reverse=True))
+		self.assertLess(second.object_list[0].id, first.object_list[-1].id)
+
+		back = self.client.get(reverse('system-logs'), {'after': second.previous_cursor}).context['logs']
+		self.assertEqual([log.id for log in back], [log.id for log in first])
+
+	def test_filters(self):
+		logs = self.client.get(reverse('system-logs'), {'action_flag': ADDITION, 'user': 'admin'}).context['logs']
+		self.assertEqual(len(logs), (LOGS_PER_PAGE + 10) // 2)
+		self.assertTrue(all(log.action_flag == ADDITION for log in logs))
+
+		logs = self.client.get(reverse('system-logs'), {'user': 'nobody'}).context['logs']
+		self.assertEqual(len(logs), 0)
+
+
+class AuditLogTest(TestCase):
+	"""Audit log entries are written right away in synchronous mode, and in batches by the background writer."""
+
+	def setUp(self):
+		self.user = User.objects.create_user('member', password='password')
+		self.book = Book.objects.create(title='Book', publisher='Publisher', isbn='9780000000000', summary='Summary')
+
+	def test_synchronous_mode(self):
+		from locallibrary import settings as development, settings_production as production
+		self.assertFalse(development.CATALOG_AUDIT_LOG_ASYNC)		# tests and development write in the request
+		self.assertTrue(production.CATALOG_AUDIT_LOG_ASYNC)
+		self.assertFalse(settings.CATALOG_AUDIT_LOG_ASYNC)
+		audit.log_action(self.user.id, self.book, ADDITION, [{'added': {}}])
+		entry = LogEntry.objects.get()
+		self.assertEqual((entry.object_id, entry.object_repr, entry.change_message), (str(self.book.pk), 'Book', '[{"added": {}}]'))
+
+	def test_background_writer_batches_and_flushes_on_stop(self):
+		batches = []
+
+		class RecordingWriter(audit.AuditLogWriter):
+			def write(self, entries):
+				if entries:
+					batches.append(entries)
+
+		writer = RecordingWriter(batch_size=3, flush_interval=0.01)
+		ContentType.objects.get_for_model(Book)		# after the first lookup content types come from the cache
+		with self.assertNumQueries(0):
+			for _ in range(7):
+				writer.put(audit.make_entry(self.user.id, self.book, CHANGE))
+		writer.stop()
+		self.assertFalse(writer.thread.is_alive())
+		self.assertEqual(sum(len(batch) for batch in batches), 7)
+		self.assertTrue(all(len(batch) <= 3 for batch in batches))
+
+
+class CoverVariantsTest(TestCase):
+	"""Covers get resized WebP/JPEG variants, and the templates fall back to the original until they exist."""
+
+	def setUp(self):
+		location = tempfile.mkdtemp()
+		self.addCleanup(shutil.rmtree, location)
+		self.storage = FileSystemStorage(location=location, base_url='/media/')
+		buffer = BytesIO()
+		Image.new('RGB', (800, 1200), 'red').save(buffer, 'PNG')
+		self.name = self.storage.save('bookcovers/cover.png', buffer)
+
+	def test_generate_variants(self):
+		self.assertEqual(covers.variant_urls(self.name, 'webp', self.storage), [])
+		self.assertEqual(covers.cover_url(self.name, 320, self.storage), '/media/bookcovers/cover.png')
+
+		self.assertEqual(covers.generate_variants(self.name, self.storage), len(covers.COVER_WIDTHS) * len(covers.COVER_FORMATS))
+		self.assertEqual(covers.generate_variants(self.name, self.storage), 0)		# already there
+		with self.storage.open(covers.variant_name(self.name, 320, 'webp')) as variant:
+			self.assertEqual(Image.open(variant).size, (320, 480))
+		self.assertEqual(covers.cover_url(self.name, 200, self.storage), '/media/' + covers.variant_name(self.name, 320, 'jpg'))
+
+		# the same file name in another format or folder gets its own variants
+		buffer = BytesIO()
+		Image.new('RGB', (200, 300), 'blue').save(buffer, 'JPEG')
+		other = self.storage.save('bookcovers/cover.jpg', buffer)
+		self.assertNotEqual(covers.variant_name(other, 320, 'webp'), covers.variant_name(self.name, 320, 'webp'))
+		self.assertNotEqual(covers.variant_name('other/cover.png', 320, 'webp'), covers.variant_name(self.name, 320, 'webp'))
+		self.assertEqual(covers.variant_urls(other, 'webp', self.storage), [])
+		covers.generate_variants(other, self.storage)
+		with self.storage.open(covers.variant_name(self.name, 320, 'webp')) as variant:
+			self.assertEqual(Image.open(variant).size, (320, 480))		# untouched
+
+	def test_default_cover_not_generated_on_save(self):
+		with mock.patch.object(covers, 'generate_variants') as generate_variants:
+			Book.objects.create(title='Book', summary='Summary', isbn='9780000000000')
+		generate_variants.assert_not_called()
+
+	def test_cover_picture_tag_without_variants(self):
+		book = Book(title='Book', book_cover='bookcovers/missing.jpg')
+		html = Template('{% load covers %}{% cover_picture book sizes="150px" style="width: 100px" %}').render(Context({'book': book}))
+		self.assertHTMLEqual(html, '<img src="/media/bookcovers/missing.jpg" alt="Book" style="width: 100px">')
+
+	def test_pages_with_a_deleted_book(self):
+		book = Book.objects.create(title='Book', summary='Summary', isbn='9780000000000')
+		manager = User.objects.create_user('manager', password='password', is_staff=True)
+		Group.objects.create(name='Manager').user_set.add(manager)
+		member = User.objects.create_user('member', password='password')
+		BookInstance.objects.create(book=book, status='o', borrower=member, due_back=datetime.date.today())
+		Review.objects.create(book=book, user=member, rating=4, review='Good')
+		book.delete()		# the copy and the review keep a null book
+		self.assertEqual(Template('{% load covers %}{% cover_picture book %}{% cover_url book %}').render(Context({'book': None})), '')
+		self.client.force_login(manager)
+		self.assertEqual(self.client.get(reverse('book-copies')).status_code, 200)
+		self.client.force_login(member)
+		self.assertEqual(self.client.get(reverse('user-profile', args=['member'])).status_code, 200)
+		self.assertEqual(self.client.get(reverse('my-borrowed')).status_code, 200)
+
+
+class WarmUpTest(TestCase):
+	"""The production settings keep the compiled templates in memory, and the warm-up compiles all of them."""
+
+	def test_production_templates(self):
+		from locallibrary import settings as development, settings_production as production
+		self.assertEqual(production.TEMPLATES[0]['OPTIONS']['loaders'][0][0], 'django.template.loaders.cached.Loader')
+		self.assertTrue(development.TEMPLATES[0]['APP_DIRS'])		# left as it was
+		self.assertNotIn('loaders', development.TEMPLATES[0]['OPTIONS'])
+
+	def test_compile_templates(self):
+		engine = Engine(dirs=warmup.template_dirs(), libraries=engines['django'].engine.libraries,
+						loaders=[('django.template.loaders.cached.Loader', ['django.template.loaders.filesystem.Loader'])])
+		timings = warmup.compile_templates(engine)
+		self.assertEqual(sorted(timings), warmup.template_names())		# no syntax errors
+		self.assertIn('catalog/book_list.html', timings)
+		self.assertIn('registration/login.html', timings)
+		with mock.patch('django.template.loaders.filesystem.Loader.get_contents') as get_contents:
+			engine.get_template('catalog/book_list.html')
+		get_contents.assert_not_called()
+
+	def test_template_not_found(self):
+		engine = Engine(dirs=warmup.template_dirs()[:1], libraries=engines['django'].engine.libraries)		# not catalog/templates
+		with self.assertLogs('catalog.warmup', 'ERROR') as logs:
+			timings = warmup.compile_templates(engine)
+		self.assertIn('registration/login.html', timings)
+		self.assertNotIn('catalog/book_list.html', timings)
+		self.assertIn('Could not find the template catalog/book_list.html', '\n'.join(logs.output))
+
+	def test_bench_templates(self):
+		out = StringIO()
+		with mock.patch.object(benchdata, 'separate_database', return_value=contextlib.nullcontext()) as separate_database:
+			call_command('bench_templates', books='5', repeat=1, stdout=out)
+		separate_database.assert_called_once()		# not the configured database
+		self.assertEqual(Book.objects.count(), 5)
+		self.assertIn('catalog/book_list.html', out.getvalue())
+		self.assertIn('total', out.getvalue())
+
+
+class ProfilingTest(TestCase):
+	"""With profiling on, every response says where its time went in a Server-Timing header."""
+
+	def setUp(self):
+		self.book = Book.objects.create(title='Noli Me Tangere', summary='Summary', isbn='9789710810736')
+		self.user = User.objects.create_user('reader', password='secret-password')
+
+	def timings(self, response):
+		return dict(metric.split(';', 1) for metric in response['Server-Timing'].split(', '))
+
+	def test_server_timing(self):
+		self.assertFalse(self.client.get(reverse('index')).has_header('Server-Timing'))		# off by default
+
+		with override_settings(MIDDLEWARE=profiling.instrument(settings.MIDDLEWARE), CATALOG_PROFILING_LOG_SAMPLE_RATE=1):
+			client = Client()
+			client.force_login(self.user)
+			with CaptureQueriesContext(connection) as queries, self.assertLogs('catalog.profiling') as logs:
+				response = client.get(reverse('book-detail', args=[self.book.pk]))
+		self.assertEqual(response.status_code, 200)
+		timings = self.timings(response)
+		self.assertEqual(list(timings)[:3], ['sql', 'tpl', 'session'])
+		self.assertIn('desc="%d queries"' % len(queries), timings['sql'])
+		self.assertGreater(float(timings['tpl'].split('=')[1]), 0)
+		for name in ('mw-SessionMiddleware', 'mw-SessionMiddleware-2', 'mw-AxesMiddleware', 'mw-SessionTimeoutMiddleware', 'view', 'total'):
+			self.assertIn(name, timings)
+		record = json.loads(logs.records[0].getMessage())
+		self.assertEqual((record['path'], record['status'], record['queries']), (response.wsgi_request.path, 200, len(queries)))
+
+
+class BenchDataTest(TestCase):
+	"""The benchmark data generator adds rows in proportion to the scale, the same ones for the same seed."""
+
+	def test_generate(self):
+		self.assertEqual([benchdata.parse_scale(scale) for scale in ('250', '1k', '100K', '1M')], [250, 1000, 100000, 1000000])
+		with self.assertRaises(ValueError):
+			benchdata.parse_scale('lots')
+
+		with mock.patch.object(benchdata, 'CHUNK_SIZE', 20):		# several chunks
+			benchdata.generate(50)
+		self.assertEqual((Book.objects.count(), Author.objects.count(), BookInstance.objects.count(), Review.objects.count(),
+						  LogEntry.objects.count()), (50, 10, 150, 100, 50))
+		self.assertEqual(counters.stale(Book.objects.all()).count(), 0)
+		titles = list(Book.objects.order_by('id').values_list('title', 'year', 'num_copies_available'))
+		Book.objects.all().delete()
+		with mock.patch.object(benchdata, 'CHUNK_SIZE', 20):
+			benchdata.generate(50)
+		self.assertEqual(list(Book.objects.order_by('id').values_list('title', 'year', 'num_copies_available')), titles)
+		self.assertTrue(search.filter_books(Book.objects.all(), titles[0][0]).exists())		# indexed
+
+
+class BenchSiteTest(TestCase):
+	"""bench_site runs on a database of its own and clears only the caches of its process."""
+
+	def test_bench_site(self):
+		output = os.path.join(tempfile.mkdtemp(), 'results.json')
+		self.addCleanup(shutil.rmtree, os.path.dirname(output))
+		caches['axes'].set('bench-site-test', 1)		# stands for a cache shared with the running site
+		caches['default'].set('bench-site-test', 1)
+		with mock.patch.object(benchdata, 'separate_database', return_value=contextlib.nullcontext()) as separate_database:
+			call_command('bench_site', books='5', requests=1, warmup=0, only='books', output=output, stdout=StringIO(),
+						 stderr=StringIO())
+		separate_database.assert_called_once()		# not the configured database
+		with open(output) as results:
+			self.assertIn('books', json.dumps(json.load(results)))
+		self.assertEqual(caches['axes'].get('bench-site-test'), 1)
+		self.assertIsNone(caches['default'].get('bench-site-test'))
+
+
+class BenchIndexesTest(TransactionTestCase):
+	"""bench_indexes runs on a database of its own (the test database here) and leaves the indexes as it found them."""
+
+	def tearDown(self):
+		with connection.cursor() as cursor:
+			cursor.execute('DELETE FROM %s' % search.FTS_TABLE)		# not flushed with the other tables
+
+	def test_bench_indexes(self):
+		out = StringIO()
+		with mock.patch.object(benchdata, 'separate_database', return_value=contextlib.nullcontext()) as separate_database:
+			call_command('bench_indexes', books='30', repeat=1, stdout=out)
+		separate_database.assert_called_once()
+		self.assertEqual(Book.objects.count(), 30)
+		self.assertIn('Summary (ms):', out.getvalue())
+		with connection.cursor() as cursor:
+			indexes = {name: index['columns'] for name, index in
+					   connection.introspection.get_constraints(cursor, 'catalog_bookinstance').items() if index['index']}
+		self.assertEqual(indexes['bookinstance_book_due_idx'], ['book_id', 'due_back'])
+		self.assertNotIn(['book_id'], indexes.values())		# covered by the index above (migration 0020)
+
+
+class StaticFilesApplicationTest(TestCase):
+	"""Collected static files are served with content negotiation and long-lived caching for hashed names."""
+
+	def setUp(self):
+		self.root = tempfile.mkdtemp()
+		self.addCleanup(shutil.rmtree, self.root)
+		os.makedirs(os.path.join(self.root, 'css'))
+		for name in ('style.css', 'style.0123456789ab.css'):
+			with open(os.path.join(self.root, 'css', name), 'w') as css:
+				css.write('body { color: red; }\n' * 200)
+			compress_file(os.path.join(self.root, 'css', name))
+		self.application = StaticFilesApplication(lambda environ, start_response: ['django'], self.root, '/static/')
+
+	def get(self, path, **environ):
+		response = {}
+		def start_response(status, headers):
+			response['status'], response['headers'] = status, dict(headers)
+		environ.update({'REQUEST_METHOD': 'GET', 'PATH_INFO': path})
+		body = b''.join(self.application(environ, start_response))
+		return response.get('status'), response.get('headers'), body
+
+	def test_negotiates_encoding(self):
+		status, headers, body = self.get('/static/css/style.0123456789ab.css', HTTP_ACCEPT_ENCODING='gzip, deflate')
+		self.assertEqual(status, '200 OK')
+		self.assertEqual(headers['Content-Encoding'], 'gzip')
+		self.assertEqual(headers['Vary'], 'Accept-Encoding')
+		self.assertIn('immutable', headers['Cache-Control'])
+		self.assertEqual(int(headers['Content-Length']), len(body))
+
+		status, headers, body = self.get('/static/css/style.css', HTTP_ACCEPT_ENCODING='gzip;q=0')
+		self.assertNotIn('Content-Encoding', headers)
+		self.assertNotIn('immutable', headers['Cache-Control'])
+		self.assertEqual(len(body), len('body { color: red; }\n') * 200)
+
+	def test_not_modified_and_fallthrough(self):
+		_, headers, _ = self.get('/static/css/style.css')
+		status, _, body = self.get('/static/css/style.css', HTTP_IF_NONE_MATCH=headers['ETag'])
+		self.assertEqual((status, body), ('304 Not Modified', b''))
+		self.assertEqual(self.application({'REQUEST_METHOD': 'GET', 'PATH_INFO': '/catalog/'}, None), ['django'])
+
+
+@override_settings(CATALOG_AUDIT_LOG_ASYNC=False)
+class BorrowTest(TestCase):
+	"""A copy can only be borrowed while it is available."""
+
+	def setUp(self):
+		self.member = User.objects.create_user('member', password='password')
+		self.other = User.objects.create_user('other', password='password')
+		self.book = Book.objects.create(title='Book', publisher='Publisher', isbn='9780000000000', summary='Summary')
+		self.copy = BookInstance.objects.create(book=self.book)
+
+	def test_borrow_copy_once(self):
+		self.assertTrue(loans.borrow_copy(self.copy.pk, self.member))
+		self.assertFalse(loans.borrow_copy(self.copy.pk, self.other))
+		self.copy.refresh_from_db()
+		self.book.refresh_from_db()
+		self.assertEqual((self.copy.status, self.copy.borrower), ('r', self.member))
+		self.assertEqual(self.book.num_copies_available, 0)
+
+	def test_borrow_any_copy(self):
+		second = BookInstance.objects.create(book=self.book)
+		borrowed = {loans.borrow_any_copy(self.book.pk, self.member), loans.borrow_any_copy(self.book.pk, self.other)}
+		self.assertEqual(borrowed, {self.copy.pk, second.pk})
+		self.assertIsNone(loans.borrow_any_copy(self.book.pk, self.member))
+
+	def test_borrow_views(self):
+		self.client.force_login(self.member)
+		response = self.client.post(reverse('borrow-any-copy', args=[self.book.pk]))
+		self.assertRedirects(response, reverse('my-borrowed'))
+		self.assertEqual(LogEntry.objects.get().object_id, str(self.copy.pk))
+
+		self.client.force_login(self.other)
+		response = self.client.post(reverse('borrow-book', args=[self.copy.pk]))
+		self.assertRedirects(response, reverse('book-detail', args=[self.book.pk]))
+		self.copy.refresh_from_db()
+		self.assertEqual(self.copy.borrower, self.member)
+
+
+
+@override_settings(CATALOG_AUDIT_LOG_ASYNC=False)
+class BulkCopiesTest(TestCase):
+	"""Managers add and return many copies with one statement and one system log entry."""
+
+	def setUp(self):
+		self.manager = User.objects.create_user('manager', password='password', is_staff=True)
+		Group.objects.create(name='Manager').user_set.add(self.manager)
+		self.member = User.objects.create_user('member', password='password')
+		self.book = Book.objects.create(title='Book', publisher='Publisher', isbn='9780000000000', summary='Summary')
+		self.client.force_login(self.manager)
+		self.client.get(reverse('book-copies'))		# the first request of a session writes it
+
+	def test_add_copies(self):
+		with CaptureQueriesContext(connection) as queries:
+			response = self.client.post(reverse('add-copies'), {'book': self.book.pk, 'count': 50})
+		self.assertRedirects(response, reverse('book-copies'), fetch_redirect_response=False)
+		self.assertEqual(sum(query['sql'].startswith('INSERT INTO "catalog_bookinstance"') for query in queries), 1)
+		self.book.refresh_from_db()
+		self.assertEqual((self.book.num_copies, self.book.num_copies_available), (50, 50))
+		entry = LogEntry.objects.get()
+		self.assertEqual((entry.action_flag, entry.object_repr), (ADDITION, '50 copies of Book'))
+
+	def test_return_copies(self):
+		copies = loans.add_copies(self.book.pk, 3)
+		for copy in copies[:2]:
+			loans.borrow_copy(copy.pk, self.member)
+		response = self.client.post(reverse('return-copies'), {'copies': [copy.pk for copy in copies]})
+		self.assertRedirects(response, reverse('book-copies'))
+		self.assertEqual(BookInstance.objects.filter(status='a', borrower=None).count(), 3)
+		self.assertFalse(counters.stale(Book.objects.all()).exists())
+		self.assertEqual(LogEntry.objects.get().object_repr, '2 copies')
+
+	def test_add_copies_by_isbn(self):
+		response = self.client.get(reverse('book-copies'))
+		self.assertNotContains(response, '<option')		# the books are not listed
+		self.client.post(reverse('add-copies'), {'book': '978-0-00-000000-0', 'count': 2}, follow=True)
+		self.assertEqual(self.book.bookinstance_set.count(), 2)
+		isbn10 = Book.objects.create(title='Isbn-10', publisher='Publisher', isbn='080442957X', summary='Summary')
+		self.client.post(reverse('add-copies'), {'book': '0-8044-2957-x', 'count': 1}, follow=True)
+		self.assertEqual(isbn10.bookinstance_set.count(), 1)
+
+		Book.objects.create(title='Other', publisher='Publisher', isbn='9780000000000', summary='Summary')
+		for book in ('9780000000000', '999999', 'Book', '12X'):		# shared ISBN, unknown id, not a number
+			response = self.client.post(reverse('add-copies'), {'book': book, 'count': 2}, follow=True)
+			self.assertEqual([message.level_tag for message in response.context['messages']], ['error'])
+		self.assertEqual(BookInstance.objects.count(), 3)
+
+	def test_members_cannot_add_copies(self):
+		self.client.force_login(self.member)
+		self.client.post(reverse('add-copies'), {'book': self.book.pk, 'count': 5})
+		self.assertFalse(BookInstance.objects.exists())
+
+
+
+@override_settings(CATALOG_OVERDUE_FINE_PER_DAY='2.50')
+class OverdueLoansTest(TestCase):
+	"""Overdue loans are found in the database and fined per day overdue."""
+
+	def setUp(self):
+		self.today = datetime.date.today()
+		self.member = User.objects.create_user('member', password='password')
+		book = Book.objects.create(title='Book', publisher='Publisher', isbn='9780000000000', summary='Summary')
+		self.late = BookInstance.objects.create(book=book, status='r', borrower=self.member, due_back=self.today - datetime.timedelta(days=4))
+		BookInstance.objects.create(book=book, status='r', borrower=self.member, due_back=self.today)
+		BookInstance.objects.create(book=book, status='a', due_back=self.today - datetime.timedelta(days=9))
+
+	def test_overdue(self):
+		self.assertEqual(list(BookInstance.objects.overdue()), [self.late])
+		self.assertEqual(BookInstance.objects.overdue(self.today + datetime.timedelta(days=1)).count(), 2)
+
+	def test_process_overdue_loans(self):
+		out = StringIO()
+		call_command('process_overdue_loans', chunk_size=1, stdout=out)
+		self.assertIn('1 overdue loans (1 fines updated)', out.getvalue())
+		self.late.refresh_from_db()
+		self.assertEqual(self.late.fine, Decimal('10.00'))
+		call_command('process_overdue_loans', stdout=out)		# nothing changed since
+		self.assertIn('1 overdue loans (0 fines updated)', out.getvalue())
+
+		loans.return_copies([self.late.pk])		# returning the copy ends its fine
+		self.late.refresh_from_db()
+		self.assertEqual(self.late.fine, 0)
+		BookInstance.objects.filter(pk=self.late.pk).update(status='r', fine=5)
+		self.late.refresh_from_db()
+		self.late.status = 'a'		# returned through the edit form
+		self.late.save()
+		self.late.refresh_from_db()
+		self.assertEqual(self.late.fine, 0)
+
+	def test_overdue_loans_view(self):
+		manager = User.objects.create_user('manager', password='password', is_staff=True)
+		Group.objects.create(name='Manager').user_set.add(manager)
+		self.client.force_login(manager)
+		response = self.client.get(reverse('overdue-loans'))
+		self.assertEqual(list(response.context['bookinstance_list']), [self.late])
+		self.client.force_login(self.member)
+		self.assertTemplateUsed(self.client.get(reverse('overdue-loans')), '404.html')
+
+
+
+@override_settings(CATALOG_ROLES_CACHE='default')		# one test process: its own cache is shared by all of it
+class RolesTest(TestCase):
+	"""The groups of a user are looked up once per session, and again after they change (with a shared cache)."""
+
+	def setUp(self):
+		self.user = User.objects.create_user('staff', password='password', is_staff=True)
+		self.manager_group = Group.objects.create(name='Manager')
+		self.client.force_login(self.user)
+		self.client.get(reverse('books'))		# the first request of a session writes it
+
+	def group_queries(self, path):
+		with CaptureQueriesContext(connection) as queries:
+			response = self.client.get(path)
+		return response, sum('"auth_group"' in query['sql'] for query in queries)
+
+	def test_roles_kept_in_session(self):
+		response, queries = self.group_queries(reverse('overdue-loans'))
+		self.assertTemplateUsed(response, '404.html')
+		self.assertEqual(queries, 0)		# resolved by the warm-up request
+
+		self.manager_group.user_set.add(self.user)
+		response, queries = self.group_queries(reverse('overdue-loans'))
+		self.assertTemplateUsed(response, 'manager/overdue_loans.html')
+		self.assertTrue(response.context['roles'].is_manager)
+		self.assertEqual(queries, 1)
+		self.assertEqual(self.group_queries(reverse('overdue-loans'))[1], 0)
+
+		self.user.groups.clear()
+		self.assertTemplateUsed(self.group_queries(reverse('overdue-loans'))[0], '404.html')
+
+	def test_copies_page_for_staff_or_managers(self):
+		self.assertTemplateUsed(self.client.get(reverse('book-copies')), 'manager/bookinstance_list.html')		# as before
+		manager = User.objects.create_user('manager')
+		self.manager_group.user_set.add(manager)
+		self.client.force_login(manager)
+		self.assertTemplateUsed(self.client.get(reverse('book-copies')), 'manager/bookinstance_list.html')
+		self.client.force_login(User.objects.create_user('member'))
+		self.assertTemplateUsed(self.client.get(reverse('book-copies')), '404.html')
+
+	@override_settings(CATALOG_ROLES_CACHE=None)
+	def test_without_a_shared_cache(self):
+		self.manager_group.user_set.add(self.user)
+		for _ in range(2):
+			response, queries = self.group_queries(reverse('add-copy'))
+			self.assertEqual(response.status_code, 200)
+			self.assertEqual(queries, 1)		# every request, nothing to miss a revocation made by another process
+		with mock.patch.object(roles, 'invalidate'):		# as if another process revoked it
+			self.user.groups.clear()
+		self.assertRedirects(self.client.get(reverse('add-copy')), reverse('404'), fetch_redirect_response=False)
+
+	def test_shared_cache_in_production(self):
+		from locallibrary import settings as development, settings_production as production
+		self.assertIsNone(development.CATALOG_ROLES_CACHE)
+		backend = production.CACHES[production.CATALOG_ROLES_CACHE]['BACKEND']
+		self.assertNotEqual(backend, 'django.core.cache.backends.locmem.LocMemCache')		# seen by every server process
+
+	def test_administrator_sees_managers_in_admin(self):
+		from django.contrib.auth.models import Permission
+		self.user.user_permissions.add(Permission.objects.get(codename='view_user'))
+		Group.objects.create(name='Administrator').user_set.add(self.user)
+		manager = User.objects.create_user('manager', is_staff=True)
+		manager.profile.role = 'manager'
+		manager.profile.save()
+		self.client.get(reverse('admin:auth_user_changelist'))		# roles looked up and kept in the session
+		with CaptureQueriesContext(connection) as queries:
+			response = self.client.get(reverse('admin:auth_user_changelist'))
+		self.assertEqual(list(response.context['cl'].queryset), [manager])
+		self.assertFalse(any("'Administrator'" in query['sql'] for query in queries))
+
+	def test_manager_required(self):
+		self.assertRedirects(self.client.get(reverse('add-copy')), reverse('404'), fetch_redirect_response=False)
+		self.manager_group.user_set.add(self.user)
+		self.assertEqual(self.client.get(reverse('add-copy')).status_code, 200)
+
+
+@override_settings(CATALOG_SESSION_DB_WRITE_INTERVAL=300)
+class SessionStoreTest(TestCase):
+	"""catalog.sessions writes activity timestamps to the database at most every interval, other changes right away."""
+
+	def setUp(self):
+		self.clock = [1000000.0]
+		patcher = mock.patch('time.time', lambda: self.clock[0])
+		patcher.start()
+		self.addCleanup(patcher.stop)
+		store = sessions.SessionStore()
+		store['_auth_user_id'] = '1'
+		store.save(must_create=True)
+		self.session_key = store.session_key
+
+	def save(self, **changes):
+		"""Load the session, apply changes and save it. Returns the number of writes to the session table."""
+		store = sessions.SessionStore(self.session_key)
+		store.load()
+		store.update(changes)
+		with CaptureQueriesContext(connection) as queries:
+			store.save()
+		return sum(query['sql'].startswith('UPDATE') for query in queries)
+
+	def test_bench_sessions(self):
+		out = StringIO()
+		with mock.patch.object(benchdata, 'separate_database', return_value=contextlib.nullcontext()) as separate_database:
+			call_command('bench_sessions', users=2, minutes=1, stdout=out)
+		separate_database.assert_called_once()		# not the configured database
+		self.assertIn('catalog.sessions', out.getvalue())
+
+	def test_engine_only_with_a_shared_cache(self):
+		from locallibrary import settings as development, settings_production as production
+		self.assertEqual(development.SESSION_ENGINE, 'django.contrib.sessions.backends.db')
+		self.assertEqual(production.SESSION_ENGINE, 'catalog.sessions')
+		backend = production.CACHES[production.SESSION_CACHE_ALIAS]['BACKEND']
+		self.assertNotEqual(backend, 'django.core.cache.backends.locmem.LocMemCache')		# seen by every server process
+		self.assertNotEqual(production.SESSION_CACHE_ALIAS, 'default')		# not pushed out by other keys
+
+	def test_volatile_changes(self):
+		self.clock[0] += 60
+		self.assertEqual(self.save(_session_init_timestamp_=self.clock[0], num_visits=1), 0)
+		self.assertEqual(sessions.SessionStore(self.session_key).load()['num_visits'], 1)		# from the cache
+		self.clock[0] += 300
+		self.assertEqual(self.save(num_visits=2), 1)
+
+	def test_persistent_changes(self):
+		self.clock[0] += 60
+		self.assertEqual(self.save(_auth_user_id='2'), 1)
+		self.assertEqual(self.save(), 0)
+
+
+@override_settings(AXES_FAILURE_LIMIT=3)
+class LockoutTest(TestCase):
+	"""Login failures are counted in the cache; only the lockout is saved, and it outlives the cache."""
+
+	def setUp(self):
+		caches['axes'].clear()
+		self.user = User.objects.create_user('member', password='password')
+
+	def login(self, password):
+		"""POST the login form. Returns (logged in, queries on the axes tables)."""
+		self.client.logout()
+		with CaptureQueriesContext(connection) as queries:
+			self.client.post(reverse('login'), {'username': 'member', 'password': password})
+		return '_auth_user_id' in self.client.session, sum('"axes_' in query['sql'] for query in queries)
+
+	def test_lockout(self):
+		self.assertEqual(self.login('wrong'), (False, 1))		# loads the saved lockouts into the empty cache
+		self.assertEqual(self.login('wrong'), (False, 0))
+		self.assertFalse(AccessAttempt.objects.exists())
+		self.login('wrong')
+		self.assertEqual(AccessAttempt.objects.get().failures_since_start, 3)
+		self.assertFalse(self.login('password')[0])
+
+		caches['axes'].clear()		# e.g. a restart
+		self.assertFalse(self.login('password')[0])
+		self.assertEqual(AccessAttempt.objects.count(), 1)
+
+		AccessAttempt.objects.all().delete()
+		self.assertTrue(self.login('password')[0])
+
+	def test_reset_on_success(self):
+		self.login('wrong')
+		self.login('wrong')
+		self.assertTrue(self.login('password')[0])
+		self.login('wrong')
+		self.login('wrong')
+		self.assertFalse(AccessAttempt.objects.exists())
+
+	def test_shared_cache_in_production(self):
+		from locallibrary import settings_production as production
+		self.assertEqual(production.AXES_CACHE, 'axes')
+		backend = production.CACHES['axes']['BACKEND']
+		self.assertNotEqual(backend, 'django.core.cache.backends.locmem.LocMemCache')		# one count for every server process
+
+
+class ImportCatalogTest(TestCase):
+	"""The import_catalog command loads books, authors and copies in chunks, reusing authors by name."""
+
+	def write(self, suffix, content):
+		handle, path = tempfile.mkstemp(suffix=suffix)
+		self.addCleanup(os.remove, path)
+		with os.fdopen(handle, 'w') as file:
+			file.write(content)
+		return path
+
+	def test_import_csv(self):
+		Author.objects.create(first_name='Ursula', last_name='Le Guin')
+		path = self.write('.csv', 'title,authors,publisher,year,isbn,call_number,summary,copies\n'
+			'Earthsea,"Le Guin, Ursula",Parnassus,1968,9780000000001,813,Wizards,2\n'
+			'The Dispossessed,"Le Guin, Ursula",Harper,1974,9780000000002,813,Anarres,0\n'
+			'Good Omens,Terry Pratchett; Neil Gaiman,Gollancz,1990,9780000000003,823,Apocalypse,3\n'
+			',Nobody,Nowhere,2000,9780000000004,1,No title,1\n')
+		out = StringIO()
+		call_command('import_catalog', path, chunk_size=2, stdout=out, stderr=StringIO())
+
+		self.assertIn('Imported 3 books, 2 new authors and 5 copies (1 rows skipped)', out.getvalue())
+		self.assertEqual(Author.objects.filter(last_name='Le Guin').get().book_set.count(), 2)
+		good_omens = Book.objects.get(title='Good Omens')
+		self.assertEqual(sorted(good_omens.author.values_list('last_name', flat=True)), ['Gaiman', 'Pratchett'])
+		self.assertEqual(good_omens.bookinstance_set.filter(status='a').count(), 3)
+		self.assertFalse(counters.stale(Book.objects.all()).exists())
+		if search.is_enabled():
+			self.assertEqual(list(search.search_books(Book.objects.all(), 'earthsea')), [Book.objects.get(title='Earthsea')])
+
+	def test_import_jsonl(self):
+		path = self.write('.jsonl', '{"title": "Dune", "authors": [{"first_name": "Frank", "last_name": "Herbert"}], '
+			'"publisher": "Chilton", "year": 1965, "isbn": "9780000000005", "summary": "Arrakis", "copies": 1}\n')
+		call_command('import_catalog', path, stdout=StringIO())
+		self.assertEqual(Book.objects.get(author__last_name='Herbert').num_copies_available, 1)
+
+	def test_import_jsonl_bad_lines(self):
+		path = self.write('.jsonl', '{"title": "Dune", "authors": ["Frank Herbert"], "publisher": "Chilton", "isbn": "9780000000005", "summary": "Arrakis"}\n'
+			'{"title": "Broken", \n'
+			'\n'
+			'["not", "an", "object"]\n'
+			'{"title": "Dune Messiah", "authors": ["frank herbert", "FRANK HERBERT"], "publisher": "Putnam", "isbn": "9780000000006", '
+			'"summary": "Paul"}\n'
+			'{"title": "Bad authors", "authors": 7, "isbn": "9780000000007", "summary": "Summary"}\n')
+		out, err = StringIO(), StringIO()
+		call_command('import_catalog', path, chunk_size=2, stdout=out, stderr=err)
+		self.assertIn('Imported 2 books, 1 new authors and 0 copies (3 rows skipped)', out.getvalue())
+		self.assertIn('Row 2 skipped', err.getvalue())
+		self.assertIn('Row 4 skipped', err.getvalue())
+		self.assertIn('Row 6 skipped', err.getvalue())
+		author = Author.objects.get()
+		self.assertEqual((author.first_name, author.last_name), ('Frank', 'Herbert'))
+		self.assertEqual(author.book_set.count(), 2)
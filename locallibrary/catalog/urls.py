@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.urls import path
-from . import views 
+from . import api, views 
 from django.views.generic import TemplateView
 
 import django
@@ -11,6 +11,7 @@ def custom_page_not_found(request):
 urlpatterns = [
 	path('', views.index, name='index'),	# homepage
 	path('books/', views.BookListView.as_view(), name='books'), # booklist page: view is implemented as a class, thus, as_view() class method is used
+	path('books/autocomplete', views.AutocompleteView, name='autocomplete'), # search box suggestions (JSON)
 	path('book/<int:pk>', views.BookDetailView.as_view(), name='book-detail'), # book details page: <int:pk> captures the book id and places it in primary key pk
 	path('authors/', views.AuthorListView.as_view(), name='authors'), # authorlist page
 	path('author/<int:pk>', views.AuthorDetailView.as_view(), name='author-detail'), # author details page 
@@ -18,6 +19,7 @@ urlpatterns = [
 	path('signup/', views.SignUpView, name='signup'), # for signup page
 	path('profile/<username>', views.ReviewsByUserListView.as_view(), name='user-profile'),	 # for user profile page 
 	path('book/<uuid:pk>/borrow', views.BorrowBookView, name='borrow-book'), # borrow book path 
+	path('book/<int:pk>/borrow', views.BorrowAnyCopyView, name='borrow-any-copy'), # borrow any available copy of a book path 
 	path('book/<int:pk>/review', views.ReviewBookView, name='review-book'), # review book path
 	path('password/', views.ChangePasswordView, name='change-password'), # change password path 
 	path('404/', custom_page_not_found, name='404'),	# 404 path
@@ -27,9 +29,18 @@ urlpatterns = [
 	path('copies', views.BookInstanceView.as_view(), name='book-copies'),	# book instances page 
 	path('copies/<copy_id>/delete', views.DeleteBookInstanceView, name='delete-copy'),	# delete book instances path 
 	path('copies/add', views.AddBookInstanceView, name='add-copy'),	# add book instances path 
+	path('copies/add-many', views.AddCopiesView, name='add-copies'),	# add many book instances at once path 
+	path('copies/return', views.ReturnCopiesView, name='return-copies'),	# mark book instances returned path 
+	path('copies/overdue', views.OverdueLoansView.as_view(), name='overdue-loans'),	# overdue book instances page 
 	path('copies/<uuid:pk>/edit', views.EditBookInstanceView, name='edit-copy'),	# edit book instances path 
 	path('logs/', views.SystemLogsView, name='system-logs'),	# for system logs page 
 	path('managers/', views.ManagerListView.as_view(), name='managers'),	# for managers page 
 	path('managers/add', views.AddManagerView, name='add-manager'),	# for add manager path 
 	path('timeout/', TemplateView.as_view(template_name="session_timeout.html"), name='timeout'),	# session timeout 
+	path('api/books/', api.book_list, name='api-books'),	# read-only JSON API (see api.py)
+	path('api/books/<int:pk>', api.book_detail, name='api-book'),
+	path('api/books/<int:pk>/copies', api.book_copies, name='api-book-copies'),
+	path('api/books/<int:pk>/reviews', api.book_reviews, name='api-book-reviews'),
+	path('api/authors/', api.author_list, name='api-authors'),
+	path('api/authors/<int:pk>', api.author_detail, name='api-author'),
 ]
\ No newline at end of file
@@ -7,15 +7,22 @@ from django.contrib.auth.forms import PasswordChangeForm
 from django.contrib.auth.mixins import LoginRequiredMixin   		# For Login requirements
 from django.contrib.admin.models import LogEntry, ADDITION, DELETION, CHANGE
 from django.contrib.admin.utils import construct_change_message
-from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
 from django.db.models import Q										# for using search queries 
 from django.http import Http404										# redirect to 404	
 from django.views import generic
+from django.views.generic.detail import SingleObjectMixin
 from django.contrib.auth.models import Group, User
-from django.http import HttpResponseRedirect
+from django.http import HttpResponseRedirect, JsonResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.urls import reverse
-from .forms import SignUpForm, ReviewForm, BookForm, BookInstanceForm, CreateManagerForm
+from django.utils import timezone
+from django.utils.decorators import method_decorator
+from .forms import SignUpForm, ReviewForm, BookForm, BookInstanceForm, AddCopiesForm, ReturnCopiesForm, CreateManagerForm, LogFilterForm
+from .pagination import keyset_paginate, parse_cursor
+from . import audit, autocomplete, dashboard, facets, loans, search
+from .conditional import author_modified, book_modified, books_modified, conditional_page
+from .roles import MANAGER, ManagerRequiredMixin, AdministratorRequiredMixin, get_roles, manager_required, administrator_required
 
 def error_404_view(request, exception):
     return render(request,'404.html')
@@ -24,33 +31,10 @@ def error_404_view(request, exception):
 def index(request):
 	"""View function for home page of site."""
 	
-	books = Book.objects.all().order_by('-id')[:3]					# get only the 3 newest books
-	num_instances = BookInstance.objects.all().count()
-    
-    # Available books (status = 'a')
-	num_instances_available = BookInstance.objects.filter(status__exact='a').count()
-    
-    # The 'all()' is implied by default.    
-	num_books = Book.objects.count()
-	num_authors = Author.objects.count()
-    
-	# Number of visits to this view, as counted in the session variable.
-	num_visits = request.session.get('num_visits', 0)				# initial count will be 0
-	request.session['num_visits'] = num_visits + 1
-	
-	reviews = Review.objects.all().order_by('-id')[:3]				# get only the 3 latest book reviews
-	authors = Author.objects.all().order_by('-id')[:5]				# get only the 5 latest authors
+	context = dict(dashboard.get_dashboard())		# counts and newest books, reviews and authors, cached until the catalog changes
 	
-	context = {
-		'num_books': num_books,
-		'books': books,
-		'num_instances': num_instances,
-		'num_instances_available': num_instances_available,
-		'num_authors': num_authors,
-		'num_visits': num_visits,
-		'reviews': reviews,
-		'authors': authors,
-    }
+	# Number of visits to this view, as counted in the session variable.
+	context['num_visits'] = dashboard.count_visit(request)
 
     # Render the HTML template index.html with the data in the context variable
 	return render(request, 'index.html', context=context)
@@ -59,17 +43,34 @@ def index(request):
 	
 # For BookList page 
 #(using class ListView, because it has most of the needed functionalities and follows Django best-practice) 	
+@method_decorator(conditional_page(books_modified), name='dispatch')		# 304 when no book has changed (nor their copies, reviews, authors)
 class BookListView(generic.ListView):
 	paginate_by = 12
 	
 	def get_queryset(self):
-		queryset = Book.objects.all()
+		queryset = Book.objects.prefetch_related('author')		# one query for the authors of the whole page instead of one per card
 		if self.request.GET.get("q", None):
-			selection = self.request.GET.get("browse")
-			queryset = queryset.filter(Q(title__icontains=self.request.GET.get("q", None)))
-		return queryset
+			queryset = search.search_books(queryset, self.request.GET.get("q", None))		# ranked full-text search, best match first
+		self.selection = facets.parse_selection(self.request.GET)		# year, publisher, subject, author and availability filters
+		return facets.filter_books(queryset, self.selection)
+
+	def get_context_data(self, **kwargs):
+		context = super().get_context_data(**kwargs)
+		context['facets'] = facets.build_facets(self.request.GET, self.selection, self.request.GET.get("q", None))		# cached counts
+		query = self.request.GET.copy()
+		query.pop('page', None)
+		context['query_string'] = query.urlencode()		# kept by the page links
+		return context
+
+# For the search box suggestions (JSON), answered from the in-memory prefix index without touching the database
+def AutocompleteView(request):
+	urls = {autocomplete.BOOK: 'book-detail', autocomplete.AUTHOR: 'author-detail'}
+	results = autocomplete.lookup(request.GET.get("q", ""), limit=10)
+	return JsonResponse({'results': [{'type': kind, 'label': label, 'url': reverse(urls[kind], args=[object_id])}
+									 for kind, object_id, label in results]})
 
 # For BookDetails page	
+@method_decorator(conditional_page(book_modified), name='dispatch')		# 304 when the book, its authors, copies and reviews have not changed
 class BookDetailView(generic.DetailView):
 	model = Book
 	
@@ -78,16 +79,33 @@ class BookInstanceView(generic.ListView):
 	template_name = 'manager/bookinstance_list.html'
 	paginate_by = 10
 	
-	def get_queryset(self):
-		if not self.request.user.is_staff and not self.request.user.groups.filter(name='Manager').exists():
+	def dispatch(self, request, *args, **kwargs):
+		if not request.user.is_staff and MANAGER not in get_roles(request):		# any staff user or manager
 			raise Http404
-		else:
-			queryset = BookInstance.objects.all()
-			if self.request.GET.get("q", None):
-				selection = self.request.GET.get("browse")
-				queryset = queryset.filter(Q(book__title__icontains=self.request.GET.get("q", None)) |
-										   Q(id__icontains=self.request.GET.get("q", None)))
-			return queryset
+		return super().dispatch(request, *args, **kwargs)
+	
+	def get_queryset(self):
+		queryset = BookInstance.objects.select_related('book', 'borrower')		# book and borrower are shown on every row
+		if self.request.GET.get("q", None):
+			selection = self.request.GET.get("browse")
+			queryset = queryset.filter(Q(book__title__icontains=self.request.GET.get("q", None)) |
+									   Q(id__icontains=self.request.GET.get("q", None)))
+		return queryset
+	
+	def get_context_data(self, **kwargs):
+		context = super().get_context_data(**kwargs)
+		context['add_copies_form'] = AddCopiesForm()
+		return context
+	
+# For the loans past their due date
+class OverdueLoansView(ManagerRequiredMixin, generic.ListView):
+	model = BookInstance
+	template_name = 'manager/overdue_loans.html'
+	paginate_by = 20
+	
+	def get_queryset(self):
+		# filtered and ordered by the (status, due_back) index; id keeps the pages stable between equal due dates
+		return BookInstance.objects.overdue().select_related('book', 'borrower').order_by('due_back', 'id')
 	
 # For AuthorList page	
 class AuthorListView(generic.ListView):
@@ -95,8 +113,23 @@ class AuthorListView(generic.ListView):
 	paginate_by = 10
 	
 # For AuthorDetails page
-class AuthorDetailView(generic.DetailView):
-	model = Author	
+@method_decorator(conditional_page(author_modified), name='dispatch')		# 304 when the author and their books have not changed
+class AuthorDetailView(SingleObjectMixin, generic.ListView):
+	"""The author, with a page of their books (the copy counts come from the counters kept on Book)."""
+	template_name = 'catalog/author_detail.html'
+	paginate_by = 10
+
+	def get(self, request, *args, **kwargs):
+		self.object = self.get_object(queryset=Author.objects.all())
+		return super().get(request, *args, **kwargs)
+
+	def get_queryset(self):
+		return self.object.book_set.order_by('title', 'id')
+
+	def get_context_data(self, **kwargs):
+		context = super().get_context_data(**kwargs)
+		context['author'] = self.object
+		return context
 
 class LoanedBooksByUserListView(LoginRequiredMixin, generic.ListView):
 	"""Generic class-based view listing books on loan to current user."""
@@ -106,7 +139,7 @@ class LoanedBooksByUserListView(LoginRequiredMixin, generic.ListView):
 
 	def get_queryset(self):
 		if not self.request.user.is_staff:
-			return BookInstance.objects.filter(borrower=self.request.user).filter(status__exact='r').order_by('due_back')
+			return BookInstance.objects.filter(borrower=self.request.user).filter(status__exact='r').select_related('book').order_by('due_back')
 		else:
 			raise Http404
 
@@ -118,7 +151,7 @@ class ReviewsByUserListView(LoginRequiredMixin, generic.ListView):
 
 	def get_queryset(self):
 		if not self.request.user.is_staff:
-			return Review.objects.filter(user=self.request.user).order_by('date_published')
+			return Review.objects.filter(user=self.request.user).select_related('book').order_by('date_published')		# the book of every review is shown
 		else:
 			raise Http404	
 
@@ -143,14 +176,7 @@ def SignUpView(request):
 			LibraryMember.user_set.add(user)							# Library Members do not have any CRUD permissions 
 			user.save()
 			
-			LogEntry.objects.log_action(
-					user_id=user.id,
-					content_type_id=ContentType.objects.get_for_model(user).pk,
-					object_id=user.id,
-					object_repr=str(user.__str__()),
-					action_flag=ADDITION,
-					change_message= construct_change_message(form, None, True)			# Set to False when edited, set to True when added
-					)
+			audit.log_action(user.id, user, ADDITION, construct_change_message(form, None, True))		# Set to False when edited, set to True when added
 			
 			messages.success(request, "Account saved! Please login again to verify it is you!")
 
@@ -168,20 +194,12 @@ def BorrowBookView(request, pk):
 	
 	if request.method == 'POST':
 		if request.user.is_authenticated:
-		
-			book_instance.borrower = request.user
-			book_instance.due_back = datetime.date.today() + datetime.timedelta(weeks=3)	# set book borrow time to 3 weeks 
-			book_instance.status = 'r'
-			book_instance.save()
 			
-			LogEntry.objects.log_action(
-				user_id=request.user.id,
-				content_type_id=ContentType.objects.get_for_model(book_instance).pk,
-				object_id=book_instance.id,
-				object_repr=str(book_instance.__str__()),
-				action_flag=CHANGE,
-				change_message= '[{"changed": {"fields": ["Status", "Due back", "Borrower"]}}]'			# Set to False when edited, set to True when added
-				)
+			if not loans.borrow_copy(book_instance.pk, request.user):		# claimed with a single conditional UPDATE
+				messages.error(request, 'Sorry, this copy has just been borrowed by someone else.')
+				return redirect('book-detail', pk=book_instance.book_id)
+			
+			audit.log_action(request.user.id, book_instance, CHANGE, '[{"changed": {"fields": ["Status", "Due back", "Borrower"]}}]')
 			
 			messages.success(request, 'You have now borrowed this book!')
 			return HttpResponseRedirect(reverse('my-borrowed'))
@@ -194,6 +212,24 @@ def BorrowBookView(request, pk):
 
 	return render(request, 'catalog/book_detail.html', context)	# is ignored
 	
+# For Borrowing any available copy of a book
+def BorrowAnyCopyView(request, pk):
+	book = get_object_or_404(Book, pk=pk)
+	if request.user.is_staff or request.method != 'POST':
+		return redirect('404')
+	if not request.user.is_authenticated:
+		return redirect('login')
+	
+	copy_id = loans.borrow_any_copy(book.pk, request.user)
+	if copy_id is None:
+		messages.error(request, 'Sorry, there are no available copies of this book left.')
+		return redirect('book-detail', pk=book.pk)
+	
+	book_instance = BookInstance.objects.select_related('book').get(pk=copy_id)
+	audit.log_action(request.user.id, book_instance, CHANGE, '[{"changed": {"fields": ["Status", "Due back", "Borrower"]}}]')
+	
+	messages.success(request, 'You have now borrowed this book!')
+	return HttpResponseRedirect(reverse('my-borrowed'))
 
 # For Leaving Book Review
 @login_required
@@ -206,19 +242,13 @@ def ReviewBookView(request, pk):
 	if request.method == 'POST':
 		form = ReviewForm(request.POST)
 		if form.is_valid():
-			review = form.save()
+			review = form.save(commit=False)
 			review.book = book
 			review.user = request.user
-			review.save()
+			with transaction.atomic():		# the review and the review counter of the book change together
+				review.save()
 			
-			LogEntry.objects.log_action(
-				user_id=request.user.id,
-				content_type_id=ContentType.objects.get_for_model(review).pk,
-				object_id=review.id,
-				object_repr=str(review.__str__()),
-				action_flag=ADDITION,
-				change_message= construct_change_message(form, None, True)			# Set to False when edited, set to True when added
-				)
+			audit.log_action(request.user.id, review, ADDITION, construct_change_message(form, None, True))		# Set to False when edited, set to True when added
 			
 			messages.success(request, 'Your review has been posted to the website!')
 			return redirect('book-detail', pk=pk)		# return to the current book-detail page 
@@ -244,14 +274,7 @@ def ChangePasswordView(request):
 			user = form.save()
 			update_session_auth_hash(request, user)  # Important!
 			
-			LogEntry.objects.log_action(
-				user_id=request.user.id,
-				content_type_id=ContentType.objects.get_for_model(user).pk,
-				object_id=user.id,
-				object_repr=str(user.__str__()),
-				action_flag=CHANGE,
-				change_message= construct_change_message(form, None, False)			# Set to False when edited, set to True when added
-				)
+			audit.log_action(request.user.id, user, CHANGE, construct_change_message(form, None, False))		# Set to False when edited, set to True when added
 			
 			messages.success(request, 'Your password was successfully updated!')
 			return redirect('user-profile', username=user.username)
@@ -268,29 +291,19 @@ def ChangePasswordView(request):
 # Manager Side
 
 # For Delete Book
+@manager_required
 def DeleteBookView(request, book_id=None):
-	if request.user.is_staff and request.user.groups.filter(name='Manager').exists():
-		book_to_delete = Book.objects.get(id=book_id)
-		
-		LogEntry.objects.log_action(
-				user_id=request.user.id,
-				content_type_id=ContentType.objects.get_for_model(book_to_delete).pk,
-				object_id=book_to_delete.id,
-				object_repr=str(book_to_delete.__str__()),
-				action_flag=DELETION,
-				)
-		
-		book_to_delete.delete()
-		messages.success(request, 'The book copy has been deleted!')
-		return HttpResponseRedirect(reverse('books'))
-	else:
-		return redirect('404')
+	book_to_delete = Book.objects.get(id=book_id)
+	
+	audit.log_action(request.user.id, book_to_delete, DELETION)
+	
+	book_to_delete.delete()
+	messages.success(request, 'The book copy has been deleted!')
+	return HttpResponseRedirect(reverse('books'))
 		
 # For Add Book		
+@manager_required
 def AddBookView(request):
-	if not request.user.is_staff or not request.user.groups.filter(name='Manager').exists():
-		return redirect('404')
-
 	if request.method == "POST":
 		form = BookForm(request.POST, request.FILES)
 		if form.is_valid():
@@ -298,14 +311,7 @@ def AddBookView(request):
 			book.save()
 			form.save_m2m()
 			
-			LogEntry.objects.log_action(
-				user_id=request.user.id,
-				content_type_id=ContentType.objects.get_for_model(book).pk,
-				object_id=book.id,
-				object_repr=str(book.__str__()),
-				action_flag=ADDITION,
-				change_message= construct_change_message(form, None, True)			# Set to False when edited, set to True when added
-				)
+			audit.log_action(request.user.id, book, ADDITION, construct_change_message(form, None, True))		# Set to False when edited, set to True when added
 			
 			messages.success(request, 'You have now added this book to the library!')
 			return HttpResponseRedirect(reverse('books'))
@@ -314,24 +320,15 @@ def AddBookView(request):
 	return render(request, "manager/add_book.html", {"form": form})
 	
 # For Edit Book
+@manager_required
 def EditBookView(request, pk):
-	if not request.user.is_staff or not request.user.groups.filter(name='Manager').exists():
-		return redirect('404')
-
 	book = Book.objects.get(pk=pk)
 	if request.method == 'POST':
 		form = BookForm(request.POST, files=request.FILES, instance=book)
 		if form.is_valid():
 			book = form.save()
 			
-			LogEntry.objects.log_action(
-				user_id=request.user.id,
-				content_type_id=ContentType.objects.get_for_model(book).pk,
-				object_id=book.id,
-				object_repr=str(book.__str__()),
-				action_flag=CHANGE,
-				change_message= construct_change_message(form, None, False)			# Set to False when edited, set to True when added
-				)
+			audit.log_action(request.user.id, book, CHANGE, construct_change_message(form, None, False))		# Set to False when edited, set to True when added
 			
 			messages.success(request, 'Your edits to this book has been saved!')
 			return HttpResponseRedirect(reverse('books'))
@@ -342,43 +339,27 @@ def EditBookView(request, pk):
 	return render(request, "manager/edit_book.html", {'form':form, 'book':book})
 	
 # For Delete Book Instance / Copy
+@manager_required
 def DeleteBookInstanceView(request, copy_id=None):
-	if request.user.is_staff and request.user.groups.filter(name='Manager').exists():
-		copy_to_delete = BookInstance.objects.get(id=copy_id)
-		
-		LogEntry.objects.log_action(
-				user_id=request.user.id,
-				content_type_id=ContentType.objects.get_for_model(copy_to_delete).pk,
-				object_id=copy_to_delete.id,
-				object_repr=str(copy_to_delete.__str__()),
-				action_flag=DELETION,
-				)
-		
+	copy_to_delete = BookInstance.objects.get(id=copy_id)
+	
+	audit.log_action(request.user.id, copy_to_delete, DELETION)
+	
+	with transaction.atomic():
 		copy_to_delete.delete()
-		messages.success(request, 'The book copy has been deleted!')
-		return HttpResponseRedirect(reverse('book-copies'))
-	else:
-		return redirect('404')
+	messages.success(request, 'The book copy has been deleted!')
+	return HttpResponseRedirect(reverse('book-copies'))
 		
 # For Add Book Instance / Copy		
+@manager_required
 def AddBookInstanceView(request):
-	if not request.user.is_staff or not request.user.groups.filter(name='Manager').exists():
-		return redirect('404')
-
 	if request.method == "POST":
 		form = BookInstanceForm(request.POST)
 		if form.is_valid():
-			bookinstance = form.save()
-			bookinstance.save()
+			with transaction.atomic():
+				bookinstance = form.save()
 			
-			LogEntry.objects.log_action(
-				user_id=request.user.id,
-				content_type_id=ContentType.objects.get_for_model(bookinstance).pk,
-				object_id=bookinstance.id,
-				object_repr=str(bookinstance.__str__()),
-				action_flag=ADDITION,
-				change_message= construct_change_message(form, None, True)			# Set to False when edited, set to True when added
-				)
+			audit.log_action(request.user.id, bookinstance, ADDITION, construct_change_message(form, None, True))		# Set to False when edited, set to True when added
 			
 			messages.success(request, 'You have now added a copy for this book!')
 			return HttpResponseRedirect(reverse('book-copies'))
@@ -386,25 +367,51 @@ def AddBookInstanceView(request):
 		form = BookInstanceForm()
 	return render(request, "manager/add_book_instance.html", {"form": form})
 	
+# For adding many copies of a book at once (e.g. a new shipment)
+@manager_required
+def AddCopiesView(request):
+	if request.method != 'POST':
+		return HttpResponseRedirect(reverse('book-copies'))
+
+	form = AddCopiesForm(request.POST)
+	if form.is_valid():
+		book, count = form.cleaned_data['book'], form.cleaned_data['count']
+		copies = loans.add_copies(book.pk, count)		# one INSERT for all the copies
+		audit.log_bulk_action(request.user.id, BookInstance, ADDITION, '%d copies of %s' % (count, book.title),
+							  'Added copies: %s' % ', '.join(str(copy.pk) for copy in copies))
+		messages.success(request, 'You have now added %d copies of this book!' % count)
+	else:
+		messages.error(request, form.errors['book'][0] if 'book' in form.errors else 'Kindly enter a number of copies between 1 and 1000.')
+	return HttpResponseRedirect(reverse('book-copies'))
+
+# For marking the selected copies as returned / available
+@manager_required
+def ReturnCopiesView(request):
+	if request.method != 'POST':
+		return HttpResponseRedirect(reverse('book-copies'))
+
+	form = ReturnCopiesForm(request.POST)
+	if form.is_valid():
+		returned = loans.return_copies([copy.pk for copy in form.cleaned_data['copies']])		# one UPDATE for all the copies
+		if returned:
+			audit.log_bulk_action(request.user.id, BookInstance, CHANGE, '%d copies' % len(returned),
+								  'Marked returned: %s' % ', '.join(str(pk) for pk in returned))
+		messages.success(request, '%d copies have been marked as returned!' % len(returned))
+	else:
+		messages.error(request, 'Kindly select the copies to mark as returned.')
+	return HttpResponseRedirect(reverse('book-copies'))
+
 # For Edit Book Instance / Copy	
+@manager_required
 def EditBookInstanceView(request, pk):
-	if not request.user.is_staff or not request.user.groups.filter(name='Manager').exists():
-		return redirect('404')
-
 	copy = BookInstance.objects.get(pk=pk)
 	if request.method == 'POST':
 		form = BookInstanceForm(request.POST, instance=copy)
 		if form.is_valid():
-			bookinstance = form.save()
+			with transaction.atomic():
+				bookinstance = form.save()
 					
-			LogEntry.objects.log_action(
-				user_id=request.user.id,
-				content_type_id=ContentType.objects.get_for_model(bookinstance).pk,
-				object_id=bookinstance.id,
-				object_repr=str(bookinstance.__str__()),
-				action_flag=CHANGE,
-				change_message= construct_change_message(form, None, False)			# Set to False when edited, set to True when added
-				)
+			audit.log_action(request.user.id, bookinstance, CHANGE, construct_change_message(form, None, False))		# Set to False when edited, set to True when added
 			
 			messages.success(request, 'Your edits to this book copy has been saved!')
 			return HttpResponseRedirect(reverse('book-copies'))
@@ -419,36 +426,55 @@ def EditBookInstanceView(request, pk):
 # Administrator Side
 
 # For Admin Logs
+LOGS_PER_PAGE = 50
+
+def start_of_day(day):
+	"""Midnight at the start of day in the current time zone, so date filters can use the action_time index."""
+	return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+
+@administrator_required
 def SystemLogsView(request):
-	if not request.user.is_staff or not request.user.groups.filter(name='Administrator').exists():
-		return redirect('404')
 		
-	logs = LogEntry.objects.all().order_by("-id")
-	return render(request, "administrator/system_logs.html", {'logs': logs},)
+	logs = LogEntry.objects.select_related('user', 'content_type')		# user and content type are shown on every row
+	form = LogFilterForm(request.GET)
+	if form.is_valid():		# filters are backed by the indexes of migration 0016
+		if form.cleaned_data['action_flag']:
+			logs = logs.filter(action_flag=form.cleaned_data['action_flag'])
+		if form.cleaned_data['user']:
+			logs = logs.filter(user__username=form.cleaned_data['user'])
+		if form.cleaned_data['content_type']:
+			logs = logs.filter(content_type=form.cleaned_data['content_type'])
+		if form.cleaned_data['date_from']:
+			logs = logs.filter(action_time__gte=start_of_day(form.cleaned_data['date_from']))
+		if form.cleaned_data['date_to']:
+			logs = logs.filter(action_time__lt=start_of_day(form.cleaned_data['date_to'] + datetime.timedelta(days=1)))
+	
+	# keyset pagination on id: the next page starts below the last id shown, so deep pages are as fast as the first one
+	page = keyset_paginate(logs, LOGS_PER_PAGE, before=parse_cursor(request.GET.get('before')), after=parse_cursor(request.GET.get('after')))
+	filters = request.GET.copy()
+	filters.pop('before', None)
+	filters.pop('after', None)
+	return render(request, "administrator/system_logs.html", {'logs': page, 'form': form, 'filters': filters.urlencode()},)
 	
 # For Managers page
-class ManagerListView(generic.ListView):
+class ManagerListView(AdministratorRequiredMixin, generic.ListView):
 	queryset = User.objects.filter(groups__name__in=['Manager'])
 	template_name = 'administrator/manager_list.html'
 	paginate_by = 10
 	
 	def get_queryset(self):
-		if not self.request.user.is_staff or not self.request.user.groups.filter(name='Administrator').exists():
-			raise Http404
-		else:
-			queryset = User.objects.filter(groups__name__in=['Manager'])
-			if self.request.GET.get("q", None):
-				selection = self.request.GET.get("browse")
-				queryset = queryset.filter(Q(username__icontains=self.request.GET.get("q", None)) |
-										   Q(first_name__icontains=self.request.GET.get("q", None)) |
-										   Q(last_name__icontains=self.request.GET.get("q", None))
-										   )
-			return queryset
+		queryset = User.objects.filter(groups__name__in=['Manager'])
+		if self.request.GET.get("q", None):
+			selection = self.request.GET.get("browse")
+			queryset = queryset.filter(Q(username__icontains=self.request.GET.get("q", None)) |
+									   Q(first_name__icontains=self.request.GET.get("q", None)) |
+									   Q(last_name__icontains=self.request.GET.get("q", None))
+									   )
+		return queryset
 			
 # For Add Manager page (Same with signup but with different permissions)
+@administrator_required
 def AddManagerView(request):
-	if not request.user.is_staff or not request.user.groups.filter(name='Administrator').exists():
-		return redirect('404')
 	
 	form = CreateManagerForm(request.POST)
 	if form.is_valid():		
@@ -465,14 +491,7 @@ def AddManagerView(request):
 		
 		user.save()
 		
-		LogEntry.objects.log_action(
-				user_id=request.user.id,
-				content_type_id=ContentType.objects.get_for_model(user).pk,
-				object_id=user.id,
-				object_repr=str(user.__str__()),
-				action_flag=ADDITION,
-				change_message= construct_change_message(form, None, True)			# Set to False when edited, set to True when added
-				)
+		audit.log_action(request.user.id, user, ADDITION, construct_change_message(form, None, True))		# Set to False when edited, set to True when added
 		
 		messages.success(request, 'The new manager is now added to the system!')
 		
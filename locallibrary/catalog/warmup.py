@@ -0,0 +1,60 @@
+"""Work done once when a server process starts, so its first requests are not slower than the next ones.
+
+wsgi.py calls warm_up() when CATALOG_WARM_UP is set (as in locallibrary/settings_production.py). It compiles every
+template of the project (templates/ and catalog/templates/), which with the cached template loader keeps them parsed for
+the life of the process, and builds the autocomplete index (catalog/autocomplete.py).
+"""
+import logging
+import os
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.template import TemplateDoesNotExist, TemplateSyntaxError, engines
+
+from . import autocomplete
+
+logger = logging.getLogger(__name__)
+
+
+def template_dirs():
+	return [os.path.join(settings.BASE_DIR, 'templates'), os.path.join(apps.get_app_config('catalog').path, 'templates')]
+
+
+def template_names():
+	"""The names of the .html templates under template_dirs(), as passed to get_template()."""
+	names = set()
+	for directory in template_dirs():
+		for root, _, files in os.walk(directory):
+			for file_name in files:
+				if file_name.endswith('.html'):
+					names.add(os.path.relpath(os.path.join(root, file_name), directory).replace(os.sep, '/'))
+	return sorted(names)
+
+
+def compile_templates(engine=None):
+	"""Load (parse) every template with the engine (the project's by default). Returns {name: seconds} of those loaded.
+
+	A template that does not compile or that the engine does not find is logged and skipped, so that a bad template does
+	not stop the server from starting."""
+	engine = engine or engines['django'].engine
+	timings = {}
+	for name in template_names():
+		started = time.perf_counter()
+		try:
+			engine.get_template(name)
+		except TemplateSyntaxError:
+			logger.exception('Could not compile the template %s', name)
+			continue
+		except TemplateDoesNotExist:
+			logger.exception('Could not find the template %s', name)
+			continue
+		timings[name] = time.perf_counter() - started
+	return timings
+
+
+def warm_up():
+	started = time.perf_counter()
+	timings = compile_templates()
+	autocomplete.warm()
+	logger.info('Warmed up in %.2fs (%d templates compiled, autocomplete index built)', time.perf_counter() - started, len(timings))
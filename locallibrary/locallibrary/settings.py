@@ -47,6 +47,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',#Associates users with requests using sessions.
+    'catalog.roles.RolesMiddleware',  # request.roles: the user's groups, resolved once (CATALOG_ROLES_CACHE)
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 	'axes.middleware.AxesMiddleware',	# for login timeout 
@@ -69,6 +70,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'catalog.roles.context_processor',
             ],
         },
     },
@@ -88,6 +90,59 @@ DATABASES = {
 }
 
 
+# Cache (used for the homepage dashboard)
+# https://docs.djangoproject.com/en/3.0/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'locallibrary',
+    },
+    # login failures counted by catalog/lockouts.py; shared by the server processes in settings_production
+    'axes': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'axes',
+    },
+    # rendered book cards, copies and reviews (catalog/fragments.py), apart so they do not push the sessions out
+    'template_fragments': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'template_fragments',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+
+CATALOG_WARM_UP = False  # compile the templates and build the autocomplete index at process start (catalog/warmup.py)
+CATALOG_DASHBOARD_CACHE_TIMEOUT = 300  # 5 minutes; the dashboard is also dropped whenever the catalog changes
+CATALOG_FRAGMENT_CACHE_TIMEOUT = 86400  # 1 day; a change to the book, its copies or reviews gives the fragments new keys anyway
+CATALOG_NUM_VISITS_BATCH = 1  # save the homepage visit counter to the session every N visits (1 = every visit)
+
+# Cache alias of the version tokens that let the roles (groups) of a user be kept in their session (catalog/roles.py).
+# It has to be shared by every server process, or a revoked role would stay in force in the others; None looks the
+# roles up once per request. settings_production sets it.
+CATALOG_ROLES_CACHE = None
+
+# Cache alias of the version token of the autocomplete index of each process (catalog/autocomplete.py), shared by every
+# server process (settings_production sets it). None reads the version from the database on every lookup instead.
+CATALOG_AUTOCOMPLETE_CACHE = None
+
+# System logs (LogEntry) are written in the request, or queued and written in batches by a background thread when
+# CATALOG_AUDIT_LOG_ASYNC is on (as in settings_production; catalog/audit.py)
+CATALOG_AUDIT_LOG_ASYNC = False
+CATALOG_AUDIT_LOG_BATCH_SIZE = 100
+CATALOG_AUDIT_LOG_FLUSH_INTERVAL = 1.0  # seconds
+
+# Fine charged per day a loan is overdue, set by the process_overdue_loans command (run it daily, e.g. from cron)
+CATALOG_OVERDUE_FINE_PER_DAY = '5.00'
+
+# Server-Timing headers with the SQL, template, session, middleware and view time of every request, when the server is
+# started with CATALOG_PROFILING=1 in its environment (catalog/profiling.py). Off, nothing is added to MIDDLEWARE.
+CATALOG_PROFILING = os.environ.get('CATALOG_PROFILING') == '1'
+CATALOG_PROFILING_LOG_SAMPLE_RATE = 0.0  # fraction of the profiled requests also logged as JSON to 'catalog.profiling'
+if CATALOG_PROFILING:
+    from catalog.profiling import instrument
+    MIDDLEWARE = instrument(MIDDLEWARE)
+
+
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
 
@@ -126,6 +181,11 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 
+# collectstatic copies the files here with content-hashed names plus gzip/brotli copies; the WSGI application serves
+# them with far-future cache headers (catalog/staticfiles.py)
+STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
+STATICFILES_STORAGE = 'catalog.staticfiles.CompressedManifestStaticFilesStorage'
+
 # used for ImageField
 MEDIA_URL = "/media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media_cdn/')
@@ -143,6 +203,12 @@ SESSION_EXPIRE_AFTER_LAST_ACTIVITY = True
 SESSION_EXPIRE_AFTER_LAST_ACTIVITY_GRACE_PERIOD = 60 # group by minute
 SESSION_TIMEOUT_REDIRECT = '../timeout'
 
+# Sessions are kept in the database. catalog/sessions.py reads them from a cache instead and writes activity timestamps and
+# visit counts to the session table at most every CATALOG_SESSION_DB_WRITE_INTERVAL seconds, but only works with a cache
+# shared by every server process (SESSION_CACHE_ALIAS); settings_production turns it on with such a cache
+SESSION_ENGINE = 'django.contrib.sessions.backends.db'
+CATALOG_SESSION_DB_WRITE_INTERVAL = 300  # seconds
+
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 
 AUTHENTICATION_BACKENDS = [
@@ -160,6 +226,8 @@ AXES_FAILURE_LIMIT = 10
 AXES_LOCK_OUT_BY_COMBINATION_USER_AND_IP = True
 AXES_RESET_ON_SUCCESS = True
 AXES_LOCKOUT_TEMPLATE = '../templates/registration/lockout.html'
+AXES_HANDLER = 'catalog.lockouts.LockoutCacheHandler'  # failures counted in the cache, only lockouts saved
+AXES_CACHE = 'axes'
 
 
 # Send email for password reset feature
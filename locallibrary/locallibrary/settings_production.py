@@ -0,0 +1,77 @@
+"""
+Production settings for locallibrary: the development settings with debugging off, compiled templates kept in memory,
+a warm-up at process start, system logs written in the background, and sessions, roles and login failures kept in
+caches shared by the server processes.
+
+Use with DJANGO_SETTINGS_MODULE=locallibrary.settings_production (e.g. in the environment of the WSGI server).
+"""
+
+import os
+
+from .settings import *  # noqa: F401,F403
+
+DEBUG = False
+
+# Templates are read from disk and parsed once per process by the cached loader, instead of on every render (which
+# also parses base_generic.html, header.html and footer.html again for every page). Edits to templates need a restart.
+# With explicit loaders APP_DIRS has to be off; the app_directories loader finds catalog/templates instead.
+TEMPLATES = [
+    dict(
+        TEMPLATES[0],
+        APP_DIRS=False,
+        OPTIONS=dict(
+            TEMPLATES[0]['OPTIONS'],
+            loaders=[
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
+        ),
+    ),
+]
+
+# Compile every template and build the autocomplete index when wsgi.py loads (catalog/warmup.py), not on the first
+# requests. The bench_templates command shows the render times with and without the cached loader.
+CATALOG_WARM_UP = True
+
+# System log entries are written by a background thread in batches, off the request (catalog/audit.py)
+CATALOG_AUDIT_LOG_ASYNC = True
+
+# Sessions are read from a cache and their activity timestamps written to the database at most every
+# CATALOG_SESSION_DB_WRITE_INTERVAL seconds (catalog/sessions.py). The cache has to be shared by every server process, or
+# a logout in one process would not reach the others: a directory of files serves the processes of one host, with room
+# for every session so none is culled early. With several hosts, use memcached instead.
+CACHES = dict(CACHES, sessions={
+    'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+    'LOCATION': os.path.join(BASE_DIR, 'cache', 'sessions'),
+    'OPTIONS': {'MAX_ENTRIES': 100000},
+})
+SESSION_ENGINE = 'catalog.sessions'
+SESSION_CACHE_ALIAS = 'sessions'
+
+# Login failures are counted in the AXES_CACHE cache (catalog/lockouts.py). Each server process counting the failures it
+# sees on its own would let a client try AXES_FAILURE_LIMIT times per process, so the cache is shared, with room for a
+# burst of failing clients. With several hosts, use memcached instead.
+CACHES = dict(CACHES, axes={
+    'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+    'LOCATION': os.path.join(BASE_DIR, 'cache', 'axes'),
+    'OPTIONS': {'MAX_ENTRIES': 100000},
+})
+
+# The roles (groups) of a user are kept in their session, with version tokens in a cache shared by every server process
+# so that a revoked role is seen by all of them (catalog/roles.py). The tokens are few; one losing its file only makes
+# the sessions look the roles up again.
+CACHES = dict(CACHES, roles={
+    'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+    'LOCATION': os.path.join(BASE_DIR, 'cache', 'roles'),
+})
+CATALOG_ROLES_CACHE = 'roles'
+
+# A change to the catalog replaces a version token in a shared cache, so the other processes rebuild their autocomplete
+# index on their next lookup, and lookups need no query (catalog/autocomplete.py).
+CACHES = dict(CACHES, autocomplete={
+    'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+    'LOCATION': os.path.join(BASE_DIR, 'cache', 'autocomplete'),
+})
+CATALOG_AUTOCOMPLETE_CACHE = 'autocomplete'
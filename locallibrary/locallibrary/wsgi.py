@@ -14,3 +14,14 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'locallibrary.settings')
 
 application = get_wsgi_application()
+
+# Serve the collected static files (STATIC_ROOT) from this process, fingerprinted and precompressed
+from django.conf import settings
+from catalog.staticfiles import StaticFilesApplication
+
+application = StaticFilesApplication(application, settings.STATIC_ROOT, settings.STATIC_URL)
+
+# Compile the templates and build the in-memory indexes before the first request (on in settings_production)
+if getattr(settings, 'CATALOG_WARM_UP', False):
+    from catalog import warmup
+    warmup.warm_up()